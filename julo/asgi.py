@@ -0,0 +1,137 @@
+"""
+ASGI config for julo project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+run it with ``uvicorn julo.asgi:application``.
+
+Django 1.11 has no ASGI support, so every request runs the WSGI application
+in a bounded thread pool. The event loop keeps accepting connections while at
+most ASGI_THREADS requests wait on the database.
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "julo.settings")
+
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        # WSGI strings are latin-1, django decodes the path back as utf-8
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    # the whole body is read before the request runs, chunked ones included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class WsgiToAsgi:
+    """Runs a WSGI application for ASGI http requests, each request is run
+    start to end by one thread of the pool so it keeps the same database
+    connection, streamed bodies are sent chunk by chunk"""
+
+    def __init__(self, wsgi_application, max_threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"unsupported ASGI scope type '{scope['type']}'")
+
+        body = await self.read_body(receive)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.executor, self.run_wsgi, build_environ(scope, body), send, loop)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        body = BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return body.getvalue()
+
+    def run_wsgi(self, environ, send, loop):
+        def send_message(message):
+            # blocks this thread until the server took the message
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start.update({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers],
+            })
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    send_message(response_start)
+                    started = True
+                if chunk:
+                    send_message({'type': 'http.response.body', 'body': chunk,
+                                  'more_body': True})
+            if not started:
+                send_message(response_start)
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            # fires request_finished, which closes this thread's connection
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+
+
+application = WsgiToAsgi(get_wsgi_application(), settings.ASGI_THREADS)
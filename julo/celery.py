@@ -13,9 +13,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
 
-# Configure the broker and result backend using RabbitMQ
+# Configure the broker using RabbitMQ, the tasks are fire and forget and
+# store no results
 app.conf.broker_url = os.getenv("CELERY_BROKER_URL")
-app.conf.result_backend = 'rpc://'
 
 # Optional: Define a default queue for tasks
 app.conf.task_default_queue = 'default'
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 import os
 import sys
+import tempfile
 import colorlog
 
 from dotenv import load_dotenv
@@ -21,7 +22,30 @@ load_dotenv()
 ENV = os.getenv("ENV")
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
-CELERY_RESULT_BACKEND = 'rpc://'
+# nothing reads the task results
+CELERY_TASK_IGNORE_RESULT = True
+
+# variants are activated by a periodic sweep, so a variant becomes active
+# at most VARIANT_ACTIVATION_SWEEP_INTERVAL seconds after its active_time
+VARIANT_ACTIVATION_SWEEP_INTERVAL = int(
+    os.getenv("VARIANT_ACTIVATION_SWEEP_INTERVAL", 30))
+CELERY_BEAT_SCHEDULE = {
+    'sweep-variant-activations': {
+        'task': 'product_service.tasks.sweep_variant_activations',
+        'schedule': VARIANT_ACTIVATION_SWEEP_INTERVAL,
+    },
+    'relay-outbox': {
+        'task': 'product_service.tasks.relay_outbox',
+        'schedule': int(os.getenv("OUTBOX_RELAY_INTERVAL", 10)),
+    },
+}
+# outbox messages are published after the commit on a thread of their own,
+# those that fail are retried by the relay-outbox task with a delay doubling
+# up to OUTBOX_MAX_RETRY_DELAY seconds
+OUTBOX_RELAY_IN_BACKGROUND = os.getenv(
+    "OUTBOX_RELAY_IN_BACKGROUND", "true").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_MAX_RETRY_DELAY = int(os.getenv("OUTBOX_MAX_RETRY_DELAY", 300))
 
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -50,10 +74,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'product_service'
+    'product_service.apps.ProductServiceConfig'
 ]
 
 MIDDLEWARE = [
+    'product_service.middleware.RequestMetricsMiddleware',
+    'product_service.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,17 +113,34 @@ WSGI_APPLICATION = 'julo.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
-if 'test' in sys.argv:
+# postgresql connections one process keeps open, see product_service.db.pool
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 20))
+
+# DB_ENGINE=sqlite runs the management commands, e.g. benchmark, without
+# a postgresql server
+if 'test' in sys.argv or os.getenv("DB_ENGINE") == "sqlite":
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': 'test_product',
-        }
+            # a file, not the shared in-memory database, which fails
+            # concurrent writes with "database table is locked" instead of
+            # waiting for them
+            'TEST': {
+                'NAME': os.path.join(
+                    tempfile.gettempdir(), f'test_product_{os.getpid()}.sqlite3'),
+            },
+        },
+        # stands in for a replica, nothing is replicated to it
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'test_product_replica',
+        },
     }
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'product_service.db.postgresql',
             'NAME': os.getenv('DB_NAME'),
             'USER': os.getenv('DB_USER'),
             'PASSWORD': os.getenv('DB_PASSWORD'),
@@ -106,10 +149,51 @@ else:
             'OPTIONS': {
                 'options': '-c timezone=UTC',
             },
+            # connections go back to the pool at the end of every request
+            'CONN_MAX_AGE': 0,
+            'POOL': {
+                'MAX_SIZE': DB_POOL_MAX_SIZE,
+                'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            },
         }
     }
-
-CONN_MAX_AGE = 300
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            HOST=os.getenv('DB_REPLICA_HOST'),
+            PORT=os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT')))
+
+DATABASE_ROUTERS = ['product_service.routers.PrimaryReplicaRouter']
+# alias the list and retrieve actions read from, empty reads everything from
+# the primary
+DATABASE_REPLICA = 'replica' if os.getenv('DB_REPLICA_HOST') else ''
+# how long a client reads from the primary after a write, longer than the
+# replication lag
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DATABASE_REPLICA_STICKY_SECONDS', 10))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # local to the process unless PRODUCT_LIST_CACHE_BACKEND is memcached or
+    # redis, see PRODUCT_LIST_CACHE
+    'product_list': {
+        'BACKEND': os.getenv(
+            "PRODUCT_LIST_CACHE_BACKEND", 'product_service.cache.SizeBoundedLocMemCache'),
+        'LOCATION': os.getenv("PRODUCT_LIST_CACHE_LOCATION", 'product_list'),
+        'TIMEOUT': int(os.getenv("PRODUCT_LIST_CACHE_TIMEOUT", 300)),
+    },
+}
+# bytes of product list pages cached at once, evicted oldest first by the
+# local memory cache, a shared cache stops storing pages above it
+PRODUCT_LIST_CACHE_MAX_SIZE = int(
+    os.getenv("PRODUCT_LIST_CACHE_MAX_SIZE", 64 * 1024 * 1024))
+if CACHES['product_list']['BACKEND'] == 'product_service.cache.SizeBoundedLocMemCache':
+    CACHES['product_list']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv("PRODUCT_LIST_CACHE_MAX_ENTRIES", 1000)),
+        'MAX_SIZE': PRODUCT_LIST_CACHE_MAX_SIZE,
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -190,3 +274,77 @@ if ENV == "prod":
 
 PRODUCT_LIMIT_PER_PAGE = int(os.getenv("PRODUCT_LIMIT_PER_PAGE", 10))
 VARIANT_LIMIT_PER_PRODUCT = int(os.getenv("VARIANT_LIMIT_PER_PRODUCT", 2))
+PRODUCT_BULK_CREATE_LIMIT = int(os.getenv("PRODUCT_BULK_CREATE_LIMIT", 1000))
+VARIANT_BULK_CREATE_BATCH_SIZE = int(
+    os.getenv("VARIANT_BULK_CREATE_BATCH_SIZE", 1000))
+# rows of one PATCH /v1/variants/bulk/ and variants per UPDATE statement, a
+# CASE per field costs 2 parameters a variant, sqlite allows 999 by default
+VARIANT_BULK_UPDATE_LIMIT = int(os.getenv("VARIANT_BULK_UPDATE_LIMIT", 10000))
+VARIANT_BULK_UPDATE_BATCH_SIZE = int(
+    os.getenv("VARIANT_BULK_UPDATE_BATCH_SIZE", 100))
+# products and variants fetched per query by GET /v1/products/export/
+EXPORT_PRODUCT_CHUNK_SIZE = int(os.getenv("EXPORT_PRODUCT_CHUNK_SIZE", 500))
+EXPORT_VARIANT_CHUNK_SIZE = int(os.getenv("EXPORT_VARIANT_CHUNK_SIZE", 5000))
+# requests run at the same time by julo.asgi, each one holds a database
+# connection so it defaults to the pool size, more threads would only wait
+# for a connection
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", DB_POOL_MAX_SIZE))
+# items of one POST /v1/stock/reserve/
+STOCK_RESERVATION_MAX_ITEMS = int(os.getenv("STOCK_RESERVATION_MAX_ITEMS", 100))
+# in-process Bloom filter of the product names, product creates only look
+# up the names it may have instead of relying on the unique constraint alone
+PRODUCT_NAME_FILTER = os.getenv("PRODUCT_NAME_FILTER", "false").lower() == "true"
+PRODUCT_NAME_FILTER_ERROR_RATE = float(
+    os.getenv("PRODUCT_NAME_FILTER_ERROR_RATE", 0.01))
+# admin changelists count exactly up to this many rows, above it they show
+# the postgresql planner estimate
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 10000))
+# variants shown per page inline on the admin product page
+ADMIN_INLINE_VARIANTS = int(os.getenv("ADMIN_INLINE_VARIANTS", 20))
+# words of a product search that are used, the rest is ignored
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", 8))
+# products inserted per transaction by the import_products command
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+# per request metrics of the /v1/ routes, see product_service.middleware. Off
+# by default, django 1.11 has no execute_wrapper so the queries are timed with
+# the debug cursor, which logs every query of the request
+REQUEST_METRICS_ENABLED = os.getenv(
+    "REQUEST_METRICS_ENABLED", "false").lower() == "true"
+# a query repeated this many times in one request is logged as a N+1
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv("REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", 10))
+
+# content codings offered to clients in order of preference, br needs the
+# brotli package, empty disables compression
+RESPONSE_COMPRESSION = [
+    coding.strip() for coding in
+    os.getenv("RESPONSE_COMPRESSION", "br,gzip").split(",") if coding.strip()]
+# smaller responses are not worth compressing
+RESPONSE_COMPRESSION_MIN_SIZE = int(
+    os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 512))
+# serve the product list from the ProductSummary table, run the
+# rebuild_product_summaries command before turning it on
+PRODUCT_LIST_SUMMARY = os.getenv(
+    "PRODUCT_LIST_SUMMARY", "false").lower() == "true"
+# render the product list from .values() rows with fast_serializers
+PRODUCT_LIST_FAST_SERIALIZER = os.getenv(
+    "PRODUCT_LIST_FAST_SERIALIZER", "false").lower() == "true"
+
+# Cache-Control of the product routes per viewset action, e.g. "public,
+# max-age=30", "no-cache" makes clients and CDNs revalidate with the ETag
+PRODUCT_CACHE_CONTROL = {
+    'list': os.getenv("PRODUCT_LIST_CACHE_CONTROL", "no-cache"),
+    'retrieve': os.getenv("PRODUCT_DETAIL_CACHE_CONTROL", "no-cache"),
+}
+# cache alias for GET /v1/products/ responses, empty string disables it. The
+# pages are keyed on the catalog version, a local memory cache is never stale
+# but every process keeps its own, the system checks warn about it
+PRODUCT_LIST_CACHE = os.getenv("PRODUCT_LIST_CACHE", "")
+PRODUCT_LIST_CACHE_MAX_ENTRY_SIZE = int(
+    os.getenv("PRODUCT_LIST_CACHE_MAX_ENTRY_SIZE", 1024 * 1024))
+if 'test' in sys.argv:
+    PRODUCT_LIST_CACHE = ''
+    # relay in the test's thread, right after the commit
+    OUTBOX_RELAY_IN_BACKGROUND = False
+    # the tests write products with the ORM, which skips the summaries
+    PRODUCT_LIST_SUMMARY = False
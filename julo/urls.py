@@ -16,13 +16,22 @@ Including another URLconf
 from django.conf.urls import url, include
 from django.contrib import admin
 from rest_framework.routers import DefaultRouter
-from product_service.views import ProductViewSet
+from product_service.views import (
+    ProductViewSet,
+    bulk_update_variants,
+    metrics,
+    release,
+    reserve)
 
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, base_name='product_service')
 
 urlpatterns = [
+    url(r'^v1/metrics/$', metrics, name='metrics'),
+    url(r'^v1/stock/reserve/$', reserve, name='stock-reserve'),
+    url(r'^v1/stock/release/$', release, name='stock-release'),
+    url(r'^v1/variants/bulk/$', bulk_update_variants, name='variant-bulk-update'),
     url(r'^v1/', include(router.urls)),
     url(r'^admin/', admin.site.urls),
 ]
@@ -1,3 +1,217 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.forms.models import BaseInlineFormSet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .catalog import bump_catalog_version
+from .models import PendingActivation, Product, Variant
+from .summaries import refresh_product_summaries, summary_product_ids
+
+# query parameters of the keyset pages and of the inline variant pages
+AFTER_VAR = 'after'
+VARIANTS_PAGE_VAR = 'variants_page'
+
+
+def refresh_products(product_ids):
+    # in the transaction of the admin view or of the action
+    refresh_product_summaries(product_ids)
+    bump_catalog_version()
+
+
+def estimated_count(queryset):
+    """row count the postgresql planner expects for queryset, from the table
+    statistics instead of a COUNT(*) over millions of rows"""
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """exact counts up to ADMIN_EXACT_COUNT_LIMIT rows, the planner estimate
+    above it on postgresql"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimated_count(queryset)
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """in the default newest first order the pages are `?after=<pk>`, found
+    on the primary key index instead of an OFFSET through the skipped rows.
+    The other orders are paged by number"""
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.after = int(request.GET[AFTER_VAR])
+        except (KeyError, ValueError):
+            self.after = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(AFTER_VAR, None)
+        return params
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.keyset:
+            return
+        queryset = self.queryset
+        if self.after is not None:
+            queryset = queryset.filter(pk__lt=self.after)
+        self.result_list = list(queryset[:self.list_per_page])
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[AFTER_VAR, PAGE_VAR])
+
+    def next_page_url(self):
+        if len(self.result_list) < self.list_per_page:
+            return None
+        return self.get_query_string(
+            {AFTER_VAR: self.result_list[-1].pk}, remove=[PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    ordering = ('-pk',)
+    paginator = EstimatedCountPaginator
+    # no second COUNT(*) of the whole table next to the filtered one
+    show_full_result_count = False
+    change_list_template = 'admin/product_service/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class VariantPageFormSet(BaseInlineFormSet):
+    # set on the class built for every request, see VariantInline.get_formset
+    page = 1
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            per_page = settings.ADMIN_INLINE_VARIANTS
+            start = (self.page - 1) * per_page
+            self._queryset = super().get_queryset()[start:start + per_page]
+        return self._queryset
+
+
+def variants_page(request):
+    try:
+        return max(int(request.GET.get(VARIANTS_PAGE_VAR, 1)), 1)
+    except ValueError:
+        return 1
+
+
+class VariantInline(admin.TabularInline):
+    model = Variant
+    formset = VariantPageFormSet
+    fields = ('name', 'height', 'stock', 'price', 'weight', 'active_time', 'is_active')
+    extra = 0
+    show_change_link = True
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page = variants_page(request)
+        return formset
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    inlines = [VariantInline]
+    list_display = ('id', 'name', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    change_form_template = 'admin/product_service/product/change_form.html'
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = dict(extra_context or {})
+        if object_id and object_id.isdigit():
+            page = variants_page(request)
+            per_page = settings.ADMIN_INLINE_VARIANTS
+            n_variant = Variant.objects.filter(product_id=object_id).count()
+            extra_context['variant_pages'] = {
+                'first': (page - 1) * per_page + 1,
+                'last': min(page * per_page, n_variant),
+                'count': n_variant,
+                'previous': page - 1 if page > 1 else None,
+                'next': page + 1 if page * per_page < n_variant else None,
+                'var': VARIANTS_PAGE_VAR,
+            }
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    def save_related(self, request, form, formsets, change):
+        # the inline variants are saved here, after the product itself
+        super().save_related(request, form, formsets, change)
+        refresh_products([form.instance.id])
+
+    def delete_model(self, request, obj):
+        # the summary is deleted with the product
+        super().delete_model(request, obj)
+        bump_catalog_version()
+
+
+@admin.register(Variant)
+class VariantAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'product', 'price', 'stock', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    list_select_related = ('product',)
+    raw_id_fields = ('product',)
+    actions = ['activate_variants', 'deactivate_variants']
+
+    def get_actions(self, request):
+        # deleting a queryset would skip the summary refresh
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def set_active(self, queryset, is_active):
+        # one UPDATE of the selected variants, also when every variant of
+        # the changelist is selected
+        with transaction.atomic():
+            product_ids = summary_product_ids(queryset)
+            # the state set here wins over a scheduled activation, deleted
+            # first as the queryset may filter on is_active
+            PendingActivation.objects.filter(variant__in=queryset.values('pk')).delete()
+            n_updated = queryset.update(is_active=is_active, updated_at=timezone.now())
+            refresh_products(product_ids)
+        return n_updated
+
+    def activate_variants(self, request, queryset):
+        n_updated = self.set_active(queryset, True)
+        self.message_user(request, f"{n_updated} variants activated")
+    activate_variants.short_description = "Activate selected variants"
+
+    def deactivate_variants(self, request, queryset):
+        n_updated = self.set_active(queryset, False)
+        self.message_user(request, f"{n_updated} variants deactivated")
+    deactivate_variants.short_description = "Deactivate selected variants"
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        product_ids = [form.instance.product_id]
+        if form.initial.get('product'):
+            # the variant may have been moved from another product
+            product_ids.append(form.initial['product'])
+        refresh_products(product_ids)
 
-# Register your models here.
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_products([obj.product_id])
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ProductServiceConfig(AppConfig):
     name = 'product_service'
+
+    def ready(self):
+        from .cache import check_list_cache
+        checks.register(check_list_cache, checks.Tags.caches)
@@ -0,0 +1,460 @@
+import json
+import socket
+import socketserver
+import threading
+import time
+import timeit
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+import uvicorn
+
+from django.conf import settings
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from julo.asgi import WsgiToAsgi
+
+from .fast_serializers import PRODUCT_VALUES, serialize_products
+from .middleware import COMPRESSORS
+from .models import Product, Variant
+from .paginations import CustomPagination
+from .renderers import FastJSONRenderer, MessagePackRenderer, msgpack
+from .serializers import ProductLimitVariantsSerializer
+from .summaries import rebuild_product_summaries
+from .timezones import to_indonesia_timezone, to_indonesia_timezone_many
+from .views import ProductViewSet, bulk_update_variants
+
+SEED_PREFIX = 'benchmark product'
+
+
+def seed_catalog(n_product, n_variant, prefix=SEED_PREFIX):
+    now = timezone.now()
+    products = Product.objects.bulk_create([
+        Product(name=f'{prefix} {i}', description='description')
+        for i in range(n_product)
+    ])
+    if products and products[0].id is None:
+        products = Product.objects.filter(name__startswith=f'{prefix} ')
+
+    variants = []
+    for product in products:
+        variants.extend(
+            Variant(product=product, name=f'variant {j}', height='10.50',
+                    stock=100, price='15000.99', weight='0.75', active_time=now)
+            for j in range(n_variant))
+        if len(variants) >= settings.VARIANT_BULK_CREATE_BATCH_SIZE:
+            Variant.objects.bulk_create(variants)
+            variants = []
+    Variant.objects.bulk_create(variants)
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def cursor_at_depth(depth):
+    """cursor query parameter of the page `depth` pages after the first one"""
+    if depth == 0:
+        return {}
+    ordering = CustomPagination.ordering
+    position = Product.objects.order_by(*ordering).values_list(
+        'created_at', flat=True)[depth * CustomPagination.page_size - 1]
+    querystring = urlencode({'p': str(position)})
+    return {'cursor': b64encode(querystring.encode('ascii')).decode('ascii')}
+
+
+def run_request(view, request):
+    with CaptureQueriesContext(connection) as queries:
+        response = view(request())
+    assert response.status_code < 300, response.data
+    return len(queries)
+
+
+def request_factory():
+    # 'testserver' is not in ALLOWED_HOSTS outside the test runner
+    return APIRequestFactory(HTTP_HOST='localhost')
+
+
+def bench_list(depths, variant_limits, repeat, fast=False, summary=False):
+    factory = request_factory()
+    view = ProductViewSet.as_view({'get': 'list'})
+    results = {}
+    for variant_limit in variant_limits:
+        if summary:
+            # the summaries hold the first variant_limit variants
+            with override_settings(VARIANT_LIMIT_PER_PRODUCT=variant_limit):
+                rebuild_product_summaries()
+        for depth in depths:
+            params = cursor_at_depth(depth)
+
+            def request():
+                return factory.get('/v1/products/', params)
+
+            with override_settings(PRODUCT_LIST_CACHE='',
+                                   PRODUCT_LIST_FAST_SERIALIZER=fast,
+                                   PRODUCT_LIST_SUMMARY=summary,
+                                   VARIANT_LIMIT_PER_PRODUCT=variant_limit):
+                n_query = run_request(view, request)
+                seconds = best_of(lambda: view(request()), repeat)
+
+            name = 'list_summary' if summary else 'list_fast' if fast else 'list'
+            results[f'{name}.depth={depth}.variant_limit={variant_limit}'] = {
+                'ms': seconds * 1000, 'queries': n_query}
+    return results
+
+
+def bench_search(queries, repeat):
+    """first page of a product search, through the view like bench_list"""
+    factory = request_factory()
+    view = ProductViewSet.as_view({'get': 'list'})
+    results = {}
+    for query in queries:
+        def request():
+            return factory.get('/v1/products/', {'search': query})
+
+        with override_settings(PRODUCT_LIST_CACHE=''):
+            n_query = run_request(view, request)
+            seconds = best_of(lambda: view(request()), repeat)
+        results[f"search.{query.replace(' ', '_')}"] = {
+            'ms': seconds * 1000, 'queries': n_query}
+    return results
+
+
+def bench_create(variant_counts, n_product, repeat):
+    factory = request_factory()
+    view = ProductViewSet.as_view({'post': 'create'})
+    results = {}
+    for n_variant in variant_counts:
+        counter = iter(range(n_product * (repeat + 1)))
+
+        def request():
+            data = {
+                "name": f'{SEED_PREFIX} create {n_variant}-{next(counter)}',
+                "description": "description",
+                "variants": [{
+                    "name": f'variant {j}',
+                    "height": 10.5,
+                    "stock": 100,
+                    "price": 15000.99,
+                    "weight": 0.75,
+                    "active_time": "2023-08-16T12:00:00Z"
+                } for j in range(n_variant)]
+            }
+            return factory.post('/v1/products/', json.dumps(data),
+                                content_type='application/json')
+
+        n_query = run_request(view, request)
+
+        def create_products():
+            for _ in range(n_product):
+                view(request())
+
+        seconds = best_of(create_products, repeat)
+        results[f'create.variants={n_variant}'] = {
+            'ms': seconds / n_product * 1000,
+            'products_per_second': n_product / seconds,
+            'queries': n_query}
+    return results
+
+
+def bench_bulk_update(row_counts, repeat, variants_per_product=100):
+    """PATCH /v1/variants/bulk/ of the price and stock of row_counts
+    variants named by product and variant, on a catalog of its own"""
+    n_variant = max(row_counts, default=0)
+    prefix = f'{SEED_PREFIX} bulk'
+    n_product = -(-n_variant // variants_per_product)
+    seed_catalog(n_product, variants_per_product, prefix=prefix)
+    names = [(f'{prefix} {i}', f'variant {j}')
+             for i in range(n_product) for j in range(variants_per_product)]
+
+    factory = request_factory()
+    results = {}
+    for n_row in row_counts:
+        stocks = iter(range(repeat + 1))
+
+        def request():
+            stock = next(stocks)
+            data = [{"product": product, "variant": variant,
+                     "price": 15000 + stock, "stock": stock}
+                    for product, variant in names[:n_row]]
+            return factory.patch('/v1/variants/bulk/', json.dumps(data),
+                                 content_type='application/json')
+
+        with override_settings(VARIANT_BULK_UPDATE_LIMIT=n_row):
+            n_query = run_request(bulk_update_variants, request)
+            # the request bodies are built outside of the timing
+            requests = [request() for _ in range(repeat)]
+            seconds = best_of(lambda: bulk_update_variants(requests.pop()), repeat)
+        results[f'bulk_update.rows={n_row}'] = {
+            'ms': seconds * 1000,
+            'rows_per_second': n_row / seconds,
+            'queries': n_query}
+    return results
+
+
+def bench_serializers(repeat):
+    limit = settings.VARIANT_LIMIT_PER_PRODUCT
+    ordering = CustomPagination.ordering
+    products = Product.objects.filter(name__startswith=f'{SEED_PREFIX} ')
+    n_product = products.count()
+
+    prefetched = products.prefetch_related(Prefetch(
+        'variants', queryset=Variant.objects.limit_per_product(limit))
+    ).order_by(*ordering)
+    rows = products.order_by(*ordering).values(*PRODUCT_VALUES)
+
+    def drf():
+        return ProductLimitVariantsSerializer(prefetched.all(), many=True).data
+
+    def fast():
+        return serialize_products(list(rows.all()), limit)
+
+    return {
+        'serializer.drf': {'us_per_product': best_of(drf, repeat) / n_product * 1e6},
+        'serializer.fast': {'us_per_product': best_of(fast, repeat) / n_product * 1e6},
+    }
+
+
+def bench_timezones(n_variant, repeat):
+    # with microseconds, the rendered string always matches the format
+    started_at = timezone.now().replace(microsecond=1)
+    values = [started_at + timedelta(seconds=i) for i in range(n_variant)]
+    field = serializers.DateTimeField()
+
+    def from_string():
+        # the conversion before the timezones module: parse the rendered ISO
+        # string back, with a new fixed timezone on every call
+        for value in values:
+            tz = timezone.get_fixed_timezone(7 * 60)
+            datetime.strptime(field.to_representation(value),
+                              '%Y-%m-%dT%H:%M:%S.%f%z').astimezone(tz)
+
+    def per_value():
+        for value in values:
+            to_indonesia_timezone(value)
+
+    def many():
+        to_indonesia_timezone_many([{'created_at': value} for value in values])
+
+    return {
+        f'timezone.{name}': {'us_per_variant': best_of(func, repeat) / n_variant * 1e6}
+        for name, func in (('from_string', from_string),
+                           ('per_value', per_value),
+                           ('many', many))
+    }
+
+
+def product_page(n_product, n_variant):
+    """list response data of n_product products, like the serializers build"""
+    created_at = to_indonesia_timezone(timezone.now())
+    variants = [
+        {'name': f'variant {j}', 'height': 10.5, 'stock': 100, 'price': 15000,
+         'weight': 0.75, 'created_at': created_at, 'is_active': True}
+        for j in range(n_variant)
+    ]
+    return {
+        'next': 'http://localhost/v1/products/?cursor=cD0yMDIzLTA4LTAx',
+        'previous': None,
+        'results': [
+            {'name': f'{SEED_PREFIX} {i}', 'description': 'description',
+             'variants': variants, 'is_active': True}
+            for i in range(n_product)
+        ],
+    }
+
+
+def bench_renderers(page_sizes, repeat):
+    """render time and size of list pages in every format, and the size
+    after every content coding"""
+    renderers = {'json': JSONRenderer(), 'fast_json': FastJSONRenderer()}
+    if msgpack is not None:
+        renderers['msgpack'] = MessagePackRenderer()
+
+    results = {}
+    for n_product in page_sizes:
+        data = product_page(n_product, settings.VARIANT_LIMIT_PER_PRODUCT)
+        for name, renderer in renderers.items():
+            content = renderer.render(data)
+            results[f'render.{name}.products={n_product}'] = {
+                'ms': best_of(lambda: renderer.render(data), repeat) * 1000,
+                'bytes': len(content)}
+
+        content = renderers['fast_json'].render(data)
+        for coding, compress in COMPRESSORS.items():
+            results[f'compress.{coding}.products={n_product}'] = {
+                'ms': best_of(lambda: compress(content), repeat) * 1000,
+                'bytes': len(compress(content))}
+    return results
+
+
+def slow_application(application, io_wait):
+    """application that first waits io_wait seconds without holding the
+    GIL, like a request waiting on a slow postgresql query"""
+    def wrapped(environ, start_response):
+        time.sleep(io_wait)
+        return application(environ, start_response)
+    return wrapped
+
+
+class ThreadedWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    # what `runserver` serves with, its --nothreading is off by default
+    daemon_threads = True
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_wsgi(application):
+    """the threaded server of `runserver`, a thread per connection, on a
+    free port of 127.0.0.1"""
+    httpd = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler)
+    httpd.set_app(application)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    try:
+        yield httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        thread.join()
+
+
+@contextmanager
+def serve_asgi(application):
+    """uvicorn, like the app-asgi service, on a free port of 127.0.0.1"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(
+        application, lifespan='off', log_level='warning', access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]})
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.01)
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+def get_product_list(port):
+    # a connection per request, runserver closes it after every response
+    client = HTTPConnection('127.0.0.1', port)
+    try:
+        client.request('GET', '/v1/products/', headers={'Host': 'localhost'})
+        response = client.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+    finally:
+        client.close()
+
+
+def requests_per_second(port, concurrency, n_request):
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(lambda _: get_product_list(port), range(n_request)))
+    return n_request / (time.perf_counter() - started_at)
+
+
+def bench_concurrency(concurrency_levels, n_request, io_wait, asgi_threads=None):
+    """throughput of n_request product list requests sent over HTTP by
+    `concurrency` clients at once, to the threaded `runserver` server of
+    docker-compose and to julo.asgi under uvicorn. runserver runs every
+    connection at once, julo.asgi at most asgi_threads of them, the names of
+    the results have the requests that could run at once"""
+    asgi_threads = asgi_threads or settings.ASGI_THREADS
+    wsgi_application = slow_application(get_wsgi_application(), io_wait)
+    asgi_application = WsgiToAsgi(wsgi_application, asgi_threads)
+
+    results = {}
+    try:
+        with serve_wsgi(wsgi_application) as wsgi_port, \
+                serve_asgi(asgi_application) as asgi_port:
+            for concurrency in concurrency_levels:
+                results[f'concurrency.wsgi.clients={concurrency}.threads={concurrency}'] = {
+                    'requests_per_second': requests_per_second(
+                        wsgi_port, concurrency, n_request)}
+                threads = min(concurrency, asgi_threads)
+                results[f'concurrency.asgi.clients={concurrency}.threads={threads}'] = {
+                    'requests_per_second': requests_per_second(
+                        asgi_port, concurrency, n_request)}
+    finally:
+        asgi_application.executor.shutdown()
+    return results
+
+
+def run_suite(n_product=1000, n_variant=5, depths=(0, 10, 50),
+              variant_limits=(2, 10), create_variant_counts=(1, 10, 1000),
+              n_create=5, repeat=5, concurrency_levels=(1, 10, 50),
+              n_concurrent_request=200, io_wait=0.02, render_page_sizes=(10, 1000),
+              search_queries=('benchmark product 1', 'variant'),
+              bulk_update_row_counts=(1000, 10000, 100000)):
+    seed_catalog(n_product, n_variant)
+    depths = [depth for depth in depths
+              if depth * CustomPagination.page_size < n_product]
+
+    results = {}
+    results.update(bench_list(depths, variant_limits, repeat))
+    results.update(bench_list(depths, variant_limits, repeat, fast=True))
+    results.update(bench_list(depths, variant_limits, repeat, summary=True))
+    results.update(bench_search(search_queries, repeat))
+    results.update(bench_serializers(repeat))
+    results.update(bench_timezones(n_product * n_variant, repeat))
+    results.update(bench_renderers(render_page_sizes, repeat))
+    results.update(bench_create(create_variant_counts, n_create, repeat))
+    results.update(bench_concurrency(
+        concurrency_levels, n_concurrent_request, io_wait))
+    # last, it seeds products of its own
+    results.update(bench_bulk_update(bulk_update_row_counts, repeat))
+    return {
+        'meta': {
+            'vendor': connection.vendor,
+            'products': n_product,
+            'variants_per_product': n_variant,
+            'page_size': CustomPagination.page_size,
+            'io_wait_ms': io_wait * 1000,
+            'asgi_threads': settings.ASGI_THREADS,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """regressions of results against baseline, timings may be up to
+    `tolerance` (0.25 is 25%) slower, query counts may not grow at all"""
+    regressions = []
+    for name, baseline_metrics in baseline['results'].items():
+        metrics = results['results'].get(name)
+        if metrics is None:
+            continue
+        for metric, baseline_value in baseline_metrics.items():
+            value = metrics.get(metric)
+            if value is None:
+                continue
+            if metric == 'queries':
+                regressed = value > baseline_value
+            elif metric.endswith('_per_second'):
+                regressed = value < baseline_value * (1 - tolerance)
+            else:
+                regressed = value > baseline_value * (1 + tolerance)
+            if regressed:
+                regressions.append(
+                    f'{name} {metric}: {value:.2f} (baseline {baseline_value:.2f})')
+    return regressions
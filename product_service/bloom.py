@@ -0,0 +1,86 @@
+import math
+import threading
+from hashlib import blake2b
+
+from django.conf import settings
+
+from .models import Product
+
+_name_filter = None
+_name_filter_lock = threading.Lock()
+
+
+class BloomFilter:
+    """set of strings answering "maybe" or "surely not" in about 10 bits an
+    item for a 1% error rate, items can not be removed"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.n_bit = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.n_hash = max(round(self.n_bit / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.n_bit + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing, the k positions come from two 64 bit hashes
+        digest = blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.n_bit for i in range(self.n_hash))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+def build_name_filter():
+    # room for the catalog to double before it's rebuilt
+    capacity = max(Product.objects.count() * 2, 1024)
+    name_filter = BloomFilter(capacity, settings.PRODUCT_NAME_FILTER_ERROR_RATE)
+    for name in Product.objects.values_list('name', flat=True).iterator():
+        name_filter.add(name)
+    return name_filter
+
+
+def _get_name_filter():
+    global _name_filter
+    with _name_filter_lock:
+        if _name_filter is None or _name_filter.full:
+            _name_filter = build_name_filter()
+        return _name_filter
+
+
+def names_maybe_taken(names):
+    """the names of names that may belong to a product, only those need a
+    SELECT. All of them when PRODUCT_NAME_FILTER is off"""
+    if not settings.PRODUCT_NAME_FILTER:
+        return list(names)
+    name_filter = _get_name_filter()
+    return [name for name in names if name in name_filter]
+
+
+def remember_product_names(names):
+    """add the names of created products, the other processes learn them
+    when they rebuild their filter"""
+    with _name_filter_lock:
+        if _name_filter is None:
+            return
+        for name in names:
+            _name_filter.add(name)
+
+
+def forget_product_names():
+    """rebuild the filter on its next use, e.g. after a product created by
+    another process was not in it"""
+    global _name_filter
+    with _name_filter_lock:
+        _name_filter = None
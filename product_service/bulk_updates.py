@@ -0,0 +1,143 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import PendingActivation, Variant
+from .summaries import refresh_product_summaries
+
+UPDATE_FIELDS = ('price', 'stock', 'weight', 'is_active')
+
+
+class InvalidRows(Exception):
+    """`errors` has an error dict per row, empty for the valid ones"""
+
+    def __init__(self, errors):
+        super().__init__('invalid rows')
+        self.errors = errors
+
+
+def _batches(items, size=None):
+    size = size or settings.VARIANT_BULK_UPDATE_BATCH_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def row_key(row):
+    if 'id' in row:
+        return row['id']
+    return row['product'], row['variant']
+
+
+def find_variants(rows):
+    """{row_key: (variant_id, product_id)} of the rows whose variant exists,
+    one query per batch of ids and per batch of names"""
+    ids = [row['id'] for row in rows if 'id' in row]
+    names = [(row['product'], row['variant']) for row in rows if 'id' not in row]
+
+    found = {}
+    for batch in _batches(ids):
+        for variant_id, product_id in Variant.objects.filter(
+                id__in=batch).values_list('id', 'product_id'):
+            found[variant_id] = variant_id, product_id
+    for batch in _batches(names):
+        # the exact pairs, like stock.resolve_variants, two IN lists would
+        # match every product and variant name combination of the batch
+        rows = Variant.objects.filter(reduce(or_, (
+            Q(product__name=product, name=variant) for product, variant in set(batch)))
+        ).values_list('product__name', 'name', 'id', 'product_id')
+        for product, variant, variant_id, product_id in rows:
+            found[product, variant] = variant_id, product_id
+    return found
+
+
+def _not_found(key):
+    if isinstance(key, tuple):
+        return {'variant': [f"variant '{key[1]}' of '{key[0]}' does not exist"]}
+    return {'id': [f"variant {key} does not exist"]}
+
+
+def _case(quote_name, column, n_variant):
+    # `CASE id WHEN 1 THEN 20000 ... ELSE price END`, ELSE keeps the value of
+    # the variants the column is not given for and gives the CASE the type of
+    # the column on postgresql, the quoted decimals alone would be text
+    whens = ' '.join(['WHEN %s THEN %s'] * n_variant)
+    column = quote_name(column)
+    return f"{column} = CASE {quote_name('id')} {whens} ELSE {column} END"
+
+
+def _update_batch(connection, updates, now):
+    # one UPDATE with a CASE per field instead of one UPDATE per variant. It's
+    # written out, building the When expressions of the ORM takes longer than
+    # running the statement
+    quote_name = connection.ops.quote_name
+    assignments = []
+    params = []
+    for field in UPDATE_FIELDS:
+        model_field = Variant._meta.get_field(field)
+        values = [(variant_id, row[field]) for variant_id, row in updates if field in row]
+        if not values:
+            continue
+        assignments.append(_case(quote_name, model_field.column, len(values)))
+        for variant_id, value in values:
+            params.extend((variant_id, model_field.get_db_prep_save(value, connection)))
+
+    updated_at = Variant._meta.get_field('updated_at')
+    assignments.append(f"{quote_name(updated_at.column)} = %s")
+    params.append(updated_at.get_db_prep_save(now, connection))
+    params.extend(variant_id for variant_id, _ in updates)
+
+    sql = (f"UPDATE {quote_name(Variant._meta.db_table)} SET {', '.join(assignments)} "
+           f"WHERE {quote_name('id')} IN ({', '.join(['%s'] * len(updates))})")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def update_variants(rows):
+    """set the price, stock, weight and is_active of the variant of every
+    row, a row has the variant `id` or the `product` and `variant` names.
+    Every row is applied or none, returns how many variants were updated.
+    Raises InvalidRows when a variant does not exist or is in several rows"""
+    found = find_variants(rows)
+
+    errors = []
+    updates = []
+    seen = {}
+    for index, row in enumerate(rows):
+        key = row_key(row)
+        variant = found.get(key)
+        if variant is None:
+            errors.append(_not_found(key))
+        elif variant[0] in seen:
+            errors.append({'non_field_errors': [
+                f"the variant is already updated by row {seen[variant[0]]}"]})
+        else:
+            seen[variant[0]] = index
+            errors.append({})
+            updates.append((variant[0], row))
+    if any(errors):
+        raise InvalidRows(errors)
+    if not updates:
+        return 0
+
+    using = router.db_for_write(Variant)
+    now = timezone.now()
+    n_updated = 0
+    with transaction.atomic(using=using):
+        for batch in _batches(updates):
+            n_updated += _update_batch(connections[using], batch, now)
+        # an is_active given by the client wins over a scheduled activation
+        is_active_set = [variant_id for variant_id, row in updates
+                         if 'is_active' in row]
+        for batch in _batches(is_active_set):
+            PendingActivation.objects.filter(variant_id__in=batch).delete()
+        bump_catalog_version()
+
+    # after the commit, like stock.reserve_stock
+    refresh_product_summaries({found[row_key(row)][1] for _, row in updates})
+    return n_updated
@@ -0,0 +1,197 @@
+import hashlib
+import pickle
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache, dummy
+
+from .catalog import catalog_version
+from .filters import VariantFilterSet
+from .search import search_terms
+
+# bytes stored in a shared list cache since the key was added, it expires
+# with the pages stored in the same window
+STORED_BYTES_KEY = 'product_list:stored_bytes'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class _Usage:
+    # bytes of the pickled values of one named cache, shared by its
+    # instances like the values themselves
+
+    def __init__(self):
+        self.sizes = {}
+        self.total = 0
+
+    def set(self, key, size):
+        self.total += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+
+    def remove(self, key):
+        self.total -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        self.sizes.clear()
+        self.total = 0
+
+
+_usages = {}
+
+
+class SizeBoundedLocMemCache(LocMemCache):
+    """LocMemCache that also evicts the oldest entries once the pickled
+    values take more than OPTIONS['MAX_SIZE'] bytes, the total is kept up to
+    date on every change instead of summed on every set"""
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_size = params.get('OPTIONS', {}).get('MAX_SIZE')
+        self._usage = _usages.setdefault(name, _Usage())
+
+    def _set(self, key, value, timeout=None):
+        # re-insert so the key moves to the end of the eviction order
+        self._cache.pop(key, None)
+        super()._set(key, value, timeout)
+        self._usage.set(key, len(value))
+        if self._max_size is None:
+            return
+
+        while self._usage.total > self._max_size and len(self._cache) > 1:
+            self._delete(next(iter(self._cache)))
+
+    def _delete(self, key):
+        super()._delete(key)
+        self._usage.remove(key)
+
+    def _forget_expired(self, key, acquire_lock=True):
+        # get and has_key drop expired values without _delete
+        if key not in self._usage.sizes:
+            return
+        with (self._lock.writer() if acquire_lock else dummy()):
+            if key not in self._cache:
+                self._usage.remove(key)
+
+    def get(self, key, default=None, version=None, acquire_lock=True):
+        value = super().get(key, default, version, acquire_lock)
+        self._forget_expired(self.make_key(key, version=version), acquire_lock)
+        return value
+
+    def has_key(self, key, version=None):
+        found = super().has_key(key, version)
+        self._forget_expired(self.make_key(key, version=version))
+        return found
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version)
+        key = self.make_key(key, version=version)
+        with self._lock.writer():
+            if key in self._cache:
+                self._usage.set(key, len(self._cache[key]))
+        return value
+
+    def clear(self):
+        super().clear()
+        self._usage.clear()
+
+
+def _incr_stat(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_list_cache():
+    if not settings.PRODUCT_LIST_CACHE:
+        return None
+    return caches[settings.PRODUCT_LIST_CACHE]
+
+
+def check_list_cache(app_configs, **kwargs):
+    # the pages are keyed on the catalog version so they are never stale,
+    # but every process fills a local memory cache of its own
+    cache = get_list_cache()
+    if cache is None or not isinstance(cache, LocMemCache):
+        return []
+    return [checks.Warning(
+        f"the '{settings.PRODUCT_LIST_CACHE}' cache of PRODUCT_LIST_CACHE "
+        f"is local to the process",
+        hint="with several processes every one caches its own pages, up to "
+             "PRODUCT_LIST_CACHE_MAX_SIZE each, point PRODUCT_LIST_CACHE_BACKEND "
+             "and PRODUCT_LIST_CACHE_LOCATION at a memcached or redis server "
+             "to share them",
+        id='product_service.W001',
+    )]
+
+
+def list_cache_key(cache, request, page_size):
+    params = (
+        request.get_host(),
+        request.GET.get('cursor', ''),
+        page_size,
+        request.GET.get('created_at_gte', ''),
+        request.GET.get('created_at_lte', ''),
+        request.GET.get('fields', ''),
+        request.GET.get('expand', ''),
+        ' '.join(search_terms(request.GET.get('search', ''))),
+        settings.VARIANT_LIMIT_PER_PRODUCT,
+    ) + tuple(request.GET.get(param, '') for param in VariantFilterSet.params)
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()
+    # a write in any process bumps the catalog version, the pages cached
+    # before it are not read again
+    return f'product_list:{catalog_version(request)[0]}:{digest}'
+
+
+def get_cached_list(request, page_size):
+    cache = get_list_cache()
+    if cache is None:
+        return None
+
+    pickled = cache.get(list_cache_key(cache, request, page_size))
+    if pickled is None:
+        _incr_stat('misses')
+        return None
+
+    _incr_stat('hits')
+    return pickle.loads(pickled)
+
+
+def set_cached_list(request, page_size, data):
+    cache = get_list_cache()
+    if cache is None:
+        return
+
+    # pickle here so oversized pages are never stored, whatever the backend
+    pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    if len(pickled) > settings.PRODUCT_LIST_CACHE_MAX_ENTRY_SIZE:
+        return
+    if not isinstance(cache, SizeBoundedLocMemCache) and not _within_budget(
+            cache, len(pickled)):
+        return
+    cache.set(list_cache_key(cache, request, page_size), pickled)
+
+
+def _within_budget(cache, size):
+    # a shared backend can't evict by size, pages are only stored while the
+    # ones of the current window take less than half PRODUCT_LIST_CACHE_MAX_SIZE.
+    # Pages outlive their window by at most one timeout, so those of two
+    # windows, at most PRODUCT_LIST_CACHE_MAX_SIZE bytes, are stored at once
+    cache.add(STORED_BYTES_KEY, 0)
+    try:
+        stored = cache.incr(STORED_BYTES_KEY, size)
+    except ValueError:
+        return False
+    return stored <= settings.PRODUCT_LIST_CACHE_MAX_SIZE // 2
@@ -0,0 +1,30 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion
+
+CATALOG_VERSION_ID = 1
+
+
+def bump_catalog_version():
+    """mark the catalog as changed, in the transaction of the write. Call it
+    last, the row stays locked until the commit and every write updates it"""
+    now = timezone.now()
+    n_updated = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID).update(
+        version=F('version') + 1, changed_at=now)
+    if not n_updated:
+        # the row is created by the migration, this is for a flushed table
+        CatalogVersion.objects.get_or_create(
+            id=CATALOG_VERSION_ID, defaults={'version': 1, 'changed_at': now})
+
+
+def catalog_version(request=None):
+    """(version, changed_at) of the catalog, read once per request. The
+    product list ETag, Last-Modified and cache keys come from it"""
+    if request is not None and hasattr(request, '_catalog_version'):
+        return request._catalog_version
+    version = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID).values_list(
+        'version', 'changed_at').first() or (0, None)
+    if request is not None:
+        request._catalog_version = version
+    return version
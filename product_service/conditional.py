@@ -0,0 +1,85 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .catalog import catalog_version
+from .models import Product
+
+
+def _validators(parts, last_modified):
+    etag = quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+    if last_modified is not None:
+        last_modified = timegm(last_modified.utctimetuple())
+    return etag, last_modified
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _representation(request):
+    # the same page has other links on another host and another body in
+    # another format
+    return request.get_host(), request.accepted_media_type
+
+
+def list_validators(view, request, *args, **kwargs):
+    """(etag, last_modified) of a list page, from the catalog version every
+    write bumps in its transaction, deletes included, one primary key read"""
+    version, changed_at = catalog_version(request)
+    parts = (request.get_full_path(), _representation(request),
+             settings.VARIANT_LIMIT_PER_PRODUCT, version, changed_at)
+    return _validators(parts, changed_at)
+
+
+def detail_validators(view, request, pk=None, *args, **kwargs):
+    """(etag, last_modified) of a product, (None, None) when it does not
+    exist. The variant count changes when one of them is deleted"""
+    try:
+        product = Product.objects.filter(pk=pk).annotate(
+            variants_updated_at=Max('variants__updated_at'),
+            variant_count=Count('variants')).values(
+            'updated_at', 'variants_updated_at', 'variant_count').first()
+    except (TypeError, ValueError):
+        product = None
+    if product is None:
+        return None, None
+
+    parts = (request.get_full_path(), _representation(request),
+             product['updated_at'], product['variants_updated_at'],
+             product['variant_count'])
+    return _validators(
+        parts, _latest(product['updated_at'], product['variants_updated_at']))
+
+
+def conditional(validators):
+    """viewset action decorator, answers 304 Not Modified when the client
+    already has the current version, without running the action, and adds
+    ETag, Last-Modified and the PRODUCT_CACHE_CONTROL of the action"""
+    def decorator(action):
+        @wraps(action)
+        def wrapped(view, request, *args, **kwargs):
+            etag, last_modified = validators(view, request, *args, **kwargs)
+            response = None
+            if etag is not None:
+                response = get_conditional_response(request, etag, last_modified)
+            if response is None:
+                response = action(view, request, *args, **kwargs)
+
+            if etag is not None and (200 <= response.status_code < 300 or
+                                     response.status_code == 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+            cache_control = settings.PRODUCT_CACHE_CONTROL.get(view.action)
+            if cache_control:
+                response['Cache-Control'] = cache_control
+            return response
+        return wrapped
+    return decorator
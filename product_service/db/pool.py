@@ -0,0 +1,148 @@
+import threading
+from time import perf_counter
+
+from django.db.utils import OperationalError
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """At most max_size open DB-API connections shared by all the threads,
+    a thread waits up to `timeout` seconds for one to be released"""
+
+    def __init__(self, alias, max_size, timeout):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._stats = {
+            'acquired': 0,
+            'created': 0,
+            'waited': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'timeouts': 0,
+        }
+
+    def acquire(self, connect):
+        started_at = perf_counter()
+        waited = False
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (perf_counter() - started_at)
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if self._idle or self._size < self.max_size:
+                        break
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"no '{self.alias}' connection released in "
+                        f"{self.timeout} seconds, {self.max_size} are in use")
+
+            wait_ms = (perf_counter() - started_at) * 1000
+            self._stats['acquired'] += 1
+            if waited:
+                self._stats['waited'] += 1
+                self._stats['wait_ms_total'] += wait_ms
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+            if self._idle:
+                # the most recently used one, the others may time out idle
+                return self._idle.pop()
+            self._size += 1
+
+        try:
+            connection = connect()
+        except Exception:
+            self._discarded()
+            raise
+        with self._condition:
+            self._stats['created'] += 1
+        return connection
+
+    def release(self, connection):
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            self._discarded()
+
+    def _discarded(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def close_idle(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self._condition:
+            return dict(
+                self._stats,
+                max_size=self.max_size,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle))
+
+
+def get_pool(alias, settings_dict):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            options = settings_dict['POOL']
+            pool = _pools[alias] = ConnectionPool(
+                alias, options.get('MAX_SIZE', 10), options.get('TIMEOUT', 5))
+        return pool
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.alias: pool.stats() for pool in pools}
+
+
+class PooledDatabaseWrapperMixin:
+    """Takes the connection from the pool of the alias instead of opening a
+    new one, close() gives it back. Pooling is on when the settings of the
+    alias have a POOL dict, e.g. {'MAX_SIZE': 20, 'TIMEOUT': 5}"""
+
+    @property
+    def pool(self):
+        if not self.settings_dict.get('POOL'):
+            return None
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        new_connection = super().get_new_connection
+        if self.pool is None:
+            return new_connection(conn_params)
+        return self.pool.acquire(lambda: new_connection(conn_params))
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        # a connection closed inside atomic() or broken is not reused
+        if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+            pool.discard(self.connection)
+            return
+        try:
+            self.connection.rollback()
+        except Exception:
+            pool.discard(self.connection)
+            return
+        pool.release(self.connection)
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import (
+    PRODUCT_VALUES,
+    VARIANT_VALUES,
+    prepare_variant_rows,
+    product_serializer,
+    variant_serializer)
+from .models import Product, Variant
+from .utils import filter_created_at
+
+
+def parse_changed_since(changed_since):
+    # ISO 8601 datetime, naive values are in UTC, raises ValueError
+    value = parse_datetime(changed_since)
+    if value is None:
+        raise ValueError(f"'{changed_since}' is not a valid datetime")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def export_queryset(created_at_gte=None, created_at_lte=None, changed_since=None):
+    """products to export, raises ValueError on an invalid filter"""
+    queryset = filter_created_at(
+        Product.objects.all(), created_at_gte, created_at_lte)
+    if changed_since:
+        changed_since = parse_changed_since(changed_since)
+        changed_variants = Variant.objects.filter(
+            updated_at__gte=changed_since).values('product_id')
+        queryset = queryset.filter(
+            Q(updated_at__gte=changed_since) | Q(id__in=changed_variants))
+    return queryset
+
+
+def iter_variant_rows(product_ids, chunk_size):
+    # keyset pagination on (product_id, id), backed by variant_product_id_idx
+    queryset = Variant.objects.filter(
+        product_id__in=product_ids).order_by('product_id', 'id')
+    last_row = None
+    while True:
+        chunk = queryset
+        if last_row is not None:
+            chunk = chunk.filter(
+                Q(product_id__gt=last_row['product_id']) |
+                Q(product_id=last_row['product_id'], id__gt=last_row['id']))
+        rows = list(chunk.values('id', *VARIANT_VALUES)[:chunk_size])
+        yield from prepare_variant_rows(rows)
+        if len(rows) < chunk_size:
+            return
+        last_row = rows[-1]
+
+
+def export_products(queryset, product_chunk_size=None, variant_chunk_size=None):
+    """yield every product of queryset with all its variants as NDJSON lines,
+    at most one chunk of products and one chunk of variants is in memory"""
+    product_chunk_size = product_chunk_size or settings.EXPORT_PRODUCT_CHUNK_SIZE
+    variant_chunk_size = variant_chunk_size or settings.EXPORT_VARIANT_CHUNK_SIZE
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    queryset = queryset.order_by('id').values(*PRODUCT_VALUES)
+    last_id = 0
+    while True:
+        products = list(queryset.filter(id__gt=last_id)[:product_chunk_size])
+        if not products:
+            return
+        last_id = products[-1]['id']
+
+        # both are sorted by product id, so variants are consumed in step
+        # with the products they belong to
+        variant_rows = iter_variant_rows(
+            [product['id'] for product in products], variant_chunk_size)
+        variant_row = next(variant_rows, None)
+        for product in products:
+            variants = []
+            while variant_row is not None and variant_row['product_id'] == product['id']:
+                variants.append(variant_serializer.to_representation(variant_row))
+                variant_row = next(variant_rows, None)
+
+            representation = product_serializer.to_representation(
+                dict(product, variants=variants))
+            yield encoder.encode(representation) + '\n'
@@ -0,0 +1,119 @@
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db import models
+
+from .models import Product, Variant
+from .timezones import to_indonesia_timezone_many
+
+PRODUCT_VALUES = ('id', 'name', 'description', 'is_active', 'created_at')
+VARIANT_VALUES = ('product_id', 'name', 'height', 'stock', 'price',
+                  'weight', 'created_at', 'is_active')
+
+
+def _identity(value):
+    return value
+
+
+def _decimal_to_float(decimal_places):
+    exponent = Decimal('.1') ** decimal_places
+
+    def convert(value):
+        return float(value.quantize(exponent))
+    return convert
+
+
+def _model_field_converter(model, name):
+    field = model._meta.get_field(name)
+    if isinstance(field, models.DecimalField):
+        return _decimal_to_float(field.decimal_places)
+    if isinstance(field, models.BooleanField):
+        return bool
+    if isinstance(field, models.IntegerField):
+        return int
+    if isinstance(field, (models.CharField, models.TextField)):
+        return str
+    return _identity
+
+
+class CompiledSerializer:
+    """Builds output dicts from `.values()` rows, the converter of every
+    field is looked up once here instead of once per row"""
+
+    def __init__(self, model, fields, overrides=None):
+        overrides = overrides or {}
+        self.fields = tuple(fields)
+        self.converters = tuple(
+            overrides[name] if name in overrides else
+            _model_field_converter(model, name)
+            for name in self.fields)
+
+    def to_representation(self, row):
+        return {name: convert(row[name])
+                for name, convert in zip(self.fields, self.converters)}
+
+
+_to_float_2 = _decimal_to_float(2)
+
+
+def _price(value):
+    return int(_to_float_2(value))
+
+
+# same output as VariantSerializer and ProductLimitVariantsSerializer, the
+# created_at of the rows must already be in Indonesia time, see
+# prepare_variant_rows
+VARIANT_OVERRIDES = {'price': _price, 'created_at': _identity}
+PRODUCT_OVERRIDES = {'variants': _identity}
+variant_serializer = CompiledSerializer(
+    Variant,
+    ('name', 'height', 'stock', 'price', 'weight', 'created_at', 'is_active'),
+    overrides=VARIANT_OVERRIDES)
+product_serializer = CompiledSerializer(
+    Product,
+    ('name', 'description', 'variants', 'is_active'),
+    overrides=PRODUCT_OVERRIDES)
+
+
+@lru_cache(maxsize=None)
+def pruned_serializers(fieldset):
+    """(product, variant) serializers of a fieldsets.FieldSet, the variant
+    one is None when the variants are not embedded"""
+    variant = None
+    if fieldset.variant_fields is not None:
+        variant = CompiledSerializer(
+            Variant, fieldset.variant_fields, overrides=VARIANT_OVERRIDES)
+    return CompiledSerializer(
+        Product, fieldset.product_fields, overrides=PRODUCT_OVERRIDES), variant
+
+
+def prepare_variant_rows(rows):
+    # one pass over the whole batch instead of one conversion per field call
+    return to_indonesia_timezone_many(rows, 'created_at')
+
+
+def serialize_products(product_rows, variant_limit, fieldset=None):
+    """product_rows are `Product.objects.values(*PRODUCT_VALUES)` rows, or
+    the fieldsets.product_columns of fieldset"""
+    products, variants_serializer = product_serializer, variant_serializer
+    variant_values = VARIANT_VALUES
+    if fieldset is not None:
+        products, variants_serializer = pruned_serializers(fieldset)
+        variant_values = ('product_id',) + (fieldset.variant_fields or ())
+
+    product_ids = [row['id'] for row in product_rows]
+    variants = {product_id: [] for product_id in product_ids}
+    if product_ids and variants_serializer is not None:
+        variant_rows = list(Variant.objects.limit_per_product(variant_limit).filter(
+            product_id__in=product_ids).values(*variant_values))
+        if 'created_at' in variant_values:
+            variant_rows = prepare_variant_rows(variant_rows)
+        to_representation = variants_serializer.to_representation
+        for row in variant_rows:
+            variants[row['product_id']].append(to_representation(row))
+
+    results = []
+    for row in product_rows:
+        row = dict(row, variants=variants[row['id']])
+        results.append(products.to_representation(row))
+    return results
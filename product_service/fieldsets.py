@@ -0,0 +1,83 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from .serializers import VariantSerializer
+
+# output fields a client can ask for with `fields=`, in the order they are
+# rendered
+PRODUCT_FIELDS = ('name', 'description', 'variants', 'is_active')
+VARIANT_FIELDS = ('name', 'height', 'stock', 'price', 'weight', 'created_at',
+                  'is_active')
+EXPANDABLE = ('variants',)
+# read whatever the client asks for, cursor pagination orders by them
+PRODUCT_KEY_COLUMNS = ('id', 'created_at')
+VARIANT_KEY_COLUMNS = ('id', 'product_id')
+
+# variant_fields is None when the variants are not embedded
+FieldSet = namedtuple('FieldSet', ('product_fields', 'variant_fields'))
+
+
+def _split(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def parse_fieldset(query_params):
+    """FieldSet of the `fields` and `expand` query parameters, None when the
+    whole product is asked for. `fields=name,variants.price` renders the
+    name and the price of the variants, `fields=name&expand=variants` the
+    name and the whole variants. Raises ValueError on an unknown field"""
+    fields = _split(query_params.get('fields'))
+    expand = _split(query_params.get('expand'))
+    for name in expand:
+        if name not in EXPANDABLE:
+            raise ValueError(f"'{name}' can not be expanded")
+    if not fields:
+        # the variants are embedded unless fields leaves them out
+        return None
+
+    product_fields = set()
+    variant_fields = set()
+    for name in fields:
+        parent, _, child = name.partition('.')
+        if child and parent == 'variants' and child in VARIANT_FIELDS:
+            variant_fields.add(child)
+        elif not child and name in PRODUCT_FIELDS:
+            product_fields.add(name)
+        else:
+            raise ValueError(f"unknown field '{name}'")
+
+    if variant_fields or 'variants' in expand:
+        product_fields.add('variants')
+    if 'variants' in product_fields and not variant_fields:
+        variant_fields = VARIANT_FIELDS
+
+    fieldset = FieldSet(
+        tuple(name for name in PRODUCT_FIELDS if name in product_fields),
+        tuple(name for name in VARIANT_FIELDS if name in variant_fields)
+        if 'variants' in product_fields else None)
+    if fieldset == (PRODUCT_FIELDS, VARIANT_FIELDS):
+        return None
+    return fieldset
+
+
+def product_columns(fieldset):
+    return PRODUCT_KEY_COLUMNS + tuple(
+        name for name in fieldset.product_fields if name != 'variants')
+
+
+def variant_columns(fieldset):
+    return VARIANT_KEY_COLUMNS + fieldset.variant_fields
+
+
+@lru_cache(maxsize=None)
+def pruned_serializer(serializer_class, fieldset):
+    """subclass of serializer_class only rendering the fields of fieldset,
+    built once per field set"""
+    attrs = {'Meta': type('Meta', (serializer_class.Meta,), {
+        'fields': fieldset.product_fields})}
+    if fieldset.variant_fields is not None:
+        variant_class = type('PrunedVariantSerializer', (VariantSerializer,), {
+            'Meta': type('Meta', (VariantSerializer.Meta,), {
+                'fields': fieldset.variant_fields})})
+        attrs['variants'] = variant_class(many=True)
+    return type(f'Pruned{serializer_class.__name__}', (serializer_class,), attrs)
@@ -0,0 +1,68 @@
+from django.core.exceptions import ValidationError
+
+from .models import Variant
+
+
+class RangeFilter:
+    """`<field>_gte` and `<field>_lte` query parameters on a variant field"""
+
+    def __init__(self, field):
+        self.field = field
+        self.params = (f'{field}_gte', f'{field}_lte')
+
+    def lookups(self, query_params):
+        model_field = Variant._meta.get_field(self.field)
+        for param, lookup in zip(self.params, ('gte', 'lte')):
+            value = query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                yield f'{self.field}__{lookup}', model_field.to_python(value)
+            except ValidationError:
+                raise ValueError(f"'{value}' is not a valid {param}")
+
+
+class BooleanFilter:
+    """`<field>=true|false` query parameter on a variant field"""
+
+    def __init__(self, field):
+        self.field = field
+        self.params = (field,)
+
+    def lookups(self, query_params):
+        value = query_params.get(self.field)
+        if value in (None, ''):
+            return
+        if value.lower() not in ('true', 'false'):
+            raise ValueError(f"'{value}' is not a valid {self.field}, use true or false")
+        yield self.field, value.lower() == 'true'
+
+
+class VariantFilterSet:
+    """products having at least one variant matching every filter, e.g.
+    `?stock_gte=1&price_lte=50000`"""
+    filters = (
+        RangeFilter('price'),
+        RangeFilter('stock'),
+        RangeFilter('weight'),
+        RangeFilter('height'),
+        BooleanFilter('is_active'),
+    )
+    params = tuple(param for f in filters for param in f.params)
+
+    def __init__(self, query_params):
+        """raises ValueError when a value is invalid"""
+        self.conditions = dict(
+            lookup for f in self.filters for lookup in f.lookups(query_params))
+
+    def __bool__(self):
+        return bool(self.conditions)
+
+    def filter_products(self, queryset, key='id'):
+        """`key` is the product id column of queryset. The variants are
+        matched once by an uncorrelated `IN (SELECT product_id ...)` on the
+        range indexes, not with a subquery per product"""
+        if not self.conditions:
+            return queryset
+        variants = Variant.objects.filter(**self.conditions).values('product_id')
+        return queryset.filter(**{f'{key}__in': variants})
@@ -0,0 +1,313 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .catalog import bump_catalog_version
+from .models import PendingActivation, Product, Variant
+from .scheduler import publish_activations_before_next_sweep
+from .summaries import refresh_product_summaries
+from .timezones import as_indonesia_time
+
+# columns of a csv import, one row per variant, the rows of a product must
+# be next to each other. A product without variants has an empty
+# variant_name, is_active is optional
+CSV_COLUMNS = ('name', 'description', 'variant_name', 'height', 'stock',
+               'price', 'weight', 'active_time')
+VARIANT_FIELDS = ('name', 'height', 'stock', 'price', 'weight')
+# keeps the `IN` lists below the sqlite variable limit
+ID_CHUNK_SIZE = 500
+
+
+class LineReader:
+    """decoded lines of a binary file, `offset` and `line` are the position
+    after the last line read, so they can be stored as a checkpoint"""
+
+    def __init__(self, file, offset=0, line=0):
+        self.file = file
+        self.file.seek(offset)
+        self.offset = offset
+        self.line = line
+
+    def __iter__(self):
+        for raw_line in iter(self.file.readline, b''):
+            self.offset += len(raw_line)
+            self.line += 1
+            yield raw_line.decode('utf-8')
+
+    def position(self):
+        return {'offset': self.offset, 'line': self.line}
+
+
+def read_ndjson(reader):
+    """(line, position after it, product data or None, error) per product,
+    the position is the offset and line to resume from"""
+    for text in reader:
+        if not text.strip():
+            continue
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            yield reader.line, reader.position(), None, f'invalid JSON, {e}'
+            continue
+        if not isinstance(data, dict):
+            yield reader.line, reader.position(), None, 'a product must be an object'
+            continue
+        yield reader.line, reader.position(), data, None
+
+
+def _parse_bool(value):
+    value = value.strip().lower()
+    if value in ('', 'true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValidationError(f"'{value}' is not a boolean")
+
+
+def read_csv(reader, columns):
+    """like read_ndjson, consecutive rows with the same name are one product"""
+    product = None
+    rows = csv.DictReader(reader, fieldnames=columns)
+    # a quoted value may span lines, a product starts where the row before ended
+    row_start = reader.line + 1
+    for row in rows:
+        if product is not None and row['name'] != product['data']['name']:
+            yield product['line'], product['position'], product['data'], product['error']
+            product = None
+
+        if product is None:
+            product = {'line': row_start, 'error': None, 'data': {
+                'name': row['name'],
+                'description': row['description'],
+                'is_active': row.get('is_active') or 'true',
+                'variants': [],
+            }}
+        product['position'] = reader.position()
+
+        if None in row or any(row.get(column) is None for column in columns):
+            product['error'] = f'line {row_start} must have {len(columns)} columns'
+        elif row['variant_name']:
+            variant = {field: row[field] for field in VARIANT_FIELDS[1:]}
+            variant['name'] = row['variant_name']
+            variant['active_time'] = row['active_time']
+            product['data']['variants'].append(variant)
+        row_start = reader.line + 1
+
+    if product is not None:
+        yield product['line'], product['position'], product['data'], product['error']
+
+
+def read_csv_header(file):
+    header = file.readline()
+    columns = next(csv.reader([header.decode('utf-8')]))
+    missing = set(CSV_COLUMNS) - set(columns)
+    if missing:
+        raise ValueError(f"missing csv columns: {', '.join(sorted(missing))}")
+    return columns, len(header)
+
+
+def _clean(model, name, value, errors, error_name=None):
+    if isinstance(value, float):
+        # like the API, 15000.99 is Decimal('15000.99'), not the binary float
+        value = str(value)
+    field = model._meta.get_field(name)
+    try:
+        value = field.clean(value, None)
+        # only checked by the database, it would fail the whole batch
+        if isinstance(field, models.PositiveIntegerField) and value < 0:
+            raise ValidationError('Ensure this value is greater than or equal to 0.')
+        return value
+    except ValidationError as e:
+        errors[error_name or name] = e.messages
+
+
+class ProductImporter:
+    """Validates products one at a time and inserts them in batches, names
+    are checked against an in-memory index of the product names instead of
+    one query per row"""
+
+    def __init__(self, batch_size=None, use_copy=None, now=None):
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        if use_copy is None:
+            use_copy = connection.vendor == 'postgresql'
+        self.use_copy = use_copy
+        self.now = now or timezone.now()
+        self.names = set(Product.objects.values_list('name', flat=True).iterator())
+        self.products = []
+        self.variants = []
+        self.n_product = 0
+        self.n_variant = 0
+        self.n_pending = 0
+
+    def validate(self, data):
+        """(product, variants), raises ValidationError with a dict of errors"""
+        errors = {}
+        name = _clean(Product, 'name', data.get('name'), errors)
+        description = _clean(Product, 'description', data.get('description'), errors)
+        is_active = data.get('is_active', True)
+        if isinstance(is_active, str):
+            try:
+                is_active = _parse_bool(is_active)
+            except ValidationError as e:
+                errors['is_active'] = e.messages
+        else:
+            is_active = _clean(Product, 'is_active', is_active, errors)
+        if name in self.names:
+            errors['name'] = ['product with this name already exists.']
+
+        variants_data = data.get('variants', [])
+        if not isinstance(variants_data, list):
+            errors['variants'] = ['Expected a list of items.']
+            variants_data = []
+
+        variants = []
+        variant_names = set()
+        for i, variant_data in enumerate(variants_data):
+            if not isinstance(variant_data, dict):
+                errors[f'variants.{i}'] = ['Expected an object.']
+                continue
+            variant = self.build_variant(variant_data, errors, f'variants.{i}')
+            if variant is None:
+                continue
+            if variant.name in variant_names:
+                errors[f'variants.{i}.name'] = [
+                    f"A variant with '{variant.name}' name already exists for the product."]
+            variant_names.add(variant.name)
+            variants.append(variant)
+
+        if errors:
+            raise ValidationError(errors)
+        product = Product(name=name, description=description, is_active=is_active,
+                          created_at=self.now, updated_at=self.now)
+        return product, variants
+
+    def build_variant(self, data, errors, prefix):
+        n_error = len(errors)
+        values = {
+            field: _clean(Variant, field, data.get(field), errors, f'{prefix}.{field}')
+            for field in VARIANT_FIELDS
+        }
+
+        active_time = data.get('active_time')
+        if active_time in (None, ''):
+            # exports don't carry it, the variant is active from now on
+            active_time = self.now
+        else:
+            try:
+                active_time = parse_datetime(str(active_time))
+            except ValueError:
+                active_time = None
+            if active_time is None:
+                errors[f'{prefix}.active_time'] = [
+                    'Datetime has wrong format. Use YYYY-MM-DDThh:mm[:ss[.uuuuuu]][+HH:MM|-HH:MM|Z].']
+            else:
+                # the wall clock time in Indonesia, like ProductSerializer
+                active_time = as_indonesia_time(active_time)
+
+        if len(errors) > n_error:
+            return None
+        # variants with a future active_time are activated by the sweep
+        return Variant(active_time=active_time, is_active=active_time <= self.now,
+                       created_at=self.now, updated_at=self.now, **values)
+
+    def add(self, data):
+        """validate and queue a product, the batch is saved once it is full.
+        Raises ValidationError when the product is rejected"""
+        product, variants = self.validate(data)
+        self.names.add(product.name)
+        self.products.append(product)
+        self.variants.append(variants)
+        if len(self.products) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.products:
+            return
+        products, variants_data = self.products, self.variants
+        with transaction.atomic():
+            self.insert(Product, products, ('name', 'description', 'is_active',
+                                            'created_at', 'updated_at'))
+            ids = self.product_ids([product.name for product in products])
+
+            variants = []
+            for product, product_variants in zip(products, variants_data):
+                for variant in product_variants:
+                    variant.product_id = ids[product.name]
+                    variants.append(variant)
+            self.insert(Variant, variants, (
+                'product_id', 'name', 'height', 'stock', 'price', 'weight',
+                'active_time', 'created_at', 'updated_at', 'is_active'))
+
+            pending = [
+                PendingActivation(variant_id=variant_id, activate_at=activate_at)
+                for variant_id, activate_at in self.inactive_variants(ids.values())
+            ]
+            self.insert(PendingActivation, pending, ('variant_id', 'activate_at'))
+            # like schedule_activations, the sweep before their active_time
+            # already ran for the ones due soon
+            publish_activations_before_next_sweep(pending)
+            refresh_product_summaries(list(ids.values()))
+            bump_catalog_version()
+
+        self.n_product += len(products)
+        self.n_variant += len(variants)
+        self.n_pending += len(pending)
+        self.products = []
+        self.variants = []
+
+    def product_ids(self, names):
+        ids = {}
+        for start in range(0, len(names), ID_CHUNK_SIZE):
+            ids.update(Product.objects.filter(
+                name__in=names[start:start + ID_CHUNK_SIZE]).values_list('name', 'id'))
+        return ids
+
+    def inactive_variants(self, product_ids):
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), ID_CHUNK_SIZE):
+            yield from Variant.objects.filter(
+                product_id__in=product_ids[start:start + ID_CHUNK_SIZE],
+                is_active=False).values_list('id', 'active_time')
+
+    def insert(self, model, objects, fields):
+        if not objects:
+            return
+        if self.use_copy:
+            copy_insert(model, objects, fields)
+        else:
+            model.objects.bulk_create(
+                objects, batch_size=settings.VARIANT_BULK_CREATE_BATCH_SIZE)
+
+
+def _copy_value(value):
+    if isinstance(value, (Decimal, int)) and not isinstance(value, bool):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def copy_insert(model, objects, fields):
+    """insert with postgresql COPY, much faster than INSERT for big batches"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objects:
+        writer.writerow([_copy_value(getattr(obj, field)) for field in fields])
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(field).column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote_name(model._meta.db_table)} ({columns}) '
+            f'FROM STDIN WITH (FORMAT csv)', buffer)
@@ -0,0 +1,57 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from product_service.benchmarks import compare, run_suite
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the product service hot paths on a throwaway test '
+            'database and compare the results with a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--variants', type=int, default=5,
+                            help='variants per seeded product')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--baseline', help='baseline JSON file to compare with')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed slowdown against the baseline, 0.25 is 25%%')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_suite(
+                n_product=options['products'], n_variant=options['variants'],
+                repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+
+        baseline_path = options['baseline']
+        if not baseline_path:
+            return
+        if options['save_baseline'] or not os.path.exists(baseline_path):
+            with open(baseline_path, 'w') as f:
+                f.write(output)
+            self.stderr.write(f'baseline stored in {baseline_path}')
+            return
+
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'performance regressions:\n' + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS('no regressions against the baseline'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product_service.benchmarks import bench_serializers, seed_catalog
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare ProductLimitVariantsSerializer with the compiled '
+            'fast_serializers on a page of products, the seeded rows are '
+            'rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--variants', type=int, default=2,
+                            help='variants per product')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_catalog(options['products'], options['variants'])
+                results = bench_serializers(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for name, title in (('serializer.drf', 'ProductLimitVariantsSerializer'),
+                            ('serializer.fast', 'fast_serializers')):
+            us_per_product = results[name]['us_per_product']
+            self.stdout.write(
+                f'{title}: {us_per_product * options["products"] / 1000:.2f} ms '
+                f'per page of {options["products"]} products, '
+                f'{us_per_product:.2f} us per product')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product_service.catalog import bump_catalog_version
+from product_service.summaries import check_product_summaries, save_summaries
+
+
+class Command(BaseCommand):
+    help = ('Compare every ProductSummary row with the products and variants '
+            'it is built from, fails when one is missing or stale')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='rebuild the missing and stale summaries')
+
+    def handle(self, *args, **options):
+        problems = check_product_summaries()
+        for product_id, problem in problems:
+            self.stdout.write(f'product {product_id}: {problem}')
+
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('product summaries are consistent'))
+            return
+        if not options['fix']:
+            raise CommandError(f'{len(problems)} inconsistent product summaries')
+
+        save_summaries([product_id for product_id, _ in problems])
+        bump_catalog_version()
+        self.stdout.write(f'{len(problems)} product summaries fixed')
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.utils import timezone
+
+from product_service.filters import VariantFilterSet
+from product_service.models import Product, Variant
+from product_service.paginations import CustomPagination, ProductSummaryPagination
+from product_service.utils import filter_created_at
+from product_service.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = 'Print the query plan of the queries run by GET /v1/products/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--created-at-gte', help='date filter, in dd-mm-YYYY format')
+        parser.add_argument(
+            '--created-at-lte', help='date filter, in dd-mm-YYYY format')
+        parser.add_argument(
+            '--variant-filter', action='append', default=[],
+            help='variant filter of the list, e.g. price_lte=50000, repeatable')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='run the queries with EXPLAIN ANALYZE (postgresql only)')
+
+    def handle(self, *args, **options):
+        pagination = (ProductSummaryPagination if settings.PRODUCT_LIST_SUMMARY
+                      else CustomPagination)
+        ordering = pagination.ordering
+        page_size = pagination.page_size
+        view = ProductViewSet(action='list')
+        queryset = view.get_queryset()
+
+        try:
+            filtered = filter_created_at(
+                queryset, options['created_at_gte'], options['created_at_lte'])
+            variant_filters = VariantFilterSet(
+                QueryDict('&'.join(options['variant_filter'])))
+        except ValueError as e:
+            raise CommandError(e)
+        variant_filtered = variant_filters.filter_products(
+            queryset, view.product_key())
+
+        # the same queries CustomPagination builds for the first page and for
+        # a page behind a cursor
+        first_page = queryset.order_by(*ordering)[:page_size + 1]
+        cursor_page = queryset.filter(
+            created_at__lt=timezone.now()).order_by(*ordering)[:page_size + 1]
+        filtered_page = filtered.order_by(*ordering)[:page_size + 1]
+
+        product_ids = list(Product.objects.order_by(
+            *CustomPagination.ordering).values_list('id', flat=True)[:page_size]) or [0]
+        variants = Variant.objects.limit_per_product(
+            settings.VARIANT_LIMIT_PER_PRODUCT).filter(product_id__in=product_ids)
+
+        self.explain('first page', first_page, options['analyze'])
+        self.explain('cursor page', cursor_page, options['analyze'])
+        if options['created_at_gte'] or options['created_at_lte']:
+            self.explain('created_at range', filtered_page, options['analyze'])
+        if variant_filters:
+            self.explain('variant filters',
+                         variant_filtered.order_by(*ordering)[:page_size + 1],
+                         options['analyze'])
+        self.explain('variants prefetch', variants, options['analyze'])
+
+    def explain(self, title, queryset, analyze=False):
+        if connection.vendor == 'postgresql':
+            prefix = 'EXPLAIN ANALYZE' if analyze else 'EXPLAIN'
+        elif connection.vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN'
+        else:
+            raise CommandError(
+                f"explain is not supported on '{connection.vendor}'")
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.fetchall()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'-- {title}'))
+        self.stdout.write(sql % tuple(repr(param) for param in params))
+        for row in rows:
+            self.stdout.write(' '.join(str(column) for column in row))
+        self.stdout.write('')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from product_service.exports import export_products, export_queryset
+
+
+class Command(BaseCommand):
+    help = 'Export every product with all its variants as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', help='file to write to, stdout when it is not set')
+        parser.add_argument(
+            '--created-at-gte', help='date filter, in dd-mm-YYYY format')
+        parser.add_argument(
+            '--created-at-lte', help='date filter, in dd-mm-YYYY format')
+        parser.add_argument(
+            '--changed-since',
+            help='only products created or changed since this ISO 8601 datetime')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        try:
+            queryset = export_queryset(
+                options['created_at_gte'], options['created_at_lte'],
+                options['changed_since'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                n_product = self.export(queryset, output)
+        else:
+            n_product = self.export(queryset, self.stdout)
+
+        self.stderr.write(
+            f'{n_product} products exported, use --changed-since '
+            f'{started_at.isoformat()} for the next incremental export')
+
+    def export(self, queryset, output):
+        n_product = 0
+        for line in export_products(queryset):
+            output.write(line)
+            n_product += 1
+        return n_product
@@ -0,0 +1,129 @@
+import json
+import os
+from time import perf_counter
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from product_service.imports import (
+    LineReader,
+    ProductImporter,
+    read_csv,
+    read_csv_header,
+    read_ndjson)
+
+
+class Command(BaseCommand):
+    help = ('Import products and their variants from a CSV file (one row per '
+            'variant) or a NDJSON file (one product per line, the format of '
+            'export_products). Invalid products are reported and skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='taken from the file extension by default')
+        parser.add_argument('--batch-size', type=int,
+                            help='products inserted per transaction')
+        parser.add_argument(
+            '--checkpoint',
+            help='file storing the position of the last saved batch, an '
+                 'interrupted import started again with it resumes from there')
+        parser.add_argument('--no-copy', action='store_true',
+                            help="use INSERT even when postgresql's COPY is available")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint = self.load_checkpoint(options['checkpoint'], path)
+        if checkpoint.get('done'):
+            self.stderr.write(f'{path} was already imported, see {options["checkpoint"]}')
+            return
+
+        importer = ProductImporter(
+            batch_size=options['batch_size'],
+            use_copy=False if options['no_copy'] else None)
+        n_rejected = checkpoint.get('rejected', 0)
+        self.started_at = perf_counter()
+        self.size = os.path.getsize(path)
+
+        with open(path, 'rb') as file:
+            if file_format == 'csv':
+                try:
+                    columns, header_size = read_csv_header(file)
+                except ValueError as e:
+                    raise CommandError(e)
+                reader = LineReader(file, max(checkpoint.get('offset', 0), header_size),
+                                    checkpoint.get('line', 1))
+                products = read_csv(reader, columns)
+            else:
+                reader = LineReader(file, checkpoint.get('offset', 0),
+                                    checkpoint.get('line', 0))
+                products = read_ndjson(reader)
+
+            for line, position, data, error in products:
+                try:
+                    if error is not None:
+                        raise ValidationError(error)
+                    flushed = importer.add(data)
+                except ValidationError as e:
+                    n_rejected += 1
+                    self.report_error(line, data, e)
+                    flushed = False
+                if flushed:
+                    self.save_checkpoint(options['checkpoint'], path, checkpoint,
+                                         importer, position, n_rejected)
+                    self.report_progress(importer, position, n_rejected)
+
+            importer.flush()
+            self.save_checkpoint(options['checkpoint'], path, checkpoint, importer,
+                                 reader.position(), n_rejected, done=True)
+
+        self.report_progress(importer, {'offset': self.size}, n_rejected)
+        self.stdout.write(
+            f'{importer.n_product} products with {importer.n_variant} variants '
+            f'imported, {importer.n_pending} variants scheduled for activation, '
+            f'{n_rejected} products rejected')
+
+    def load_checkpoint(self, checkpoint_path, path):
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return {}
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('path') != os.path.abspath(path):
+            raise CommandError(
+                f"{checkpoint_path} is the checkpoint of {checkpoint.get('path')}")
+        self.stderr.write(f"resuming {path} from line {checkpoint['line'] + 1}")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint_path, path, checkpoint, importer,
+                        position, n_rejected, done=False):
+        if not checkpoint_path:
+            return
+        data = {
+            'path': os.path.abspath(path),
+            'offset': position['offset'],
+            'line': position['line'],
+            'products': checkpoint.get('products', 0) + importer.n_product,
+            'variants': checkpoint.get('variants', 0) + importer.n_variant,
+            'rejected': n_rejected,
+            'done': done,
+        }
+        # written aside and renamed, an interrupted write never leaves a
+        # truncated checkpoint
+        with open(f'{checkpoint_path}.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+    def report_error(self, line, data, error):
+        name = data.get('name') if isinstance(data, dict) else None
+        messages = error.message_dict if hasattr(error, 'error_dict') else error.messages
+        self.stderr.write(f'line {line}, product {name!r} rejected: {messages}')
+
+    def report_progress(self, importer, position, n_rejected):
+        seconds = perf_counter() - self.started_at
+        percent = position['offset'] / self.size * 100 if self.size else 100
+        self.stderr.write(
+            f'{percent:.1f}%: {importer.n_product} products, {importer.n_variant} '
+            f'variants, {n_rejected} rejected, '
+            f'{importer.n_variant / seconds if seconds else 0:.0f} variants/s')
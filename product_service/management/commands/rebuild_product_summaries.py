@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from product_service.catalog import bump_catalog_version
+from product_service.summaries import rebuild_product_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ProductSummary row of every product'
+
+    def handle(self, *args, **options):
+        n_summary = rebuild_product_summaries()
+        bump_catalog_version()
+        self.stdout.write(f'{n_summary} product summaries rebuilt')
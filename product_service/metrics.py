@@ -0,0 +1,99 @@
+import re
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# upper bounds in milliseconds of the latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started_at = perf_counter()
+        self.timings = {}
+        self.view_name = None
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+
+
+@contextmanager
+def timed(request, name):
+    """add the time spent in the block to the metrics of request, does
+    nothing when the metrics middleware is disabled"""
+    metrics = getattr(request, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+
+    started_at = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_timing(name, perf_counter() - started_at)
+
+
+def similar_queries(queries):
+    """count of the most repeated query once literals are stripped, one
+    query per row of a page (N+1) shows up as a high count"""
+    counts = {}
+    for query in queries:
+        sql = _NUMBER_RE.sub('?', _STRING_RE.sub('?', query['sql']))
+        counts[sql] = counts.get(sql, 0) + 1
+    if not counts:
+        return 0, None
+    sql = max(counts, key=counts.get)
+    return counts[sql], sql
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, total_ms, db_ms, n_query, timings, n_plus_one):
+        bucket = bisect_left(LATENCY_BUCKETS, total_ms)
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'db_ms': 0.0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'n_plus_one': 0,
+                    'timings_ms': {},
+                    'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            stats['count'] += 1
+            stats['total_ms'] += total_ms
+            stats['db_ms'] += db_ms
+            stats['queries'] += n_query
+            stats['max_queries'] = max(stats['max_queries'], n_query)
+            stats['n_plus_one'] += int(n_plus_one)
+            for name, ms in timings.items():
+                stats['timings_ms'][name] = stats['timings_ms'].get(name, 0) + ms
+            stats['histogram'][bucket] += 1
+
+    def snapshot(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        with self._lock:
+            return {
+                view_name: dict(
+                    stats,
+                    timings_ms=dict(stats['timings_ms']),
+                    histogram=dict(zip(bounds, stats['histogram'])))
+                for view_name, stats in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
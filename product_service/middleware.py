@@ -0,0 +1,179 @@
+import logging
+from functools import partial
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .metrics import RequestMetrics, registry, similar_queries, timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+METRICS_PATH_PREFIX = '/v1/'
+# compress functions of the content codings, in order of preference
+COMPRESSORS = {'gzip': compress_string}
+if brotli is not None:
+    # the default quality 11 is for static files, 5 compresses better than
+    # gzip at a similar speed
+    COMPRESSORS = {'br': partial(brotli.compress, quality=5), 'gzip': compress_string}
+
+
+class RequestMetricsMiddleware:
+    """record query count, db time, serialization time and total time of
+    every /v1/ request, see metrics.registry and the Server-Timing header"""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            # removed from the middleware chain, no overhead at all
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(METRICS_PATH_PREFIX):
+            return self.get_response(request)
+
+        request.metrics = RequestMetrics()
+        # django 1.11 has no execute_wrapper, the debug cursor is the only
+        # way to get the queries and their duration outside of DEBUG
+        debug_cursors = {}
+        offsets = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.force_debug_cursor
+            offsets[connection.alias] = len(connection.queries_log)
+            connection.force_debug_cursor = True
+
+        try:
+            response = self.get_response(request)
+        finally:
+            queries = []
+            for connection in connections.all():
+                queries.extend(
+                    list(connection.queries_log)[offsets[connection.alias]:])
+                connection.force_debug_cursor = debug_cursors[connection.alias]
+
+        self.record(request, response, queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, 'metrics'):
+            return None
+
+        # viewsets are recorded per action, e.g. ProductViewSet.list
+        view_name = getattr(view_func, '__name__', 'view')
+        cls = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        if cls is not None:
+            action = actions.get(request.method.lower(), request.method.lower())
+            view_name = f'{cls.__name__}.{action}'
+        request.metrics.view_name = view_name
+        return None
+
+    def record(self, request, response, queries):
+        metrics = request.metrics
+        total_ms = (perf_counter() - metrics.started_at) * 1000
+        db_ms = sum(float(query['time']) for query in queries) * 1000
+        timings = {name: seconds * 1000 for name, seconds in metrics.timings.items()}
+        view_name = metrics.view_name or 'unresolved'
+
+        n_similar, sql = similar_queries(queries)
+        n_plus_one = n_similar >= settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD
+        if n_plus_one:
+            logging.warning(
+                f"possible N+1 in {view_name}: {n_similar} similar queries, {sql}")
+
+        registry.record(view_name, total_ms, db_ms, len(queries), timings, n_plus_one)
+
+        server_timing = [f'db;desc="{len(queries)} queries";dur={db_ms:.2f}']
+        server_timing.extend(f'{name};dur={ms:.2f}' for name, ms in timings.items())
+        server_timing.append(f'total;dur={total_ms:.2f}')
+        response['Server-Timing'] = ', '.join(server_timing)
+
+
+def accepted_encodings(header):
+    """{coding: q} of an Accept-Encoding header"""
+    encodings = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding] = q
+    return encodings
+
+
+def negotiate_encoding(header, available):
+    """the coding of `available` (in order of preference) the client
+    accepts with the highest q, None for identity"""
+    encodings = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = encodings.get(coding, encodings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """compress responses with the RESPONSE_COMPRESSION coding the client
+    prefers, br needs the brotli package. Like django's GZipMiddleware,
+    short responses are left alone and ETags become weak"""
+
+    def __init__(self, get_response):
+        self.encodings = [coding for coding in settings.RESPONSE_COMPRESSION
+                          if coding in COMPRESSORS]
+        if not self.encodings:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        if (not response.streaming and response.status_code != 304 and
+                len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = negotiate_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if coding is None:
+            return response
+
+        if response.status_code == 304:
+            # the ETag of the compressed response the client has
+            self.weaken_etag(response)
+            return response
+        if response.streaming:
+            if coding != 'gzip':
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            with timed(request, 'compress'):
+                content = COMPRESSORS[coding](response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        self.weaken_etag(response)
+        response['Content-Encoding'] = coding
+        return response
+
+    def weaken_etag(self, response):
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
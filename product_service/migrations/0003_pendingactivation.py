@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 17:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_service', '0002_product_variant_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingActivation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activate_at', models.DateTimeField(db_index=True)),
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_activation', to='product_service.Variant')),
+            ],
+        ),
+    ]
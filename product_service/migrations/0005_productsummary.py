@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 17:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_service', '0004_product_variant_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='product_service.Product')),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('is_active', models.BooleanField()),
+                ('created_at', models.DateTimeField()),
+                ('variants', models.TextField()),
+                ('variant_count', models.PositiveIntegerField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('total_stock', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productsummary',
+            index=models.Index(fields=['created_at', 'product'], name='summary_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the expressions product_service.search matches with, keep them in sync
+SEARCH_INDEXES = (
+    ('product_search_idx', 'product_service_product',
+     "to_tsvector('simple', name || ' ' || description)"),
+    ('variant_search_idx', 'product_service_variant',
+     "to_tsvector('simple', name)"),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    # other databases search with the in-process index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, expression in SEARCH_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {name} ON {table} USING gin ({expression})')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_service', '0005_productsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 18:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_service', '0006_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(fields=['price', 'product'], name='variant_price_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(fields=['stock', 'product'], name='variant_stock_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(fields=['weight', 'product'], name='variant_weight_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(fields=['height', 'product'], name='variant_height_product_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 18:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    # the single row every write updates, see product_service.catalog
+    CatalogVersion = apps.get_model('product_service', 'CatalogVersion')
+    CatalogVersion.objects.using(schema_editor.connection.alias).create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_service', '0009_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
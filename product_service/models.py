@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
 
 
 class Product(models.Model):
@@ -6,11 +7,30 @@ class Product(models.Model):
     description = models.TextField()
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # cursor pagination orders by (-created_at, -id), id breaks ties
+            # between products created at the same time
+            models.Index(fields=['created_at', 'id'],
+                         name='product_created_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class VariantQuerySet(models.QuerySet):
+    def limit_per_product(self, limit):
+        # keep only the first `limit` variants (by id) of every product, the
+        # limit is applied by the database with a correlated subquery so a
+        # prefetch never loads more than `limit` rows per product
+        first_variants = Variant.objects.filter(
+            product=OuterRef('product')).order_by('id').values('id')[:limit]
+        return self.filter(id__in=Subquery(first_variants)).order_by('id')
+
+
 class Variant(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='variants')
@@ -21,10 +41,103 @@ class Variant(models.Model):
     weight = models.DecimalField(max_digits=5, decimal_places=2)
     active_time = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # queryset.update() skips auto_now, set it explicitly there
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     is_active = models.BooleanField(default=True)
 
+    objects = VariantQuerySet.as_manager()
+
     class Meta:
         unique_together = ['product', 'name']
+        indexes = [
+            # first N variants of a product, see limit_per_product
+            models.Index(fields=['product', 'id'],
+                         name='variant_product_id_idx'),
+            # range filters, see filters.VariantFilterSet, product_id makes
+            # them covering for the IN (SELECT product_id ...) subquery
+            models.Index(fields=['price', 'product'],
+                         name='variant_price_product_idx'),
+            models.Index(fields=['stock', 'product'],
+                         name='variant_stock_product_idx'),
+            models.Index(fields=['weight', 'product'],
+                         name='variant_weight_product_idx'),
+            models.Index(fields=['height', 'product'],
+                         name='variant_height_product_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class PendingActivation(models.Model):
+    # variants waiting for their active_time, activated in batches by
+    # scheduler.activate_due_variants
+    variant = models.OneToOneField(
+        Variant, on_delete=models.CASCADE, related_name='pending_activation')
+    activate_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.variant_id} at {self.activate_at}'
+
+
+class ProductSummary(models.Model):
+    # denormalized read model of the product list, one row per product with
+    # its first VARIANT_LIMIT_PER_PRODUCT variants already rendered, kept up
+    # to date by summaries.refresh_product_summaries
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    name = models.CharField(max_length=255)
+    description = models.TextField()
+    is_active = models.BooleanField()
+    created_at = models.DateTimeField()
+    # JSON list of the rendered variants
+    variants = models.TextField()
+    variant_count = models.PositiveIntegerField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    total_stock = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'product'],
+                         name='summary_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class StockReservation(models.Model):
+    # stock taken by stock.reserve_stock, the key makes a retried request
+    # reserve only once
+    key = models.CharField(max_length=255, unique=True)
+    # JSON list of [variant_id, quantity], sorted by variant id
+    items = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.key
+
+
+class OutboxMessage(models.Model):
+    # celery task written in the transaction of the rows it's about, sent to
+    # the broker after the commit by outbox.relay_outbox
+    task = models.CharField(max_length=255)
+    # JSON list of the task arguments
+    args = models.TextField()
+    eta = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(db_index=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.task} {self.args}'
+
+
+class CatalogVersion(models.Model):
+    # one row, bumped in the transaction of every write to the products and
+    # variants, see catalog.py
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True)
@@ -0,0 +1,108 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from celery import current_app
+from celery.utils.imports import symbol_by_name
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+_executor = None
+
+
+def enqueue(task, args=(), eta=None):
+    """store a message for the task named `task` in the current transaction,
+    it's published after the commit and never when the transaction rolls
+    back"""
+    enqueue_many([(task, args, eta)])
+
+
+def enqueue_many(messages):
+    """(task, args, eta) of every message, one INSERT for all of them"""
+    now = timezone.now()
+    OutboxMessage.objects.bulk_create([
+        OutboxMessage(task=task, args=json.dumps(list(args)), eta=eta,
+                      next_attempt_at=now)
+        for task, args, eta in messages
+    ])
+    if messages:
+        transaction.on_commit(relay_after_commit)
+
+
+def relay_after_commit():
+    # a slow broker doesn't hold up the request, the relay runs on a thread
+    # of its own unless OUTBOX_RELAY_IN_BACKGROUND is off
+    global _executor
+    if not settings.OUTBOX_RELAY_IN_BACKGROUND:
+        relay_outbox()
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+    _executor.submit(_relay_in_background)
+
+
+def _relay_in_background():
+    try:
+        relay_outbox()
+    except Exception:
+        logging.exception("outbox relay failed")
+    finally:
+        # the connections of this thread
+        connections.close_all()
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def _publish(messages):
+    published = []
+    failed = []
+    # one broker connection for the batch
+    with current_app.producer_or_acquire() as producer:
+        for message in messages:
+            try:
+                symbol_by_name(message.task).apply_async(
+                    args=json.loads(message.args), eta=message.eta,
+                    producer=producer)
+            except Exception as e:
+                logging.warning(f"outbox message {message.id} not published: {e}")
+                failed.append((message, e))
+            else:
+                published.append(message.id)
+    return published, failed
+
+
+def relay_outbox(now=None):
+    """publish the due messages in batches of OUTBOX_BATCH_SIZE and delete
+    them, a message that fails is tried again later with a growing delay.
+    Returns how many were published. On postgresql concurrent relays skip
+    each other's batches, elsewhere a message may be published twice, the
+    tasks have to be idempotent"""
+    now = now or timezone.now()
+    n_published = 0
+    while True:
+        with transaction.atomic():
+            messages = list(OutboxMessage.objects.select_for_update(
+                skip_locked=True).filter(next_attempt_at__lte=now).order_by(
+                'id')[:settings.OUTBOX_BATCH_SIZE])
+            if not messages:
+                break
+            published, failed = _publish(messages)
+            OutboxMessage.objects.filter(id__in=published).delete()
+            for message, error in failed:
+                message.attempts += 1
+                OutboxMessage.objects.filter(id=message.id).update(
+                    attempts=message.attempts,
+                    next_attempt_at=now + retry_delay(message.attempts),
+                    last_error=str(error))
+        n_published += len(published)
+        if len(messages) < settings.OUTBOX_BATCH_SIZE:
+            break
+    if n_published > 0:
+        logging.info(f"{n_published} outbox messages published")
+    return n_published
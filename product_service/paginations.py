@@ -1,7 +1,51 @@
-from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
 from django.conf import settings
 
 
 class CustomPagination(CursorPagination):
     page_size = settings.PRODUCT_LIMIT_PER_PAGE
-    ordering = '-created_at'
+    ordering = ('-created_at', '-id')
+
+
+class ProductSummaryPagination(CustomPagination):
+    # same cursors as CustomPagination, the summary is keyed by product_id
+    ordering = ('-created_at', '-product_id')
+
+
+class SearchPagination(CustomPagination):
+    """keyset pagination over the (rank, product_id) of search results, the
+    cursor holds those of the last product of the page. Forward only, there
+    is no previous link"""
+
+    def paginate_search(self, search, request, view=None):
+        """search(after, limit) returns (rank, product_id) best first, the
+        product ids of the page are returned"""
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+
+        after = None
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                rank, product_id = cursor.position.split(':')
+                after = (float(rank), int(product_id))
+            except (AttributeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        ranked = search(after, self.page_size + 1)
+        self.has_next = len(ranked) > self.page_size
+        page = ranked[:self.page_size]
+        self.last_position = page[-1] if page else None
+        return [product_id for _, product_id in page]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        rank, product_id = self.last_position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=f'{rank!r}:{product_id}'))
+
+    def get_previous_link(self):
+        return None
@@ -0,0 +1,54 @@
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# decimals, lazy strings and whatever else the fast encoders don't know
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with orjson, several times faster than the json
+    module on big pages. Indented output (the browsable API,
+    `Accept: application/json; indent=4`) and a missing orjson fall back to
+    JSONRenderer. Unlike it \\u2028 and \\u2029 are not escaped, the output
+    is still valid JSON"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Z like the DRF encoder for UTC datetimes
+        return orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """compact binary format for service to service consumers, needs the
+    msgpack package. Datetimes are ISO strings like in JSON"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def product_renderer_classes():
+    """FastJSONRenderer first so it's the default, MessagePackRenderer only
+    when msgpack is installed"""
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    if msgpack is not None:
+        renderer_classes.append(MessagePackRenderer)
+    return renderer_classes
@@ -0,0 +1,65 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_DB = 'default'
+# set after a write, the client then reads from the primary until it expires
+READ_PRIMARY_COOKIE = 'read_primary'
+
+_local = threading.local()
+
+
+@contextmanager
+def read_from_replica():
+    previous = getattr(_local, 'replica', False)
+    _local.replica = True
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+class PrimaryReplicaRouter:
+    """writes always go to the primary, reads go to settings.DATABASE_REPLICA
+    only inside read_from_replica()"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects are read from where the instance was read from
+            return instance._state.db
+        if settings.DATABASE_REPLICA and getattr(_local, 'replica', False):
+            return settings.DATABASE_REPLICA
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
+
+
+class ReplicaReadMixin:
+    """viewset mixin, replica_actions read from the replica unless the client
+    wrote in the last DATABASE_REPLICA_STICKY_SECONDS"""
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if (action in self.replica_actions and
+                READ_PRIMARY_COOKIE not in request.COOKIES):
+            with read_from_replica():
+                return super().dispatch(request, *args, **kwargs)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if (settings.DATABASE_REPLICA and request.method not in SAFE_METHODS and
+                response.status_code < 400):
+            response.set_cookie(
+                READ_PRIMARY_COOKIE, '1', httponly=True,
+                max_age=settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
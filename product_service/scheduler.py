@@ -0,0 +1,84 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import timezones
+from .catalog import bump_catalog_version
+from .models import PendingActivation, Variant
+from .outbox import enqueue_many
+from .summaries import refresh_product_summaries, summary_product_ids
+
+ACTIVATE_VARIANTS_TASK = 'product_service.tasks.activate_variants'
+
+
+def schedule_activations(variants):
+    """store a pending activation for every inactive variant, they are
+    activated by the periodic sweep instead of one celery task each"""
+    pending = [
+        PendingActivation(variant_id=variant.id, activate_at=variant.active_time)
+        for variant in variants if not variant.is_active
+    ]
+    if len(pending) > 0:
+        PendingActivation.objects.bulk_create(pending)
+        publish_activations_before_next_sweep(pending)
+    return len(pending)
+
+
+def publish_activations_before_next_sweep(pending):
+    # the last sweep published the activations due before the next one
+    # without these, they go through the outbox so nothing is published
+    # when the transaction rolls back
+    until = timezones.now() + timedelta(seconds=settings.VARIANT_ACTIVATION_SWEEP_INTERVAL)
+    groups = group_by_due_time(
+        (activation.activate_at, activation.variant_id)
+        for activation in pending if activation.activate_at <= until)
+    enqueue_many([(ACTIVATE_VARIANTS_TASK, [variant_ids], due)
+                  for due, variant_ids in groups.items()])
+
+
+def activate_due_variants(now=None):
+    now = now or timezones.now()
+    with transaction.atomic():
+        due = PendingActivation.objects.filter(activate_at__lte=now)
+        variants = Variant.objects.filter(
+            pending_activation__activate_at__lte=now, is_active=False)
+        product_ids = summary_product_ids(variants)
+        n_activated = variants.update(is_active=True, updated_at=now)
+        due.delete()
+        refresh_product_summaries(product_ids)
+        if n_activated > 0:
+            bump_catalog_version()
+
+    if n_activated > 0:
+        logging.info(f"{n_activated} variants activated")
+    return n_activated
+
+
+def activate_variants(variant_ids):
+    """activate variants with one UPDATE of is_active, ids that are already
+    active or were deleted are skipped"""
+    with transaction.atomic():
+        variants = Variant.objects.filter(id__in=variant_ids, is_active=False)
+        product_ids = summary_product_ids(variants)
+        n_activated = variants.update(is_active=True, updated_at=timezones.now())
+        PendingActivation.objects.filter(variant_id__in=variant_ids).delete()
+        refresh_product_summaries(product_ids)
+        if n_activated > 0:
+            bump_catalog_version()
+
+    logging.info(f"{n_activated} of {len(variant_ids)} variants activated")
+    return n_activated
+
+
+def group_by_due_time(pending_activations):
+    """group (activate_at, variant_id) pairs by activate_at rounded up to the
+    second, every group can be activated by one task"""
+    groups = {}
+    for activate_at, variant_id in pending_activations:
+        due = activate_at.replace(microsecond=0)
+        if activate_at.microsecond:
+            due += timedelta(seconds=1)
+        groups.setdefault(due, []).append(variant_id)
+    return groups
@@ -0,0 +1,169 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router
+
+from .catalog import catalog_version
+from .models import Product, Variant
+
+# weights of the texts of a product, like the A, B and D weights of ts_rank
+NAME_WEIGHT = 1.0
+VARIANT_NAME_WEIGHT = 0.4
+DESCRIPTION_WEIGHT = 0.1
+
+# the expressions of the GIN indexes of migration 0006, the WHERE clauses
+# must repeat them exactly for postgresql to use the indexes
+POSTGRESQL_SEARCH = """
+WITH query AS (SELECT to_tsquery('simple', %s) AS q),
+matches AS (
+    SELECT product.id AS product_id,
+           ts_rank(setweight(to_tsvector('simple', product.name), 'A') ||
+                   setweight(to_tsvector('simple', product.description), 'D'),
+                   query.q) AS rank
+    FROM {product} AS product, query
+    WHERE to_tsvector('simple', product.name || ' ' || product.description) @@ query.q
+    UNION ALL
+    SELECT variant.product_id,
+           ts_rank(setweight(to_tsvector('simple', variant.name), 'B'), query.q)
+    FROM {variant} AS variant, query
+    WHERE to_tsvector('simple', variant.name) @@ query.q
+),
+ranked AS (
+    SELECT product_id, max(rank) AS rank FROM matches GROUP BY product_id
+)
+SELECT rank, product_id FROM ranked
+{after}
+ORDER BY rank DESC, product_id DESC
+LIMIT %s
+"""
+
+_index = None
+_index_state = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def search_terms(text):
+    """the words of a search that are used, none for a search without a
+    word, which lists the products like no search"""
+    return tokenize(text)[:settings.SEARCH_MAX_TERMS]
+
+
+class InvertedIndex:
+    """token -> {document: weight} of the product texts and the variant
+    names, the tokens are kept sorted so the tokens starting with a prefix
+    are next to each other"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        # product id of every document
+        self.products = []
+        self.tokens = []
+
+    def add(self, product_id, weighted_texts):
+        document = len(self.products)
+        self.products.append(product_id)
+        for text, weight in weighted_texts:
+            for token in tokenize(text):
+                postings = self.postings[token]
+                postings[document] = max(postings.get(document, 0), weight)
+
+    def freeze(self):
+        self.tokens = sorted(self.postings)
+        return self
+
+    def prefix_matches(self, prefix):
+        matches = {}
+        for token in self.tokens[bisect_left(self.tokens, prefix):]:
+            if not token.startswith(prefix):
+                break
+            for document, weight in self.postings[token].items():
+                matches[document] = max(matches.get(document, 0), weight)
+        return matches
+
+    def search(self, terms):
+        """(rank, product_id) of the products with a document matching every
+        term, best first"""
+        scores = None
+        for term in terms:
+            matches = self.prefix_matches(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {document: score + matches[document]
+                          for document, score in scores.items() if document in matches}
+            if not scores:
+                return []
+
+        ranks = {}
+        for document, score in scores.items():
+            product_id = self.products[document]
+            ranks[product_id] = max(ranks.get(product_id, 0), score)
+        return sorted(((rank, product_id) for product_id, rank in ranks.items()),
+                      reverse=True)
+
+
+def build_index():
+    index = InvertedIndex()
+    for product_id, name, description in Product.objects.values_list(
+            'id', 'name', 'description').iterator():
+        index.add(product_id, ((name, NAME_WEIGHT), (description, DESCRIPTION_WEIGHT)))
+    for product_id, name in Variant.objects.values_list(
+            'product_id', 'name').iterator():
+        index.add(product_id, ((name, VARIANT_NAME_WEIGHT),))
+    return index.freeze()
+
+
+def get_index():
+    """the in-process index of the catalog, rebuilt after it changed"""
+    global _index, _index_state
+    state = catalog_version()
+    with _index_lock:
+        if _index is None or _index_state != state:
+            _index, _index_state = build_index(), state
+        return _index
+
+
+def _postgresql_search(connection, terms, after, limit):
+    # every term is a prefix, `red shi` finds "Red Shirt"
+    query = ' & '.join(f'{term}:*' for term in terms)
+    params = [query]
+    condition = ''
+    if after is not None:
+        condition = 'WHERE (rank, product_id) < (%s::real, %s)'
+        params.extend(after)
+    params.append(limit)
+
+    quote_name = connection.ops.quote_name
+    sql = POSTGRESQL_SEARCH.format(
+        product=quote_name(Product._meta.db_table),
+        variant=quote_name(Variant._meta.db_table),
+        after=condition)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(rank, product_id) for rank, product_id in cursor.fetchall()]
+
+
+def search_products(text, after=None, limit=20):
+    """(rank, product_id) of the products whose name and description, or one
+    of whose variant names, have a word starting with every word of text.
+    Best first, `after` is the (rank, product_id) the page starts after.
+    postgresql uses the GIN indexes, other databases an in-process index"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+
+    connection = connections[router.db_for_read(Product)]
+    if connection.vendor == 'postgresql':
+        return _postgresql_search(connection, terms, after, limit)
+
+    ranked = get_index().search(terms)
+    if after is not None:
+        ranked = [item for item in ranked if item < tuple(after)]
+    return ranked[:limit]
@@ -1,17 +1,31 @@
-import pytz
-
-from datetime import datetime
 from rest_framework import serializers
 from django.conf import settings
+from django.db import IntegrityError, transaction
 
-from .utils import to_indonesia_timezone
+from .bloom import forget_product_names, names_maybe_taken, remember_product_names
+from .bulk_updates import UPDATE_FIELDS
+from .catalog import bump_catalog_version
+from .timezones import (
+    as_indonesia_time,
+    now as indonesia_now,
+    to_indonesia_timezone)
 from .models import Product, Variant
-from .tasks import activate_variant
+from .scheduler import schedule_activations
+from .summaries import refresh_product_summaries
 
 
 STATUS_FAILED = "failed"
 STATUS_SUCCESS = "success"
-INDONESIA_TIMEZONE = pytz.timezone('Asia/Jakarta')
+# the message of the UniqueValidator the name had
+NAME_TAKEN = "product with this name already exists."
+
+
+def saved_variants(products, variants):
+    # bulk_create only sets primary keys on postgresql, pending activations
+    # need them so fetch the inactive variants again when they are missing
+    if any(not variant.is_active and variant.id is None for variant in variants):
+        return Variant.objects.filter(product__in=products, is_active=False)
+    return variants
 
 
 class VariantSerializer(serializers.ModelSerializer):
@@ -19,14 +33,21 @@ class VariantSerializer(serializers.ModelSerializer):
         model = Variant
         fields = ('name', 'height', 'stock', 'price',
                   'weight', 'created_at', 'is_active', 'active_time')
+        # rendered as floats below, skip the str round trip of the decimals
+        extra_kwargs = {field: {'coerce_to_string': False}
+                        for field in ('height', 'price', 'weight')}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation.pop('active_time')
-        representation['created_at'] = to_indonesia_timezone(
-            representation['created_at'])
+        # the fields may be pruned, see fieldsets.py
+        representation.pop('active_time', None)
+        if 'created_at' in representation:
+            # convert the datetime itself, not its rendered ISO string
+            representation['created_at'] = to_indonesia_timezone(instance.created_at)
 
         for field in ['height', 'price', 'weight']:
+            if field not in representation:
+                continue
             representation[field] = float(representation[field])
             if field == 'price':
                 representation[field] = int(representation[field])
@@ -76,12 +97,37 @@ class CustromErrorSerializer(serializers.BaseSerializer):
             {"status": STATUS_FAILED, "message": message_string}, code=key)
 
 
+def name_taken(name):
+    """ValidationError of a save that failed on the unique product name,
+    the IntegrityError is raised again when the name is free"""
+    if not Product.objects.filter(name=name).exists():
+        return None
+    # the name filter of this process missed it
+    forget_product_names()
+    return serializers.ValidationError(
+        {"status": STATUS_FAILED, "message": {"name": [NAME_TAKEN]}})
+
+
 class ProductSerializer(serializers.ModelSerializer, CustromErrorSerializer):
     variants = VariantSerializer(many=True)
 
     class Meta:
         model = Product
         fields = ('name', 'description', 'variants', 'is_active', 'created_at')
+        # the unique constraint catches taken names on save instead of a
+        # SELECT per request, see validate_name and name_taken
+        extra_kwargs = {'name': {'validators': []}}
+
+    def validate_name(self, name):
+        # with PRODUCT_NAME_FILTER only the names that may be taken are
+        # looked up, so the error comes with the other field errors
+        if settings.PRODUCT_NAME_FILTER and names_maybe_taken([name]):
+            products = Product.objects.filter(name=name)
+            if self.instance is not None:
+                products = products.exclude(pk=self.instance.pk)
+            if products.exists():
+                raise serializers.ValidationError(NAME_TAKEN)
+        return name
 
     def validate_variants_name(self, variants_data):
         names = {}
@@ -94,45 +140,238 @@ class ProductSerializer(serializers.ModelSerializer, CustromErrorSerializer):
                 raise serializers.ValidationError(err_message)
             names[data['name']] = True
 
-    # this function also will update is_active value with background task
-    def save_variants(self, product, variants_data):
+    def build_variants(self, product, variants_data):
         variants = []
+        now = indonesia_now()
         for variant_data in variants_data:
-            variant_data['active_time'] = variant_data['active_time'].replace(
-                tzinfo=INDONESIA_TIMEZONE)
-            if variant_data['active_time'].strftime('%s') <= datetime.now(INDONESIA_TIMEZONE).strftime('%s'):
+            # active_time is the wall clock time in Indonesia
+            variant_data['active_time'] = as_indonesia_time(
+                variant_data['active_time'])
+            if variant_data['active_time'] <= now:
                 variant_data['is_active'] = True
             variants.append(Variant(product=product, **variant_data))
+        return variants
 
+    # inactive variants are activated at their active_time by the
+    # periodic sweep, see scheduler.py
+    def save_variants(self, product, variants_data):
+        variants = self.build_variants(product, variants_data)
         if len(variants) > 0:
-            saved_variants = Variant.objects.bulk_create(variants)
-            for variant in saved_variants:
-                if not variant.is_active:
-                    now = datetime.now(INDONESIA_TIMEZONE)
-                    countdown = int(variant.active_time.strftime(
-                        '%s')) - int(now.strftime('%s'))
-                    activate_variant.apply_async(
-                        kwargs={"variant_id": variant.id}, countdown=countdown
-                    )
+            variants = Variant.objects.bulk_create(variants)
+            schedule_activations(saved_variants([product], variants))
 
     def create(self, validated_data):
         variants_data = validated_data.pop('variants')
-        self.validate_variants_name(variants_data)
 
-        product = Product.objects.create(**validated_data)
-        self.save_variants(product, variants_data)
+        try:
+            with transaction.atomic():
+                product = Product.objects.create(**validated_data)
+                # after the insert, a taken name is reported before the
+                # variant names like the UniqueValidator did
+                self.validate_variants_name(variants_data)
+                self.save_variants(product, variants_data)
+                refresh_product_summaries([product.id])
+                bump_catalog_version()
+        except IntegrityError:
+            error = name_taken(validated_data['name'])
+            if error is None:
+                raise
+            raise error
+        remember_product_names([product.name])
 
         return product
 
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                instance = super().update(instance, validated_data)
+        except IntegrityError:
+            error = name_taken(validated_data.get('name', instance.name))
+            if error is None:
+                raise
+            raise error
+        remember_product_names([instance.name])
+        return instance
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation.pop('created_at')
+        representation.pop('created_at', None)
         return representation
 
 
 class ProductLimitVariantsSerializer(ProductSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['variants'] = representation['variants'][:
-                                                                settings.VARIANT_LIMIT_PER_PRODUCT]
+        if 'variants' in representation:
+            representation['variants'] = representation['variants'][:
+                                                                    settings.VARIANT_LIMIT_PER_PRODUCT]
         return representation
+
+
+class ProductBulkListSerializer(serializers.ListSerializer):
+    def is_valid(self, raise_exception=False):
+        if isinstance(self.initial_data, list) and \
+                len(self.initial_data) > settings.PRODUCT_BULK_CREATE_LIMIT:
+            self._validated_data = []
+            self._errors = {
+                "non_field_errors": [
+                    f"Ensure this list has at most {settings.PRODUCT_BULK_CREATE_LIMIT} products."]
+            }
+        else:
+            super().is_valid()
+
+        if isinstance(self._errors, list) and self.initial_data:
+            unique_errors = self.validate_unique_names(self.initial_data)
+            if any(unique_errors):
+                errors = self._errors or [{} for _ in self.initial_data]
+                self._errors = [dict(unique_error, **error)
+                                for error, unique_error in zip(errors, unique_errors)]
+                self._validated_data = []
+
+        if self._errors and raise_exception:
+            raise serializers.ValidationError(
+                {"status": STATUS_FAILED, "message": self.errors})
+
+        return not bool(self._errors)
+
+    def validate_unique_names(self, items):
+        # one query for the whole batch instead of a UniqueValidator per item
+        items = [item if isinstance(item, dict) else {} for item in items]
+        names = [item.get('name') for item in items]
+        maybe_taken = names_maybe_taken(
+            {name for name in names if isinstance(name, str)})
+        existing_names = set()
+        if maybe_taken:
+            existing_names = set(Product.objects.filter(
+                name__in=maybe_taken).values_list('name', flat=True))
+
+        errors = []
+        seen_names = set()
+        for item, name in zip(items, names):
+            error = {}
+            if name in existing_names or name in seen_names:
+                error['name'] = [NAME_TAKEN]
+            if isinstance(name, str):
+                seen_names.add(name)
+
+            variants = item.get('variants')
+            if isinstance(variants, list):
+                try:
+                    self.child.validate_variants_name(
+                        [variant for variant in variants
+                         if isinstance(variant, dict) and 'name' in variant])
+                except serializers.ValidationError as exc:
+                    error['variants'] = [exc.detail['message']]
+            errors.append(error)
+        return errors
+
+    def create(self, validated_data):
+        products = []
+        variants_data = []
+        for product_data in validated_data:
+            variants_data.append(product_data.pop('variants'))
+            products.append(Product(**product_data))
+
+        try:
+            self.save_products(products, variants_data)
+        except IntegrityError:
+            # a product with the same name was created by another request
+            # after validate_unique_names ran
+            forget_product_names()
+            raise serializers.ValidationError({
+                "status": STATUS_FAILED,
+                "message": "A product in this batch already exists."
+            })
+
+        remember_product_names([product.name for product in products])
+
+        return products
+
+    def save_products(self, products, variants_data):
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            if products and products[0].id is None:
+                # bulk_create only sets primary keys on postgresql
+                ids = dict(Product.objects.filter(
+                    name__in=[product.name for product in products]
+                ).values_list('name', 'id'))
+                for product in products:
+                    product.id = ids[product.name]
+
+            variants = []
+            for product, product_variants_data in zip(products, variants_data):
+                variants.extend(self.child.build_variants(
+                    product, product_variants_data))
+            variants = Variant.objects.bulk_create(
+                variants, batch_size=settings.VARIANT_BULK_CREATE_BATCH_SIZE)
+            schedule_activations(saved_variants(products, variants))
+            refresh_product_summaries([product.id for product in products])
+            bump_catalog_version()
+
+
+class ProductBulkCreateSerializer(ProductSerializer):
+    class Meta(ProductSerializer.Meta):
+        # product names are checked once for the whole batch, see
+        # ProductBulkListSerializer.validate_unique_names
+        list_serializer_class = ProductBulkListSerializer
+
+    def validate_name(self, name):
+        return name
+
+
+class StockItemSerializer(serializers.Serializer):
+    product = serializers.CharField(max_length=255)
+    variant = serializers.CharField(max_length=255)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class StockReservationSerializer(serializers.Serializer):
+    # the same key on a retried request reserves only once
+    idempotency_key = serializers.CharField(max_length=255)
+    items = StockItemSerializer(many=True)
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError("Ensure this list has at least 1 item.")
+        if len(items) > settings.STOCK_RESERVATION_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"Ensure this list has at most {settings.STOCK_RESERVATION_MAX_ITEMS} items.")
+        return items
+
+
+class VariantBulkUpdateListSerializer(serializers.ListSerializer):
+    def is_valid(self, raise_exception=False):
+        if isinstance(self.initial_data, list) and \
+                len(self.initial_data) > settings.VARIANT_BULK_UPDATE_LIMIT:
+            self._validated_data = []
+            self._errors = {
+                "non_field_errors": [
+                    f"Ensure this list has at most {settings.VARIANT_BULK_UPDATE_LIMIT} rows."]
+            }
+            return False
+        return super().is_valid(raise_exception)
+
+
+class VariantUpdateSerializer(serializers.ModelSerializer):
+    # the variant is picked by its id or by its product and variant names
+    id = serializers.IntegerField(min_value=1, required=False)
+    product = serializers.CharField(max_length=255, required=False)
+    variant = serializers.CharField(max_length=255, required=False)
+
+    class Meta:
+        model = Variant
+        fields = ('id', 'product', 'variant', 'price', 'stock', 'weight', 'is_active')
+        extra_kwargs = {field: {'required': False} for field in UPDATE_FIELDS}
+        # the PositiveIntegerField check only runs in the database
+        extra_kwargs['stock']['min_value'] = 0
+        list_serializer_class = VariantBulkUpdateListSerializer
+
+    def validate(self, data):
+        names = [field for field in ('product', 'variant') if field in data]
+        if ('id' in data) == bool(names) or len(names) == 1:
+            raise serializers.ValidationError(
+                "Give either the variant id or the product and variant names.")
+        if not any(field in data for field in UPDATE_FIELDS):
+            raise serializers.ValidationError(
+                "Give at least one of price, stock, weight and is_active.")
+        return data
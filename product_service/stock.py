@@ -0,0 +1,124 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import StockReservation, Variant
+from .summaries import refresh_product_summaries, summary_product_ids
+
+
+class OutOfStock(Exception):
+    pass
+
+
+class ReservationConflict(Exception):
+    pass
+
+
+def resolve_variants(items):
+    """{variant_id: quantity} of (product name, variant name, quantity)
+    items, the quantities of the same variant are added up. Raises
+    ValueError when a variant does not exist"""
+    names = {(product, variant) for product, variant, _ in items}
+    rows = Variant.objects.filter(reduce(or_, (
+        Q(product__name=product, name=variant) for product, variant in names))
+    ).values_list('product__name', 'name', 'id')
+    ids = {(product, variant): variant_id for product, variant, variant_id in rows}
+
+    quantities = {}
+    for product, variant, quantity in items:
+        variant_id = ids.get((product, variant))
+        if variant_id is None:
+            raise ValueError(f"variant '{variant}' of '{product}' does not exist")
+        quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+    return quantities
+
+
+def _per_variant(quantities):
+    # one CASE for the whole batch, the rows are updated by one statement
+    if len(quantities) == 1:
+        return Value(next(iter(quantities.values())))
+    return Case(*[When(id=variant_id, then=Value(quantity))
+                  for variant_id, quantity in quantities.items()],
+                output_field=models.PositiveIntegerField())
+
+
+def _refresh_summaries(variant_ids):
+    refresh_product_summaries(summary_product_ids(
+        Variant.objects.filter(id__in=variant_ids)))
+
+
+def _count(quantities):
+    return sum(quantities.values()), len(quantities)
+
+
+def reserve_stock(key, items):
+    """take the stock of every item or of none, returns (n_item, n_variant,
+    created). Another call with the same key returns the first result
+    without taking the stock again. Raises ValueError, OutOfStock and
+    ReservationConflict"""
+    quantities = resolve_variants(items)
+    payload = json.dumps(sorted(quantities.items()))
+
+    reservation = StockReservation.objects.filter(key=key).first()
+    if reservation is not None:
+        return _replay(reservation, payload, quantities)
+
+    needed = _per_variant(quantities)
+    try:
+        with transaction.atomic():
+            StockReservation.objects.create(key=key, items=payload)
+            # the stock check and the decrement are one conditional UPDATE,
+            # the rows stay locked only until the commit right after it
+            n_updated = Variant.objects.filter(
+                id__in=list(quantities), stock__gte=needed
+            ).update(stock=F('stock') - needed, updated_at=timezone.now())
+            if n_updated < len(quantities):
+                raise OutOfStock(_shortage(quantities))
+            bump_catalog_version()
+    except IntegrityError:
+        # a concurrent request with the same key won
+        return _replay(StockReservation.objects.get(key=key), payload, quantities)
+
+    # after the commit, the summaries lock the products, not the variants
+    _refresh_summaries(list(quantities))
+    return _count(quantities) + (True,)
+
+
+def _replay(reservation, payload, quantities):
+    if reservation.items != payload:
+        raise ReservationConflict(
+            f"idempotency key '{reservation.key}' was used for other items")
+    return _count(quantities) + (False,)
+
+
+def _shortage(quantities):
+    short = Variant.objects.filter(
+        id__in=list(quantities), stock__lt=_per_variant(quantities)
+    ).values_list('product__name', 'name').order_by('id').first()
+    if short is None:
+        return 'not enough stock'
+    return f"not enough stock for variant '{short[1]}' of '{short[0]}'"
+
+
+def release_stock(key):
+    """give back the stock of a reservation, returns (n_item, n_variant).
+    Releasing it again does nothing. Raises StockReservation.DoesNotExist"""
+    with transaction.atomic():
+        n_released = StockReservation.objects.filter(
+            key=key, released_at__isnull=True).update(released_at=timezone.now())
+        reservation = StockReservation.objects.get(key=key)
+        quantities = dict(json.loads(reservation.items))
+        if n_released:
+            returned = _per_variant(quantities)
+            Variant.objects.filter(id__in=list(quantities)).update(
+                stock=F('stock') + returned, updated_at=timezone.now())
+            bump_catalog_version()
+
+    if n_released:
+        _refresh_summaries(list(quantities))
+    return _count(quantities)
@@ -0,0 +1,162 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import (
+    PRODUCT_VALUES,
+    VARIANT_VALUES,
+    prepare_variant_rows,
+    variant_serializer)
+from .models import Product, ProductSummary, Variant
+
+# products per query, keeps the `IN` lists below the sqlite variable limit
+SUMMARY_CHUNK_SIZE = 500
+SUMMARY_VALUES = ('product_id', 'name', 'description', 'is_active',
+                  'created_at', 'variants')
+SUMMARY_FIELDS = ('name', 'description', 'is_active', 'created_at', 'variants',
+                  'variant_count', 'min_price', 'max_price', 'total_stock')
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _chunks(ids, size=SUMMARY_CHUNK_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def build_summaries(product_ids):
+    """unsaved ProductSummary of every existing product of product_ids"""
+    product_ids = list(product_ids)
+    totals = {
+        row['product_id']: row
+        for row in Variant.objects.filter(product_id__in=product_ids)
+        .order_by().values('product_id').annotate(
+            variant_count=Count('id'), min_price=Min('price'),
+            max_price=Max('price'), total_stock=Sum('stock'))
+    }
+    variants = {product_id: [] for product_id in product_ids}
+    rows = Variant.objects.limit_per_product(
+        settings.VARIANT_LIMIT_PER_PRODUCT).filter(
+        product_id__in=product_ids).values(*VARIANT_VALUES)
+    for row in prepare_variant_rows(list(rows)):
+        variants[row['product_id']].append(variant_serializer.to_representation(row))
+
+    summaries = []
+    for product in Product.objects.filter(id__in=product_ids).values(*PRODUCT_VALUES):
+        total = totals.get(product['id'], {})
+        summaries.append(ProductSummary(
+            product_id=product['id'],
+            name=product['name'],
+            description=product['description'],
+            is_active=product['is_active'],
+            created_at=product['created_at'],
+            variants=_encoder.encode(variants[product['id']]),
+            variant_count=total.get('variant_count', 0),
+            min_price=total.get('min_price'),
+            max_price=total.get('max_price'),
+            total_stock=total.get('total_stock') or 0))
+    return summaries
+
+
+def save_summaries(product_ids):
+    """recompute the summaries of product_ids, returns how many were saved"""
+    n_saved = 0
+    for chunk in _chunks(product_ids):
+        with transaction.atomic():
+            # concurrent refreshes of the same products wait for each other
+            list(Product.objects.select_for_update().filter(
+                id__in=chunk).order_by('id').values_list('id', flat=True))
+            summaries = build_summaries(chunk)
+            ProductSummary.objects.filter(product_id__in=chunk).delete()
+            ProductSummary.objects.bulk_create(summaries)
+        n_saved += len(summaries)
+    return n_saved
+
+
+def refresh_product_summaries(product_ids):
+    """keep the summaries in step with a write to products or variants,
+    nothing to do while the list does not read from them"""
+    if not settings.PRODUCT_LIST_SUMMARY or not product_ids:
+        return
+    save_summaries(set(product_ids))
+
+
+def summary_product_ids(variants):
+    """ids of the products of a variant queryset, read before it's updated"""
+    if not settings.PRODUCT_LIST_SUMMARY:
+        return []
+    return list(variants.order_by().values_list('product_id', flat=True).distinct())
+
+
+def _product_id_chunks():
+    # keyset pagination on the product id
+    last_id = 0
+    while True:
+        ids = list(Product.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True)[:SUMMARY_CHUNK_SIZE])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def rebuild_product_summaries():
+    """recompute the summaries of every product"""
+    return sum(save_summaries(ids) for ids in _product_id_chunks())
+
+
+def check_product_summaries():
+    """(product_id, problem) of every summary that is missing or differs from
+    the one built from the products and variants now"""
+    problems = []
+    for ids in _product_id_chunks():
+        stored = ProductSummary.objects.in_bulk(ids)
+        for expected in build_summaries(ids):
+            summary = stored.get(expected.product_id)
+            if summary is None:
+                problems.append((expected.product_id, 'missing'))
+                continue
+            stale = [field for field in SUMMARY_FIELDS
+                     if getattr(summary, field) != getattr(expected, field)]
+            if stale:
+                problems.append(
+                    (expected.product_id, f"stale {', '.join(stale)}"))
+    return problems
+
+
+def summary_values(fieldset):
+    """columns of the summaries rendered with fieldset"""
+    return ('product_id', 'created_at') + tuple(
+        name for name in SUMMARY_VALUES if name in fieldset.product_fields)
+
+
+def serialize_summaries(rows, variant_limit, fieldset=None):
+    """rows are `ProductSummary.objects.values(*SUMMARY_VALUES)` rows, or
+    the summary_values of fieldset"""
+    if fieldset is not None:
+        return _serialize_pruned_summaries(rows, variant_limit, fieldset)
+    return [{
+        'name': row['name'],
+        'description': row['description'],
+        'variants': json.loads(row['variants'])[:variant_limit],
+        'is_active': row['is_active'],
+    } for row in rows]
+
+
+def _serialize_pruned_summaries(rows, variant_limit, fieldset):
+    results = []
+    for row in rows:
+        result = {}
+        for name in fieldset.product_fields:
+            if name == 'variants':
+                result[name] = [
+                    {field: variant[field] for field in fieldset.variant_fields}
+                    for variant in json.loads(row[name])[:variant_limit]]
+            else:
+                result[name] = row[name]
+        results.append(result)
+    return results
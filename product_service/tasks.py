@@ -1,12 +1,47 @@
 import logging
+from datetime import timedelta
+
 from celery import shared_task
+from django.conf import settings
 
-from .models import Variant
+from . import outbox, scheduler, timezones
+from .models import PendingActivation
 
 
 @shared_task
 def activate_variant(variant_id):
-    variant = Variant.objects.get(pk=variant_id)
-    variant.is_active = True
-    variant.save()
-    logging.info(f"variant '{variant.name}' with id {variant_id} activated")
+    # kept for countdown messages published before activations were batched
+    return scheduler.activate_variants([variant_id])
+
+
+@shared_task
+def activate_variants(variant_ids):
+    return scheduler.activate_variants(variant_ids)
+
+
+def publish_upcoming_activations(now, interval):
+    # variants due before the next sweep are activated on time by one task per
+    # due second instead of waiting for the next sweep
+    upcoming = PendingActivation.objects.filter(
+        activate_at__gt=now, activate_at__lte=now + timedelta(seconds=interval)
+    ).values_list('activate_at', 'variant_id')
+    groups = scheduler.group_by_due_time(upcoming)
+    for due, variant_ids in groups.items():
+        activate_variants.apply_async(args=[variant_ids], eta=due)
+    if len(groups) > 0:
+        logging.info(f"{len(groups)} activation tasks published")
+    return len(groups)
+
+
+@shared_task
+def sweep_variant_activations():
+    now = timezones.now()
+    n_activated = scheduler.activate_due_variants(now)
+    publish_upcoming_activations(now, settings.VARIANT_ACTIVATION_SWEEP_INTERVAL)
+    return n_activated
+
+
+@shared_task
+def relay_outbox():
+    # messages the relay after the commit could not publish
+    return outbox.relay_outbox()
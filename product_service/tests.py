@@ -1,13 +1,64 @@
+import asyncio
+import gzip
 import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+from django.http import QueryDict
 from django.utils import timezone
 from datetime import datetime, timedelta
-from django.test import TestCase
+from decimal import Decimal
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIRequestFactory
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
 
-from .models import Product, Variant
-from .serializers import ProductSerializer, INDONESIA_TIMEZONE
+from .benchmarks import bench_concurrency, bench_timezones, compare, run_suite
+from .db.pool import ConnectionPool, PoolTimeout, pool_stats
+from .db.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from .bloom import BloomFilter, forget_product_names, names_maybe_taken
+from .bulk_updates import find_variants
+from .catalog import bump_catalog_version, catalog_version
+from .cache import (SizeBoundedLocMemCache, cache_stats, check_list_cache,
+                    reset_cache_stats)
+from .fast_serializers import serialize_products
+from .fieldsets import VARIANT_FIELDS, parse_fieldset, pruned_serializer
+from .imports import ProductImporter
+from .metrics import registry, similar_queries
+from .middleware import brotli, negotiate_encoding
+from .admin import VariantAdmin
+from .models import CatalogVersion, OutboxMessage, PendingActivation, Product, ProductSummary, StockReservation, Variant
+from .outbox import relay_outbox
+from .paginations import CustomPagination
+from .renderers import FastJSONRenderer, msgpack
+from .routers import READ_PRIMARY_COOKIE, PrimaryReplicaRouter, read_from_replica
+from .serializers import ProductSerializer, ProductLimitVariantsSerializer
+from .scheduler import activate_due_variants, schedule_activations
+from .search import InvertedIndex
+from .summaries import check_product_summaries, rebuild_product_summaries
+from .timezones import (
+    INDONESIA_TIMEZONE,
+    as_indonesia_time,
+    parse_date,
+    to_indonesia_timezone,
+    to_indonesia_timezone_many)
+from .tasks import (
+    activate_variant,
+    activate_variants,
+    sweep_variant_activations)
 from .views import ProductViewSet
+from julo.asgi import WsgiToAsgi, application as asgi_application
 from julo.celery import app as celery_app
 
 
@@ -17,7 +68,7 @@ class ProductViewSetCreateTest(TestCase):
         self.view = ProductViewSet.as_view({'post': 'create', 'get': 'list'})
 
     def test_create_product_with_variants(self):
-        with patch("product_service.serializers.activate_variant.apply_async") as mock_activate_variant:
+        with patch("product_service.tasks.activate_variant.apply_async") as mock_activate_variant:
             mock_activate_variant.return_value = True
 
             data = {
@@ -50,9 +101,10 @@ class ProductViewSetCreateTest(TestCase):
             self.assertEqual(response.data['message'],
                              'success create 1 product with 2 variants')
             mock_activate_variant.assert_not_called()
+            self.assertEqual(PendingActivation.objects.count(), 0)
 
     def test_create_product_with_single_variant(self):
-        with patch("product_service.serializers.activate_variant.apply_async") as mock_activate_variant:
+        with patch("product_service.tasks.activate_variant.apply_async") as mock_activate_variant:
             mock_activate_variant.return_value = True
             data = {
                 "name": "Single Variant Product",
@@ -148,7 +200,7 @@ class ProductViewSetCreateTest(TestCase):
         self.assertEqual(response.status_code, 400)
 
     def test_create_product_with_variant_active_time_ahead(self):
-        with patch("product_service.serializers.activate_variant.apply_async") as mock_activate_variant:
+        with patch("product_service.tasks.activate_variant.apply_async") as mock_activate_variant:
             mock_activate_variant.return_value = True
             five_minutes_ahead = datetime.now(
                 INDONESIA_TIMEZONE) + timedelta(minutes=10)
@@ -176,8 +228,103 @@ class ProductViewSetCreateTest(TestCase):
             self.assertEqual(response.data['message'],
                              'success create 1 product with 1 variant')
 
-            # Variant with active time ahead should trigger the Celery task
-            mock_activate_variant.assert_called_once()
+            # Variant with active time ahead should be stored as a pending
+            # activation for the periodic sweep, not as a celery countdown
+            mock_activate_variant.assert_not_called()
+            self.assertEqual(PendingActivation.objects.count(), 1)
+
+
+class ProductNameUniquenessTest(TestCase):
+    def setUp(self):
+        forget_product_names()
+        self.addCleanup(forget_product_names)
+
+    def product_data(self, name):
+        return {"name": name, "description": "Description", "variants": [{
+            "name": "Variant 1", "height": 10.0, "stock": 100, "price": 10.0,
+            "weight": 0.5, "active_time": "2023-08-16T12:00:00Z"}]}
+
+    def post(self, path, data):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post(path, json.dumps(data),
+                                        content_type='application/json')
+        lookups = [query for query in queries if query['sql'].startswith('SELECT (1) AS "a"')]
+        return response, len(lookups)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'product {i}')
+        self.assertTrue(all(f'product {i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other {i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertFalse(bloom.full)
+
+    def test_taken_name_same_error(self):
+        taken = {'status': 'failed', 'message': {'name': ['product with this name already exists.']}}
+        Product.objects.create(name='Product 1', description='Description')
+        for name_filter in (False, True):
+            with self.settings(PRODUCT_NAME_FILTER=name_filter):
+                response, _ = self.post('/v1/products/', self.product_data('Product 1'))
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), taken)
+
+    def test_taken_name_before_duplicate_variant_names(self):
+        taken = {'status': 'failed', 'message': {'name': ['product with this name already exists.']}}
+        Product.objects.create(name='Product 1', description='Description')
+        data = self.product_data('Product 1')
+        data['variants'].append(dict(data['variants'][0]))
+        for name_filter in (False, True):
+            with self.settings(PRODUCT_NAME_FILTER=name_filter):
+                response, _ = self.post('/v1/products/', data)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), taken)
+        response, _ = self.post('/v1/products/bulk/', [data])
+        self.assertEqual(response.json()['message'][0]['name'], taken['message']['name'])
+        # a free name still gets the variant error and nothing is created
+        data['name'] = 'Product 2'
+        response, _ = self.post('/v1/products/', data)
+        self.assertEqual(response.json()['message'],
+                         "A variant with 'Variant 1' name already exists for the product.")
+        self.assertFalse(Product.objects.filter(name='Product 2').exists())
+
+    def test_free_name_is_not_looked_up(self):
+        for name_filter in (False, True):
+            with self.settings(PRODUCT_NAME_FILTER=name_filter):
+                response, n_lookup = self.post(
+                    '/v1/products/', self.product_data(f'Product {name_filter}'))
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(n_lookup, 0)
+        with self.settings(PRODUCT_NAME_FILTER=True):
+            self.assertEqual(names_maybe_taken(['Product True', 'Product 2']), ['Product True'])
+
+    @override_settings(PRODUCT_NAME_FILTER=True)
+    def test_name_missed_by_the_filter(self):
+        self.assertEqual(names_maybe_taken(['Product 1']), [])
+        # created by another process, this one's filter doesn't have it
+        Product.objects.create(name='Product 1', description='Description')
+        response, _ = self.post('/v1/products/', self.product_data('Product 1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], {'name': ['product with this name already exists.']})
+        # rebuilt from the table
+        self.assertEqual(names_maybe_taken(['Product 1']), ['Product 1'])
+
+    @override_settings(PRODUCT_NAME_FILTER=True)
+    def test_bulk_create_looks_up_the_names_it_may_have(self):
+        Product.objects.create(name='Product 1', description='Description')
+        names_maybe_taken([])
+        data = [self.product_data(f'Product {i}') for i in range(2, 5)]
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(self.client.post('/v1/products/bulk/', json.dumps(data),
+                                              content_type='application/json').status_code, 201)
+        self.assertFalse([query for query in queries if query['sql'].startswith(
+            'SELECT "product_service_product"."name" FROM')])
+
+        response = self.client.post('/v1/products/bulk/', json.dumps(
+            [self.product_data('Product 1'), self.product_data('Product 5')]),
+            content_type='application/json')
+        self.assertEqual(response.json()['message'], [
+            {'name': ['product with this name already exists.']}, {}])
 
 
 class ProductViewSetListTest(TestCase):
@@ -302,3 +449,1947 @@ class ProductViewSetListTest(TestCase):
 
         for product in response.data['results']:
             self.assertEqual(len(product['variants']) <= 2, True)
+
+
+@override_settings(PRODUCT_LIST_SUMMARY=True)
+class ProductViewSetSummaryListTest(ProductViewSetListTest):
+    """the list tests on the ProductSummary table, rebuilt before every
+    request as the tests write with the ORM"""
+
+    def setUp(self):
+        super().setUp()
+        view = self.view
+
+        def rebuild_and_list(request):
+            rebuild_product_summaries()
+            return view(request)
+        self.view = rebuild_and_list
+
+
+class ProductViewSetListVariantLimitTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'list'})
+
+    def create_products(self, n_product, n_variant):
+        for i in range(n_product):
+            product = Product.objects.create(
+                name=f'Product {n_variant}-{i}', description='Description')
+            Variant.objects.bulk_create([
+                Variant(product=product, name=f'Variant {j}', height=10.0, stock=100,
+                        price=10.0, weight=0.5, active_time=timezone.now())
+                for j in range(n_variant)
+            ])
+
+    def prefetched_variant_rows(self):
+        view = ProductViewSet(action='list')
+        products = list(view.get_queryset())
+        return sum(len(product.variants.all()) for product in products)
+
+    def test_prefetch_rows_bounded_by_variant_limit(self):
+        with self.settings(VARIANT_LIMIT_PER_PRODUCT=2):
+            self.create_products(3, 3)
+            self.assertEqual(self.prefetched_variant_rows(), 6)
+
+            Product.objects.all().delete()
+            self.create_products(3, 50)
+            self.assertEqual(self.prefetched_variant_rows(), 6)
+
+    def test_list_same_response_as_full_prefetch(self):
+        self.create_products(4, 5)
+
+        request = self.factory.get('/api/products/')
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+
+        queryset = Product.objects.prefetch_related(
+            'variants').order_by('-created_at')
+        expected = ProductLimitVariantsSerializer(queryset, many=True).data
+        self.assertEqual(JSONRenderer().render(response.data['results']),
+                         JSONRenderer().render(expected))
+
+    def test_list_query_count_does_not_grow_with_variants(self):
+        self.create_products(3, 40)
+        request = self.factory.get('/api/products/')
+        # the catalog version, the page and the variants
+        with self.assertNumQueries(3):
+            response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductListCursorTieBreakerTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'list'})
+
+    def test_cursor_pages_are_stable_when_created_at_collides(self):
+        created_at = timezone.now()
+        for i in range(25):
+            Product.objects.create(
+                name=f'Product {i}', description='Description')
+        Product.objects.update(created_at=created_at)
+
+        names = []
+        request = self.factory.get('/api/products/')
+        while request is not None:
+            response = self.view(request)
+            names.extend(product['name'] for product in response.data['results'])
+            next_url = response.data['next']
+            request = self.factory.get(next_url) if next_url else None
+
+        self.assertEqual(len(names), 25)
+        self.assertEqual(len(set(names)), 25)
+
+
+class ExplainProductListCommandTest(TestCase):
+    def test_explain_product_list(self):
+        out = StringIO()
+        call_command('explain_product_list',
+                     created_at_gte='01-01-2023', stdout=out)
+        output = out.getvalue()
+        self.assertIn('-- first page', output)
+        self.assertIn('-- cursor page', output)
+        self.assertIn('-- created_at range', output)
+        self.assertIn('-- variants prefetch', output)
+        self.assertIn('product_created_at_id_idx', output)
+
+    def test_explain_variant_filters(self):
+        out = StringIO()
+        call_command('explain_product_list', variant_filter=['price_lte=100'],
+                     stdout=out)
+        self.assertIn('-- variant filters', out.getvalue())
+        self.assertIn('variant_price_product_idx', out.getvalue())
+
+
+@override_settings(PRODUCT_LIST_CACHE='product_list')
+class ProductListCacheTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'list'})
+        caches['product_list'].clear()
+        reset_cache_stats()
+
+        product = Product.objects.create(
+            name='Product 1', description='Description 1')
+        self.variant = Variant.objects.create(
+            product=product, name='Variant 1', height=10.0, stock=100, price=10.0,
+            weight=0.5, active_time=timezone.now(), is_active=False)
+
+    def list_products(self, params=None):
+        request = self.factory.get('/api/products/', params or {})
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.list_products()
+        # only the catalog version, the page is not queried
+        with self.assertNumQueries(1):
+            second = self.list_products()
+
+        self.assertEqual(JSONRenderer().render(first.data),
+                         JSONRenderer().render(second.data))
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_filters_are_part_of_the_key(self):
+        self.list_products()
+        self.list_products({'created_at_gte': '01-01-2023'})
+        self.list_products({'created_at_lte': '01-01-2023'})
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 3})
+
+    def test_create_invalidates_cache(self):
+        self.list_products()
+        product_serializer = ProductSerializer(data={
+            "name": "Product 2",
+            "description": "Description 2",
+            "variants": [{
+                "name": "Variant 1",
+                "height": 10.0,
+                "stock": 100,
+                "price": 10.0,
+                "weight": 0.5,
+                "active_time": "2023-08-16T12:00:00Z"
+            }]
+        })
+        product_serializer.is_valid(raise_exception=True)
+        product_serializer.save()
+
+        response = self.list_products()
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    def test_activate_variant_invalidates_cache(self):
+        response = self.list_products()
+        self.assertFalse(response.data['results'][0]['variants'][0]['is_active'])
+
+        activate_variant(self.variant.id)
+
+        response = self.list_products()
+        self.assertTrue(response.data['results'][0]['variants'][0]['is_active'])
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    @override_settings(PRODUCT_LIST_CACHE_MAX_ENTRY_SIZE=10)
+    def test_oversized_pages_are_not_cached(self):
+        self.list_products()
+        self.list_products()
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+    @override_settings(PRODUCT_LIST_CACHE='shared', CACHES=dict(
+        settings.CACHES, shared={
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shared-list-test'}))
+    def test_shared_cache_stops_storing_over_max_size(self):
+        caches['shared'].clear()
+        with self.settings(PRODUCT_LIST_CACHE_MAX_SIZE=2):
+            self.list_products()
+            self.list_products()
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2})
+
+        caches['shared'].clear()
+        reset_cache_stats()
+        self.list_products()
+        self.list_products()
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_local_memory_cache_warns_in_the_checks(self):
+        self.assertEqual([error.id for error in check_list_cache(None)],
+                         ['product_service.W001'])
+        with override_settings(PRODUCT_LIST_CACHE=''):
+            self.assertEqual(check_list_cache(None), [])
+
+
+class SizeBoundedLocMemCacheTest(TestCase):
+    def test_evicts_oldest_entries_over_max_size(self):
+        cache = SizeBoundedLocMemCache(
+            'size-bounded-test', {'OPTIONS': {'MAX_SIZE': 1000}})
+        cache.clear()
+        for i in range(5):
+            cache.set(f'key-{i}', b'x' * 300)
+
+        self.assertIsNone(cache.get('key-0'))
+        self.assertIsNone(cache.get('key-1'))
+        self.assertIsNotNone(cache.get('key-2'))
+        self.assertIsNotNone(cache.get('key-4'))
+
+    def test_keeps_a_running_total(self):
+        cache = SizeBoundedLocMemCache(
+            'size-total-test', {'OPTIONS': {'MAX_SIZE': 1000}})
+        cache.clear()
+        cache.set('a', b'x' * 300)
+        size = cache._usage.total
+        cache.set('a', b'x' * 300)
+        cache.set('b', b'x' * 300)
+        self.assertEqual(cache._usage.total, 2 * size)
+        cache.delete('a')
+        self.assertEqual(cache._usage.total, size)
+        cache.set('c', b'x' * 300, timeout=0)
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache._usage.total, size)
+        cache.clear()
+        self.assertEqual(cache._usage.total, 0)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Product 1', description='Description 1')
+        self.variant = Variant.objects.create(
+            product=self.product, name='Variant 1', height=10.0, stock=100,
+            price=10.0, weight=0.5, active_time=timezone.now())
+        self.detail_url = f'/v1/products/{self.product.id}/'
+        bump_catalog_version()
+        # before the writes of the tests, HTTP dates only have seconds
+        CatalogVersion.objects.update(changed_at=timezone.now() - timedelta(days=1))
+
+    def test_list_not_modified(self):
+        response = self.client.get('/v1/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('Last-Modified', response)
+
+        # only the catalog version is read, the page is not
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                '/v1/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(
+            '/v1/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # a delete moves Last-Modified too
+        self.client.delete(self.detail_url)
+        modified = self.client.get(
+            '/v1/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.json()['results'], [])
+
+    def test_list_etag_changes_with_variants_and_query(self):
+        etag = self.client.get('/v1/products/')['ETag']
+        self.assertNotEqual(
+            self.client.get('/v1/products/?is_active=true')['ETag'], etag)
+
+        self.client.patch('/v1/variants/bulk/', json.dumps([
+            {'id': self.variant.id, 'stock': 50}]), content_type='application/json')
+        response = self.client.get('/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_changes_on_delete(self):
+        etag = self.client.get('/v1/products/')['ETag']
+        self.client.delete(self.detail_url)
+        response = self.client.get('/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    @override_settings(PRODUCT_LIST_CACHE='product_list')
+    def test_cached_list_sees_writes_of_other_processes(self):
+        caches['product_list'].clear()
+        etag = self.client.get('/v1/products/')['ETag']
+        # a write of another process, the pages cached here are left as is
+        Variant.objects.filter(id=self.variant.id).update(stock=50)
+        bump_catalog_version()
+        response = self.client.get('/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['variants'][0]['stock'], 50)
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.product.variants.create(
+            name='Variant 2', height=10.0, stock=100, price=10.0, weight=0.5,
+            active_time=timezone.now())
+        modified = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(len(modified.json()['variants']), 2)
+
+    def test_detail_of_missing_product(self):
+        response = self.client.get('/v1/products/0/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    @override_settings(PRODUCT_CACHE_CONTROL={'retrieve': 'public, max-age=30'})
+    def test_cache_control_per_action(self):
+        self.assertEqual(self.client.get(self.detail_url)['Cache-Control'],
+                         'public, max-age=30')
+        self.assertNotIn('Cache-Control', self.client.get('/v1/products/'))
+
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        for i in range(1, 3):
+            product = Product.objects.create(
+                name=f'Product {i}', description=f'Description {i}')
+            for j in range(3):
+                Variant.objects.create(
+                    product=product, name=f'Variant {j}', height=10.0, stock=100,
+                    price=10.0 + j, weight=0.5, active_time=timezone.now())
+
+    def list_results(self, query):
+        response = self.client.get(f'/v1/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_parse_fieldset(self):
+        self.assertIsNone(parse_fieldset(QueryDict('')))
+        self.assertIsNone(parse_fieldset(QueryDict('expand=variants')))
+        self.assertEqual(parse_fieldset(QueryDict('fields=is_active,name')),
+                         (('name', 'is_active'), None))
+        self.assertEqual(parse_fieldset(QueryDict('fields=name,variants.price')),
+                         (('name', 'variants'), ('price',)))
+        self.assertEqual(
+            parse_fieldset(QueryDict('fields=name&expand=variants')).variant_fields,
+            VARIANT_FIELDS)
+        for query in ('fields=price', 'fields=variants.id', 'expand=product'):
+            with self.assertRaises(ValueError):
+                parse_fieldset(QueryDict(query))
+
+    def test_list_fields_are_the_same_on_every_path(self):
+        expected = [
+            {'name': f'Product {i}', 'variants': [{'price': 10}, {'price': 11}]}
+            for i in (2, 1)
+        ]
+        self.assertEqual(self.list_results('fields=name,variants.price'), expected)
+        with override_settings(PRODUCT_LIST_FAST_SERIALIZER=True):
+            self.assertEqual(self.list_results('fields=name,variants.price'), expected)
+        rebuild_product_summaries()
+        with override_settings(PRODUCT_LIST_SUMMARY=True):
+            self.assertEqual(self.list_results('fields=name,variants.price'), expected)
+
+    def test_list_without_variants_skips_the_prefetch(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            results = self.list_results('fields=name')
+        self.assertEqual(results, [{'name': 'Product 2'}, {'name': 'Product 1'}])
+        # the catalog version and the page
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+    def test_retrieve_fields(self):
+        product = Product.objects.get(name='Product 1')
+        response = self.client.get(
+            f'/v1/products/{product.id}/?fields=description&expand=variants')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ['description', 'variants'])
+        self.assertEqual(len(response.json()['variants']), 3)
+        self.assertNotEqual(response['ETag'],
+                            self.client.get(f'/v1/products/{product.id}/')['ETag'])
+
+    def test_unknown_field(self):
+        response = self.client.get('/v1/products/?fields=name,price')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(),
+                         {'status': 'failed', 'message': "unknown field 'price'"})
+
+    def test_pruned_serializers_are_cached(self):
+        fieldset = parse_fieldset(QueryDict('fields=name,variants.price'))
+        self.assertIs(pruned_serializer(ProductSerializer, fieldset),
+                      pruned_serializer(ProductSerializer, fieldset))
+
+    @override_settings(PRODUCT_LIST_CACHE='product_list')
+    def test_fields_are_part_of_the_cache_key(self):
+        caches['product_list'].clear()
+        self.assertIn('description', self.list_results('')[0])
+        self.assertEqual(self.list_results('fields=name')[0], {'name': 'Product 2'})
+
+
+class ResponseFormatTest(TestCase):
+    def setUp(self):
+        for i in range(20):
+            product = Product.objects.create(
+                name=f'Product {i}', description='Description ' * 10)
+            Variant.objects.create(
+                product=product, name='Variant 1', height=10.5, stock=100,
+                price=15000.99, weight=0.75, active_time=timezone.now())
+
+    def test_negotiate_encoding(self):
+        available = ('br', 'gzip')
+        self.assertEqual(negotiate_encoding('gzip, deflate, br', available), 'br')
+        self.assertEqual(negotiate_encoding('br;q=0.5, gzip', available), 'gzip')
+        self.assertEqual(negotiate_encoding('*', available), 'br')
+        self.assertIsNone(negotiate_encoding('gzip;q=0, deflate', available))
+        self.assertIsNone(negotiate_encoding('', available))
+
+    def test_gzip(self):
+        plain = self.client.get('/v1/products/')
+        response = self.client.get('/v1/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], f"W/{plain['ETag']}")
+
+        not_modified = self.client.get(
+            '/v1/products/', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024 * 1024)
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/v1/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get('/v1/products/')
+        response = self.client.get('/v1/products/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_fast_json_is_the_same_as_json(self):
+        data = {'price': Decimal('15000.99'), 'names': ['Product \u2013 1'],
+                'created_at': to_indonesia_timezone(timezone.now()),
+                'updated_at': datetime(2023, 8, 1, tzinfo=timezone.utc)}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)),
+                         json.loads(JSONRenderer().render(data)))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'))
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.client.get('/v1/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content),
+                         self.client.get('/v1/products/').json())
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        for name, description, variant_name in (
+                ('Red Shirt', 'cotton', 'Large'),
+                ('Blue Jeans', 'denim with red stitching', 'Slim'),
+                ('Hat', 'wool', 'Red Cap'),
+                ('Sock', 'wool', 'Small')):
+            product = Product.objects.create(name=name, description=description)
+            Variant.objects.create(
+                product=product, name=variant_name, height=10.0, stock=100,
+                price=10.0, weight=0.5, active_time=timezone.now())
+        # the ORM writes of the tests skip the bump of the API writes
+        bump_catalog_version()
+
+    def search(self, query, **params):
+        response = self.client.get('/v1/products/', dict(params, search=query))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, query):
+        return [product['name'] for product in self.search(query)['results']]
+
+    def test_ranked_by_where_the_words_are(self):
+        # product name, then variant name, then description
+        self.assertEqual(self.names('red'), ['Red Shirt', 'Hat', 'Blue Jeans'])
+        self.assertEqual(self.names('RED  shi'), ['Red Shirt'])
+        self.assertEqual(self.names('wool small'), [])
+        self.assertEqual(self.names('sl'), ['Blue Jeans'])
+
+    def test_search_without_words_is_the_plain_list(self):
+        for query in ('', '  ', '!!!', '--'):
+            self.assertEqual(self.names(query), ['Sock', 'Hat', 'Blue Jeans', 'Red Shirt'])
+        response = self.client.get('/v1/products/', {'search': '!!!', 'stock_gte': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_results_are_rendered_like_the_list(self):
+        results = self.search('hat', fields='name,variants.name')['results']
+        self.assertEqual(results, [{'name': 'Hat', 'variants': [{'name': 'Red Cap'}]}])
+        with override_settings(PRODUCT_LIST_FAST_SERIALIZER=True):
+            self.assertEqual(self.search('hat', fields='name,variants.name')['results'],
+                             results)
+
+    def test_cursor_pages(self):
+        for i in range(25):
+            Product.objects.create(name=f'Item {i}', description='Description')
+        bump_catalog_version()
+
+        names = []
+        response = self.search('item')
+        while True:
+            names.extend(product['name'] for product in response['results'])
+            self.assertIsNone(response['previous'])
+            if response['next'] is None:
+                break
+            response = self.client.get(response['next']).json()
+        self.assertEqual(sorted(names), sorted(f'Item {i}' for i in range(25)))
+
+    def test_index_follows_the_catalog(self):
+        self.assertEqual(self.names('cap'), ['Hat'])
+        Variant.objects.filter(name='Red Cap').delete()
+        bump_catalog_version()
+        self.assertEqual(self.names('cap'), [])
+        Product.objects.create(name='Cap', description='cotton')
+        bump_catalog_version()
+        self.assertEqual(self.names('cap'), ['Cap'])
+        # unchanged until the next write
+        Product.objects.create(name='Cap 2', description='cotton')
+        self.assertEqual(self.names('cap'), ['Cap'])
+
+    def test_invalid_requests(self):
+        response = self.client.get('/v1/products/?search=red&cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(
+            '/v1/products/?search=red&created_at_gte=01-01-2023')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_inverted_index_prefixes(self):
+        index = InvertedIndex()
+        index.add(1, (('Red Shirt', 1.0),))
+        index.add(2, (('Redo', 0.4),))
+        index.freeze()
+        self.assertEqual(index.search(['red']), [(1.0, 1), (0.4, 2)])
+        self.assertEqual(index.search(['red', 'sh']), [(2.0, 1)])
+        self.assertEqual(index.search(['blue']), [])
+
+
+class VariantFilterTest(TestCase):
+    def setUp(self):
+        for name, variants in (
+                ('Product A', [(10, 0, 1.0, True), (100, 5, 1.0, True)]),
+                ('Product B', [(50, 3, 2.0, True)]),
+                ('Product C', [(5, 9, 0.5, False)])):
+            product = Product.objects.create(name=name, description='Description')
+            for i, (price, stock, weight, is_active) in enumerate(variants):
+                Variant.objects.create(
+                    product=product, name=f'Variant {i}', height=10.0, stock=stock,
+                    price=price, weight=weight, active_time=timezone.now(),
+                    is_active=is_active)
+
+    def names(self, query):
+        response = self.client.get(f'/v1/products/?fields=name&{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(product['name'] for product in response.json()['results'])
+
+    def test_filters_match_one_variant(self):
+        # the in-stock variant of Product A costs 100
+        self.assertEqual(self.names('stock_gte=1&price_lte=60'), ['Product B', 'Product C'])
+        self.assertEqual(self.names('stock_gte=1&price_lte=60&is_active=true'),
+                         ['Product B'])
+        self.assertEqual(self.names('price_lte=10'), ['Product A', 'Product C'])
+        self.assertEqual(self.names('weight_gte=1.5&weight_lte=2'), ['Product B'])
+        self.assertEqual(self.names('height_gte=11'), [])
+        self.assertEqual(self.names('is_active=False'), ['Product C'])
+        self.assertEqual(self.names('price_gte='),
+                         ['Product A', 'Product B', 'Product C'])
+
+    def test_filters_on_summaries(self):
+        rebuild_product_summaries()
+        with override_settings(PRODUCT_LIST_SUMMARY=True):
+            self.assertEqual(self.names('stock_gte=1&price_lte=60&is_active=true'),
+                             ['Product B'])
+
+    def test_one_query_for_the_page(self):
+        # the catalog version and the page, the variants are matched in a
+        # subquery of the page query
+        with self.assertNumQueries(2):
+            self.names('stock_gte=1&price_lte=60')
+
+    def test_invalid_values(self):
+        for query in ('price_lte=cheap', 'stock_gte=1.5', 'is_active=yes'):
+            response = self.client.get(f'/v1/products/?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'failed')
+
+        response = self.client.get('/v1/products/?search=product&price_lte=10')
+        self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Product 1', description='Description')
+        self.large, self.small = (
+            Variant.objects.create(
+                product=self.product, name=name, height=10.0, stock=stock,
+                price=10.0, weight=0.5, active_time=timezone.now())
+            for name, stock in (('Large', 5), ('Small', 2)))
+
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def reserve(self, key, *items):
+        return self.post('/v1/stock/reserve/', {'idempotency_key': key, 'items': [
+            {'product': 'Product 1', 'variant': variant, 'quantity': quantity}
+            for variant, quantity in items]})
+
+    def stocks(self):
+        return list(Variant.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_reserve_and_retry(self):
+        updated_at = self.large.updated_at
+        response = self.reserve('order-1', ('Large', 2), ('Small', 1), ('Large', 1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {
+            'status': 'success', 'message': 'success reserve 4 items of 2 variants'})
+        self.assertEqual(self.stocks(), [2, 1])
+        self.assertGreater(Variant.objects.get(id=self.large.id).updated_at, updated_at)
+
+        retried = self.reserve('order-1', ('Large', 3), ('Small', 1))
+        self.assertEqual(retried.status_code, 200)
+        self.assertEqual(retried.json(), response.json())
+        self.assertEqual(self.stocks(), [2, 1])
+
+        conflict = self.reserve('order-1', ('Large', 1))
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.json()['message'],
+                         "idempotency key 'order-1' was used for other items")
+
+    def test_all_or_nothing(self):
+        response = self.reserve('order-1', ('Large', 1), ('Small', 3))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {
+            'status': 'failed',
+            'message': "not enough stock for variant 'Small' of 'Product 1'"})
+        self.assertEqual(self.stocks(), [5, 2])
+        # the key was not used up
+        self.assertEqual(self.reserve('order-1', ('Large', 1), ('Small', 2)).status_code, 201)
+        self.assertEqual(self.stocks(), [4, 0])
+
+    def test_invalid_items(self):
+        for items in ([('Medium', 1)], [('Large', 0)], []):
+            response = self.reserve('order-1', *items)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'failed')
+        self.assertEqual(self.post('/v1/stock/reserve/', {'items': []}).status_code, 400)
+        self.assertEqual(self.stocks(), [5, 2])
+
+    def test_release(self):
+        self.reserve('order-1', ('Large', 2))
+        for _ in range(2):
+            response = self.post('/v1/stock/release/', {'idempotency_key': 'order-1'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['message'], 'success release 2 items of 1 variant')
+            self.assertEqual(self.stocks(), [5, 2])
+
+        response = self.post('/v1/stock/release/', {'idempotency_key': 'order-2'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.post('/v1/stock/release/', {}).status_code, 400)
+
+
+class VariantBulkUpdateTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Product 1', description='Description')
+        self.large, self.small = (
+            Variant.objects.create(
+                product=self.product, name=name, height=10.0, stock=5,
+                price=10.0, weight=0.5, active_time=timezone.now())
+            for name in ('Large', 'Small'))
+
+    def patch(self, rows):
+        return self.client.patch('/v1/variants/bulk/', json.dumps(rows),
+                                 content_type='application/json')
+
+    def values(self):
+        return list(Variant.objects.order_by('id').values_list(
+            'price', 'stock', 'weight', 'is_active'))
+
+    @override_settings(VARIANT_BULK_UPDATE_BATCH_SIZE=1)
+    def test_update_by_names_and_id(self):
+        updated_at = self.large.updated_at
+        response = self.patch([
+            {'product': 'Product 1', 'variant': 'Large', 'price': 20000, 'stock': 7},
+            {'id': self.small.id, 'weight': 1.25, 'is_active': False},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'status': 'success', 'message': 'success update 2 variants'})
+        self.assertEqual(self.values(), [
+            (Decimal('20000'), 7, Decimal('0.5'), True),
+            (Decimal('10'), 5, Decimal('1.25'), False)])
+        self.assertGreater(Variant.objects.get(id=self.large.id).updated_at, updated_at)
+
+    def test_names_match_the_exact_pairs(self):
+        other = Product.objects.create(name='Product 2', description='Description')
+        for name in ('Large', 'Small'):
+            Variant.objects.create(
+                product=other, name=name, height=10.0, stock=5, price=10.0,
+                weight=0.5, active_time=timezone.now())
+        rows = [{'product': 'Product 1', 'variant': 'Large'},
+                {'product': 'Product 2', 'variant': 'Small'}]
+        with CaptureQueriesContext(connections['default']) as queries:
+            found = find_variants(rows)
+        self.assertEqual(set(found), {('Product 1', 'Large'), ('Product 2', 'Small')})
+        self.assertEqual(found['Product 1', 'Large'], (self.large.id, self.product.id))
+        self.assertEqual(len(queries), 1)
+
+    def test_set_based_statements(self):
+        rows = [{'id': self.large.id, 'stock': 1}, {'id': self.small.id, 'price': 5}]
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(self.patch(rows).status_code, 200)
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE "product_service_variant"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.values(), [
+            (Decimal('10'), 1, Decimal('0.5'), True),
+            (Decimal('5'), 5, Decimal('0.5'), True)])
+
+    def test_errors_per_row(self):
+        response = self.patch([
+            {'id': self.large.id, 'stock': 1},
+            {'product': 'Product 1', 'variant': 'Medium', 'stock': 1},
+            {'product': 'Product 1', 'variant': 'Large', 'stock': 2},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'status': 'failed', 'message': [
+            {},
+            {'variant': ["variant 'Medium' of 'Product 1' does not exist"]},
+            {'non_field_errors': ['the variant is already updated by row 0']},
+        ]})
+
+        response = self.patch([
+            {'id': self.large.id, 'stock': -1},
+            {'product': 'Product 1', 'stock': 1},
+            {'id': self.small.id},
+            {'id': self.small.id, 'price': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['message']
+        self.assertEqual(list(errors[0]), ['stock'])
+        self.assertEqual(list(errors[1]), ['non_field_errors'])
+        self.assertEqual(list(errors[2]), ['non_field_errors'])
+        self.assertEqual(errors[3], {})
+        # nothing was applied
+        self.assertEqual([stock for _, stock, _, _ in self.values()], [5, 5])
+
+    @override_settings(VARIANT_BULK_UPDATE_LIMIT=1)
+    def test_limit(self):
+        response = self.patch([{'id': self.large.id, 'stock': 1}] * 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_is_active_cancels_pending_activation(self):
+        self.small.is_active = False
+        self.small.active_time = timezone.now() + timedelta(days=1)
+        self.small.save()
+        schedule_activations([self.small])
+        self.assertEqual(self.patch([{'id': self.small.id, 'is_active': True}]).status_code, 200)
+        self.assertFalse(PendingActivation.objects.exists())
+        self.assertEqual(Variant.objects.get(id=self.small.id).is_active, True)
+
+    @override_settings(PRODUCT_LIST_SUMMARY=True)
+    def test_refreshes_summaries(self):
+        rebuild_product_summaries()
+        self.patch([{'id': self.large.id, 'stock': 1, 'price': 99}])
+        summary = ProductSummary.objects.get(product=self.product)
+        self.assertEqual(summary.total_stock, 6)
+        self.assertEqual(summary.min_price, Decimal('10'))
+        self.assertEqual(summary.max_price, Decimal('99'))
+
+
+class StockReservationStressTest(TransactionTestCase):
+    # the requests run in other threads, so the test data is committed
+
+    def test_concurrent_reservations_never_oversell(self):
+        product = Product.objects.create(name='Product 1', description='Description')
+        variant = Variant.objects.create(
+            product=product, name='Hot', height=10.0, stock=50, price=10.0,
+            weight=0.5, active_time=timezone.now())
+        statuses = []
+        lock = threading.Lock()
+
+        def buyer(n):
+            client = Client()
+            try:
+                for i in range(10):
+                    data = json.dumps({'idempotency_key': f'order-{n}-{i}', 'items': [
+                        {'product': 'Product 1', 'variant': 'Hot', 'quantity': 1}]})
+                    # every request is sent twice, like a retry after a timeout
+                    for _ in range(2):
+                        response = client.post('/v1/stock/reserve/', data,
+                                               content_type='application/json')
+                        with lock:
+                            statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buyer, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 0)
+        self.assertEqual(statuses.count(201), 50)
+        self.assertEqual(StockReservation.objects.count(), 50)
+        # the retries of the 50 reservations, and both requests of the 30
+        # that came too late
+        self.assertEqual(statuses.count(200), 50)
+        self.assertEqual(statuses.count(409), 60)
+
+
+class FastSerializerTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'list'})
+
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Product {i}', description=f'Description {i}',
+                is_active=i % 2 == 0)
+            for j in range(3):
+                Variant.objects.create(
+                    product=product, name=f'Variant {j}', height=10.25, stock=j,
+                    price=15000.99, weight=0.7, active_time=timezone.now(),
+                    is_active=j != 1)
+
+    def render_list(self, params=None):
+        request = self.factory.get('/api/products/', params or {})
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        return JSONRenderer().render(response.data)
+
+    def test_same_json_as_drf_serializer(self):
+        expected = self.render_list()
+        with override_settings(PRODUCT_LIST_FAST_SERIALIZER=True):
+            self.assertEqual(self.render_list(), expected)
+
+    def test_same_json_with_cursor_and_filters(self):
+        with patch.object(CustomPagination, 'page_size', 1):
+            request = self.factory.get(
+                '/api/products/', {'created_at_gte': '01-01-2023'})
+            next_url = self.view(request).data['next']
+            expected = self.render_list(QueryDict(next_url.split('?')[1]))
+            self.assertIn(b'"Product 1"', expected)
+            with override_settings(PRODUCT_LIST_FAST_SERIALIZER=True):
+                self.assertEqual(
+                    self.render_list(QueryDict(next_url.split('?')[1])), expected)
+
+    @override_settings(PRODUCT_LIST_FAST_SERIALIZER=True)
+    def test_query_count(self):
+        request = self.factory.get('/api/products/')
+        with self.assertNumQueries(3):
+            self.view(request)
+
+    def test_serialize_products_without_rows(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(serialize_products([], 2), [])
+
+
+class ProductViewSetBulkCreateTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'post': 'bulk_create'})
+
+    def product_data(self, name, variant_names=('Variant 1', 'Variant 2'),
+                     active_time="2023-08-16T12:00:00Z", is_active=True):
+        return {
+            "name": name,
+            "description": f"Description of {name}",
+            "variants": [
+                {
+                    "name": variant_name,
+                    "height": 10.0,
+                    "stock": 100,
+                    "price": 10.0,
+                    "weight": 0.5,
+                    "active_time": active_time,
+                    "is_active": is_active
+                } for variant_name in variant_names
+            ]
+        }
+
+    def post(self, data):
+        request = self.factory.post(
+            '/api/products/bulk/', json.dumps(data), content_type='application/json')
+        return self.view(request)
+
+    def test_bulk_create_products_with_variants(self):
+        data = [self.product_data(f'Product {i}') for i in range(20)]
+        with self.assertNumQueries(7):
+            response = self.post(data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {
+            "status": "success",
+            "message": "success create 20 products with 40 variants"
+        })
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Variant.objects.count(), 40)
+        self.assertTrue(Variant.objects.filter(
+            product__name='Product 7', name='Variant 2').exists())
+
+    def test_bulk_create_reports_errors_per_item(self):
+        Product.objects.create(name='Existing Product', description='Description')
+        data = [
+            self.product_data('Product 1'),
+            self.product_data('Existing Product'),
+            self.product_data('Product 1'),
+            self.product_data('Product 2', variant_names=('Variant 1', 'Variant 1')),
+            dict(self.product_data('Product 3'), description=''),
+        ]
+        response = self.post(data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'failed')
+        errors = response.data['message']
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(errors[0], {})
+        self.assertIn('name', errors[1])
+        self.assertIn('name', errors[2])
+        self.assertEqual(errors[3]['variants'], [
+            "A variant with 'Variant 1' name already exists for the product."])
+        self.assertIn('description', errors[4])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_bulk_create_limit(self):
+        with self.settings(PRODUCT_BULK_CREATE_LIMIT=2):
+            response = self.post(
+                [self.product_data(f'Product {i}') for i in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_bulk_create_schedules_future_variants(self):
+        active_time = (datetime.now(INDONESIA_TIMEZONE) +
+                       timedelta(minutes=10)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        with patch("product_service.tasks.activate_variant.apply_async") as mock_activate_variant:
+            response = self.post([
+                self.product_data('Product 1', active_time=active_time,
+                                  is_active=False),
+                self.product_data('Product 2'),
+            ])
+        self.assertEqual(response.status_code, 201)
+        mock_activate_variant.assert_not_called()
+        self.assertEqual(set(PendingActivation.objects.values_list(
+            'variant__product__name', flat=True)), {'Product 1'})
+        self.assertEqual(PendingActivation.objects.count(), 2)
+
+
+class CeleryEagerTestMixin:
+    """run celery tasks in process, no broker is needed"""
+
+    def setUp(self):
+        super().setUp()
+        self._celery_conf = (celery_app.conf.task_always_eager,
+                             celery_app.conf.task_eager_propagates)
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_eager_propagates = True
+
+    def tearDown(self):
+        (celery_app.conf.task_always_eager,
+         celery_app.conf.task_eager_propagates) = self._celery_conf
+        super().tearDown()
+
+
+class VariantActivationSweepTest(CeleryEagerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        product = Product.objects.create(name='Product 1', description='Description')
+        variants = []
+        for i, minutes in enumerate([-10, -1, 5, 60]):
+            variants.append(Variant.objects.create(
+                product=product, name=f'Variant {i}', height=10.0, stock=100,
+                price=10.0, weight=0.5, is_active=False,
+                active_time=self.now + timedelta(minutes=minutes)))
+        schedule_activations(variants)
+
+    def test_sweep_activates_due_variants_in_one_update(self):
+        # savepoint, one UPDATE, one DELETE, the catalog version bump,
+        # release and the lookup of activations due before the next sweep
+        with self.assertNumQueries(6):
+            result = sweep_variant_activations.delay()
+
+        self.assertEqual(result.get(), 2)
+        self.assertEqual(set(Variant.objects.filter(is_active=True).values_list(
+            'name', flat=True)), {'Variant 0', 'Variant 1'})
+        self.assertEqual(PendingActivation.objects.count(), 2)
+
+    def test_sweep_later_activates_remaining_variants(self):
+        self.assertEqual(activate_due_variants(self.now), 2)
+        self.assertEqual(activate_due_variants(self.now), 0)
+        self.assertEqual(
+            activate_due_variants(self.now + timedelta(minutes=61)), 2)
+        self.assertEqual(Variant.objects.filter(is_active=False).count(), 0)
+        self.assertEqual(PendingActivation.objects.count(), 0)
+
+    def test_sweep_does_not_touch_variants_without_pending_activation(self):
+        PendingActivation.objects.all().delete()
+        self.assertEqual(sweep_variant_activations.delay().get(), 0)
+        self.assertEqual(Variant.objects.filter(is_active=False).count(), 4)
+
+    def test_create_then_sweep(self):
+        active_time = (datetime.now(INDONESIA_TIMEZONE) +
+                       timedelta(minutes=10)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        product_serializer = ProductSerializer(data={
+            "name": "Future Product",
+            "description": "Description",
+            "variants": [{
+                "name": "Future Variant",
+                "height": 8.0,
+                "stock": 75,
+                "price": 20.0,
+                "weight": 0.4,
+                "active_time": active_time,
+                "is_active": False
+            }]
+        })
+        product_serializer.is_valid(raise_exception=True)
+        product = product_serializer.save()
+
+        variant = product.variants.get()
+        self.assertEqual(variant.pending_activation.activate_at, variant.active_time)
+        activate_due_variants(variant.active_time)
+        variant.refresh_from_db()
+        self.assertTrue(variant.is_active)
+
+
+class BatchVariantActivationTest(CeleryEagerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        product = Product.objects.create(name='Product 1', description='Description')
+        self.variants = [
+            Variant.objects.create(
+                product=product, name=f'Variant {i}', height=10.0, stock=100,
+                price=10.0, weight=0.5, is_active=False,
+                active_time=self.now + timedelta(seconds=10))
+            for i in range(3)
+        ]
+        schedule_activations(self.variants)
+
+    def test_activate_variants_in_one_update(self):
+        variant_ids = [variant.id for variant in self.variants]
+        with self.assertLogs(level='INFO') as logs:
+            # and the catalog version bump
+            with self.assertNumQueries(5):
+                result = activate_variants.delay(variant_ids)
+
+        self.assertEqual(result.get(), 3)
+        self.assertEqual(Variant.objects.filter(is_active=True).count(), 3)
+        self.assertEqual(PendingActivation.objects.count(), 0)
+        self.assertEqual(
+            [record.getMessage() for record in logs.records if record.name == 'root'],
+            ['3 of 3 variants activated'])
+
+    def test_activate_variants_is_idempotent(self):
+        Variant.objects.filter(id=self.variants[0].id).update(is_active=True)
+        self.variants[1].delete()
+
+        variant_ids = [variant.id for variant in self.variants] + [999999]
+        self.assertEqual(activate_variants.delay(variant_ids).get(), 1)
+        self.assertEqual(activate_variants.delay(variant_ids).get(), 0)
+
+    def test_activate_variant_with_deleted_id(self):
+        self.assertEqual(activate_variant.delay(999999).get(), 0)
+        self.assertEqual(activate_variant.delay(self.variants[0].id).get(), 1)
+
+    def test_sweep_publishes_one_task_per_due_second(self):
+        later = self.now + timedelta(seconds=20)
+        variant = Variant.objects.create(
+            product=self.variants[0].product, name='Variant later', height=10.0,
+            stock=100, price=10.0, weight=0.5, is_active=False, active_time=later)
+        schedule_activations([variant])
+
+        with patch("product_service.tasks.activate_variants.apply_async") as mock_apply_async:
+            with patch("product_service.tasks.timezones.now", return_value=self.now):
+                sweep_variant_activations.delay()
+
+        self.assertEqual(mock_apply_async.call_count, 2)
+        published = sorted(
+            (call[1]['eta'], sorted(call[1]['args'][0]))
+            for call in mock_apply_async.call_args_list)
+        self.assertEqual(published[0][1], sorted(v.id for v in self.variants))
+        self.assertEqual(published[1][1], [variant.id])
+        self.assertGreaterEqual(published[0][0], self.variants[0].active_time)
+
+
+class OutboxTest(CeleryEagerTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Product 1', description='Description')
+        self.later = timezone.now() + timedelta(seconds=10)
+
+    def schedule_variants(self, n_variant=1):
+        variants = [
+            Variant.objects.create(
+                product=self.product, name=f'Variant {i}', height=10.0, stock=100,
+                price=10.0, weight=0.5, is_active=False, active_time=self.later)
+            for i in range(n_variant)]
+        schedule_activations(variants)
+        return variants
+
+    def test_create_publishes_after_commit(self):
+        active_time = (datetime.now(INDONESIA_TIMEZONE) + timedelta(seconds=10)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ")
+        data = {"name": "Product 2", "description": "Description", "variants": [{
+            "name": "Variant 1", "height": 10.0, "stock": 100, "price": 10.0,
+            "weight": 0.5, "active_time": active_time, "is_active": False}]}
+        response = self.client.post('/v1/products/', json.dumps(data),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        # published once committed, the eager task ignores the eta
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertTrue(Variant.objects.get(product__name='Product 2').is_active)
+        self.assertFalse(PendingActivation.objects.exists())
+
+    def test_import_publishes_after_commit(self):
+        active_time = (datetime.now(INDONESIA_TIMEZONE) + timedelta(seconds=10)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ")
+        importer = ProductImporter()
+        importer.add({"name": "Product 2", "description": "Description", "variants": [{
+            "name": "Variant 1", "height": 10.0, "stock": 100, "price": 10.0,
+            "weight": 0.5, "active_time": active_time}]})
+        importer.flush()
+
+        self.assertEqual(importer.n_pending, 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertTrue(Variant.objects.get(product__name='Product 2').is_active)
+        self.assertFalse(PendingActivation.objects.exists())
+
+    def test_rollback_publishes_nothing(self):
+        with patch("product_service.tasks.activate_variants.apply_async") as mock_apply_async:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.schedule_variants()
+                    raise RuntimeError
+        mock_apply_async.assert_not_called()
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed_publish_is_retried(self):
+        with patch("product_service.tasks.activate_variants.apply_async",
+                   side_effect=[ConnectionError('broker down'), None]) as mock_apply_async:
+            with transaction.atomic():
+                variant, = self.schedule_variants()
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.attempts, message.last_error), (1, 'broker down'))
+
+            now = timezone.now()
+            self.assertEqual(relay_outbox(now), 0)
+            self.assertEqual(relay_outbox(now + timedelta(seconds=3)), 1)
+
+        self.assertEqual(mock_apply_async.call_count, 2)
+        self.assertEqual(mock_apply_async.call_args[1]['args'], [[variant.id]])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_in_memory_broker(self):
+        celery_app.conf.task_always_eager = False
+        # celery reads the broker url from the environment first
+        broker = patch.dict(os.environ, {'CELERY_BROKER_URL': 'memory://'})
+        broker.start()
+        self.addCleanup(broker.stop)
+        # the connection pools of the app are made for the broker url they
+        # were first used with, drop them like celery does after a fork
+        celery_app._after_fork()
+        self.addCleanup(celery_app._after_fork)
+
+        with transaction.atomic():
+            variants = self.schedule_variants(2)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        with celery_app.connection_for_read('memory://') as connection:
+            queue = connection.SimpleQueue(celery_app.conf.task_default_queue)
+            message = queue.get(timeout=1)
+            message.ack()
+            queue.close()
+        self.assertEqual(message.headers['task'], 'product_service.tasks.activate_variants')
+        # one task for the variants due in the same second
+        self.assertEqual(sorted(message.payload[0][0]), [variant.id for variant in variants])
+        self.assertIsNotNone(message.headers['eta'])
+
+
+class ProductExportTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'export'})
+
+        for i in range(5):
+            product = Product.objects.create(
+                name=f'Product {i}', description=f'Description {i}')
+            Variant.objects.bulk_create([
+                Variant(product=product, name=f'Variant {j}', height=10.0, stock=j,
+                        price=10.0, weight=0.5, active_time=timezone.now())
+                for j in range(i)
+            ])
+
+    def export(self, params=None):
+        request = self.factory.get('/api/products/export/', params or {})
+        response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_all_products_with_all_variants(self):
+        with self.settings(EXPORT_PRODUCT_CHUNK_SIZE=2, EXPORT_VARIANT_CHUNK_SIZE=3):
+            products = self.export()
+
+        self.assertEqual([product['name'] for product in products],
+                         [f'Product {i}' for i in range(5)])
+        for i, product in enumerate(products):
+            self.assertEqual([variant['name'] for variant in product['variants']],
+                             [f'Variant {j}' for j in range(i)])
+
+    def test_export_variants_match_list_format(self):
+        products = self.export()
+        queryset = Product.objects.prefetch_related('variants').order_by('id')
+        expected = ProductSerializer(queryset, many=True).data
+        self.assertEqual(products, json.loads(JSONRenderer().render(expected)))
+
+    def test_export_with_created_at_filter(self):
+        Product.objects.filter(name='Product 0').update(
+            created_at=timezone.now() - timedelta(days=10))
+        created_at_gte = (datetime.now() - timedelta(days=2)).strftime('%d-%m-%Y')
+        products = self.export({'created_at_gte': created_at_gte})
+        self.assertEqual(len(products), 4)
+
+    def test_export_changed_since(self):
+        changed_since = timezone.now()
+        Product.objects.update(updated_at=changed_since - timedelta(hours=1))
+        Variant.objects.update(updated_at=changed_since - timedelta(hours=1))
+        variant = Variant.objects.get(product__name='Product 3', name='Variant 1')
+        Variant.objects.filter(id=variant.id).update(is_active=False)
+        activate_variants([variant.id])
+        Product.objects.create(name='Product 5', description='Description 5')
+
+        products = self.export({'changed_since': changed_since.isoformat()})
+        self.assertEqual([product['name'] for product in products],
+                         ['Product 3', 'Product 5'])
+
+    def test_export_with_invalid_changed_since(self):
+        request = self.factory.get(
+            '/api/products/export/', {'changed_since': 'yesterday'})
+        response = self.view(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'failed')
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_products', stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[4])['name'], 'Product 4')
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class BenchmarkSuiteTest(TestCase):
+    def test_run_suite(self):
+        results = run_suite(
+            n_product=15, n_variant=3, depths=(0, 1), variant_limits=(2,),
+            create_variant_counts=(1, 10), n_create=1, repeat=1,
+            concurrency_levels=(), render_page_sizes=(10,),
+            bulk_update_row_counts=(10, 150))
+
+        self.assertEqual(results['meta']['products'], 15)
+        self.assertEqual(results['results']['list.depth=0.variant_limit=2']['queries'], 3)
+        self.assertEqual(results['results']['list_fast.depth=1.variant_limit=2']['queries'], 3)
+        self.assertIn('create.variants=10', results['results'])
+        self.assertIn('search.variant', results['results'])
+        self.assertIn('rows_per_second', results['results']['bulk_update.rows=150'])
+        self.assertIn('us_per_product', results['results']['serializer.fast'])
+        self.assertLess(results['results']['compress.gzip.products=10']['bytes'],
+                        results['results']['render.fast_json.products=10']['bytes'])
+
+    def test_compare_with_baseline(self):
+        baseline = {'results': {
+            'list': {'ms': 10.0, 'queries': 2},
+            'create': {'ms': 4.0, 'products_per_second': 250.0, 'queries': 5},
+            'removed': {'ms': 1.0},
+        }}
+        results = {'results': {
+            'list': {'ms': 12.0, 'queries': 2},
+            'create': {'ms': 4.0, 'products_per_second': 250.0, 'queries': 5},
+        }}
+        self.assertEqual(compare(results, baseline, 0.25), [])
+
+        results['results']['list'] = {'ms': 13.0, 'queries': 3}
+        results['results']['create']['products_per_second'] = 150.0
+        self.assertEqual(len(compare(results, baseline, 0.25)), 3)
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True)
+class RequestMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        product = Product.objects.create(name='Product 1', description='Description')
+        Variant.objects.create(
+            product=product, name='Variant 1', height=10.0, stock=100, price=10.0,
+            weight=0.5, active_time=timezone.now())
+
+    def test_server_timing_header(self):
+        response = self.client.get('/v1/products/')
+        self.assertEqual(response.status_code, 200)
+        server_timing = response['Server-Timing']
+        self.assertIn('db;desc="3 queries";dur=', server_timing)
+        self.assertIn('serialize;dur=', server_timing)
+        self.assertIn('total;dur=', server_timing)
+
+    def test_metrics_are_aggregated_per_view_action(self):
+        self.client.get('/v1/products/')
+        self.client.get('/v1/products/')
+        self.client.get('/v1/products/export/')
+
+        self.client.force_login(User.objects.create_user(
+            'admin', password='password', is_staff=True))
+        response = self.client.get('/v1/metrics/')
+        self.assertIn('db_pools', response.data)
+        self.assertEqual(response.status_code, 200)
+        views = response.json()['views']
+        self.assertEqual(views['ProductViewSet.list']['count'], 2)
+        self.assertEqual(views['ProductViewSet.list']['queries'], 6)
+        self.assertEqual(sum(views['ProductViewSet.list']['histogram'].values()), 2)
+        self.assertIn('serialize', views['ProductViewSet.list']['timings_ms'])
+        self.assertEqual(views['ProductViewSet.export']['count'], 1)
+        self.assertIn('product_list_cache', response.json())
+
+    def test_metrics_need_an_admin(self):
+        self.assertEqual(self.client.get('/v1/metrics/').status_code, 403)
+        self.client.force_login(User.objects.create_user('user', password='password'))
+        self.assertEqual(self.client.get('/v1/metrics/').status_code, 403)
+
+    def test_routes_outside_v1_are_not_recorded(self):
+        response = self.client.get('/admin/login/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(registry.snapshot(), {})
+
+    @override_settings(REQUEST_METRICS_N_PLUS_ONE_THRESHOLD=3)
+    def test_flags_n_plus_one(self):
+        with self.assertLogs(level='WARNING') as logs:
+            with patch.object(ProductViewSet, 'serialize_list',
+                              lambda view, products: [
+                                  {'name': product.name, 'n_variant': product.variants.count()}
+                                  for product in Product.objects.all()]):
+                for i in range(2, 5):
+                    Product.objects.create(name=f'Product {i}', description='Description')
+                self.client.get('/v1/products/')
+
+        self.assertEqual(registry.snapshot()['ProductViewSet.list']['n_plus_one'], 1)
+        self.assertTrue(any('possible N+1 in ProductViewSet.list' in output
+                            for output in logs.output))
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get('/v1/products/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(registry.snapshot(), {})
+
+
+class SimilarQueriesTest(TestCase):
+    def test_similar_queries(self):
+        queries = [
+            {'sql': 'SELECT * FROM variant WHERE product_id = 1', 'time': '0.001'},
+            {'sql': 'SELECT * FROM variant WHERE product_id = 2', 'time': '0.001'},
+            {'sql': "SELECT * FROM product WHERE name = 'a'", 'time': '0.001'},
+        ]
+        self.assertEqual(similar_queries(queries),
+                         (2, 'SELECT * FROM variant WHERE product_id = ?'))
+        self.assertEqual(similar_queries([]), (0, None))
+
+
+class TimezonesTest(TestCase):
+    def test_to_indonesia_timezone(self):
+        value = datetime(2023, 8, 16, 20, 30, tzinfo=timezone.utc)
+        converted = to_indonesia_timezone(value)
+        self.assertEqual(converted, value)
+        self.assertEqual(converted.isoformat(), '2023-08-17T03:30:00+07:00')
+
+        rows = [{'created_at': value}, {'created_at': value + timedelta(hours=1)}]
+        self.assertIs(to_indonesia_timezone_many(rows), rows)
+        self.assertEqual([row['created_at'].hour for row in rows], [3, 4])
+
+    def test_as_indonesia_time_keeps_the_wall_clock(self):
+        value = as_indonesia_time(datetime(2023, 8, 16, 12, 0, tzinfo=timezone.utc))
+        self.assertEqual(value.isoformat(), '2023-08-16T12:00:00+07:00')
+
+    def test_parse_date(self):
+        value = parse_date('16-08-2023', '23:59:59')
+        self.assertEqual(value.utcoffset(), timedelta(hours=7))
+        with self.assertRaises(ValueError):
+            parse_date('2023-08-16')
+
+    def test_bench_timezones(self):
+        results = bench_timezones(10, repeat=1)
+        self.assertEqual(set(results), {
+            'timezone.from_string', 'timezone.per_value', 'timezone.many'})
+
+
+def run_asgi(application, method, path, body=b'', query_string=b''):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path,
+        'query_string': query_string,
+        'headers': [(b'host', b'localhost'),
+                    (b'content-type', b'application/json')],
+    }
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(application(scope, receive, send))
+    finally:
+        loop.close()
+    return messages
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class AsgiApplicationTest(TransactionTestCase):
+    # the requests run in other threads, so the test data is committed
+
+    def test_create_and_list(self):
+        data = {
+            "name": "Asgi Product",
+            "description": "created through julo.asgi",
+            "variants": [{
+                "name": "Asgi Variant",
+                "height": 10.5,
+                "stock": 100,
+                "price": 15000.99,
+                "weight": 0.75,
+                "active_time": "2023-08-16T12:00:00Z"
+            }]
+        }
+        messages = run_asgi(asgi_application, 'POST', '/v1/products/',
+                            json.dumps(data).encode())
+        self.assertEqual(messages[0]['status'], 201)
+
+        messages = run_asgi(asgi_application, 'GET', '/v1/products/')
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'content-type', b'application/json'), messages[0]['headers'])
+        body = json.loads(b''.join(message.get('body', b'') for message in messages[1:]))
+        self.assertEqual(body['results'][0]['name'], 'Asgi Product')
+        self.assertEqual(body['results'][0]['variants'][0]['name'], 'Asgi Variant')
+
+    @override_settings(EXPORT_PRODUCT_CHUNK_SIZE=1)
+    def test_streamed_export(self):
+        Product.objects.create(name='Product 1', description='description')
+        Product.objects.create(name='Product 2', description='description')
+
+        messages = run_asgi(asgi_application, 'GET', '/v1/products/export/')
+        self.assertEqual(messages[0]['status'], 200)
+        chunks = [message['body'] for message in messages[1:] if message['body']]
+        self.assertEqual(len(chunks), 2)
+        self.assertFalse(messages[-1].get('more_body', False))
+
+    def test_threads_are_bounded(self):
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def wsgi_application(environ, start_response):
+            with lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+            start_response('204 No Content', [])
+            return [environ['QUERY_STRING'].encode()]
+
+        application = WsgiToAsgi(wsgi_application, max_threads=2)
+
+        async def requests():
+            return await asyncio.gather(*(
+                application({'type': 'http', 'method': 'GET', 'path': '/',
+                             'query_string': b'', 'headers': []},
+                            self.receive, self.send) for _ in range(6)))
+
+        self.sent = []
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(requests())
+        finally:
+            loop.close()
+            application.executor.shutdown()
+        self.assertEqual(max(max_running), 2)
+        self.assertEqual([message['status'] for message in self.sent
+                          if message['type'] == 'http.response.start'], [204] * 6)
+
+    async def receive(self):
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def test_bench_concurrency(self):
+        results = bench_concurrency((1, 2), n_request=4, io_wait=0, asgi_threads=1)
+        self.assertEqual(set(results), {
+            'concurrency.wsgi.clients=1.threads=1', 'concurrency.asgi.clients=1.threads=1',
+            'concurrency.wsgi.clients=2.threads=2', 'concurrency.asgi.clients=2.threads=1'})
+
+
+@override_settings(DATABASE_REPLICA='replica')
+class ReadReplicaRouterTest(TestCase):
+    # nothing is replicated between the two test databases, a product is only
+    # listed when the request read from the database it was created in
+    multi_db = True
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.list_view = ProductViewSet.as_view({'get': 'list', 'post': 'create'})
+        self.detail_view = ProductViewSet.as_view({'get': 'retrieve'})
+
+    def create_product(self):
+        data = {
+            "name": "Primary Product",
+            "description": "only on the primary",
+            "variants": [{
+                "name": "Primary Variant",
+                "height": 10.5,
+                "stock": 100,
+                "price": 15000.99,
+                "weight": 0.75,
+                "active_time": "2023-08-16T12:00:00Z"
+            }]
+        }
+        request = self.factory.post(
+            '/v1/products/', json.dumps(data), content_type='application/json')
+        return self.list_view(request)
+
+    def test_writes_go_to_the_primary(self):
+        response = self.create_product()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.using('default').count(), 1)
+        self.assertEqual(Product.objects.using('replica').count(), 0)
+        self.assertEqual(response.cookies[READ_PRIMARY_COOKIE]['max-age'], 10)
+
+    def test_list_and_retrieve_read_from_the_replica(self):
+        self.create_product()
+        product = Product.objects.using('replica').create(
+            name='Replica Product', description='only on the replica')
+        Variant.objects.using('replica').create(
+            product=product, name='Replica Variant', height='1', stock=1,
+            price='1', weight='1', active_time=timezone.now())
+
+        response = self.list_view(self.factory.get('/v1/products/'))
+        self.assertEqual([p['name'] for p in response.data['results']],
+                         ['Replica Product'])
+        self.assertEqual(response.data['results'][0]['variants'][0]['name'],
+                         'Replica Variant')
+
+        response = self.detail_view(
+            self.factory.get(f'/v1/products/{product.id}/'), pk=product.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_reads_from_the_primary_after_a_write(self):
+        self.create_product()
+
+        request = self.factory.get('/v1/products/')
+        request.COOKIES[READ_PRIMARY_COOKIE] = '1'
+        response = self.list_view(request)
+        self.assertEqual([p['name'] for p in response.data['results']],
+                         ['Primary Product'])
+
+    @override_settings(DATABASE_REPLICA='')
+    def test_without_replica(self):
+        response = self.create_product()
+        self.assertNotIn(READ_PRIMARY_COOKIE, response.cookies)
+
+        response = self.list_view(self.factory.get('/v1/products/'))
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+
+class ConnectionPoolTest(TestCase):
+    def test_waits_for_a_released_connection(self):
+        pool = ConnectionPool('test', max_size=1, timeout=1)
+        connection = pool.acquire(object)
+
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire(object)))
+        thread.start()
+        time.sleep(0.05)
+        pool.release(connection)
+        thread.join()
+
+        self.assertIs(acquired[0], connection)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['acquired'], 2)
+        self.assertEqual(stats['waited'], 1)
+        self.assertGreater(stats['wait_ms_max'], 0)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_timeout(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.01)
+        pool.acquire(object)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(object)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_pooled_sqlite_backend_reuses_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(
+                connections['default'].settings_dict,
+                NAME=os.path.join(directory, 'pool.sqlite3'),
+                POOL={'MAX_SIZE': 1, 'TIMEOUT': 1})
+
+            first = PooledSQLiteWrapper(settings_dict, alias='pool_test')
+            first.ensure_connection()
+            raw_connection = first.connection
+            first.close()
+
+            second = PooledSQLiteWrapper(settings_dict, alias='pool_test')
+            with second.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            self.assertIs(second.connection, raw_connection)
+            second.close()
+
+            stats = pool_stats()['pool_test']
+            self.assertEqual((stats['created'], stats['idle']), (1, 1))
+            second.pool.close_idle()
+
+
+@override_settings(PRODUCT_LIST_SUMMARY=True, VARIANT_LIMIT_PER_PRODUCT=2)
+class ProductSummaryTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view({'get': 'list', 'post': 'create'})
+        self.bulk_view = ProductViewSet.as_view({'post': 'bulk_create'})
+
+    def product_data(self, name, prices=(10.0, 15.0, 20.0), is_active=True,
+                     active_time="2023-08-16T12:00:00Z"):
+        return {
+            "name": name,
+            "description": f"Description of {name}",
+            "variants": [{
+                "name": f"Variant {i}",
+                "height": 10.5,
+                "stock": 100,
+                "price": price,
+                "weight": 0.75,
+                "active_time": active_time,
+                "is_active": is_active
+            } for i, price in enumerate(prices)]
+        }
+
+    def post(self, view, data):
+        return view(self.factory.post(
+            '/v1/products/', json.dumps(data), content_type='application/json'))
+
+    def list_results(self):
+        response = self.view(self.factory.get('/v1/products/'))
+        self.assertEqual(response.status_code, 200)
+        return JSONRenderer().render(response.data['results'])
+
+    def test_create_maintains_the_summary(self):
+        self.assertEqual(self.post(self.view, self.product_data('Product 1')).status_code, 201)
+
+        summary = ProductSummary.objects.get(product__name='Product 1')
+        self.assertEqual(summary.variant_count, 3)
+        self.assertEqual((summary.min_price, summary.max_price), (10, 20))
+        self.assertEqual(summary.total_stock, 300)
+        self.assertEqual(len(json.loads(summary.variants)), 2)
+
+    def test_list_is_the_same_as_without_summary(self):
+        self.post(self.view, self.product_data('Product 1'))
+        self.post(self.bulk_view, [self.product_data(f'Product {i}') for i in range(2, 5)])
+
+        # the catalog version and the summary page
+        with self.assertNumQueries(2):
+            results = self.list_results()
+        with self.settings(PRODUCT_LIST_SUMMARY=False):
+            self.assertEqual(results, self.list_results())
+        self.assertEqual(len(json.loads(results)), 4)
+
+    def test_cursor_pages(self):
+        self.post(self.bulk_view, [self.product_data(f'Product {i}', prices=(10.0,))
+                                   for i in range(25)])
+        ProductSummary.objects.update(created_at=timezone.now())
+
+        names = []
+        request = self.factory.get('/v1/products/')
+        while request is not None:
+            response = self.view(request)
+            names.extend(product['name'] for product in response.data['results'])
+            next_url = response.data['next']
+            request = self.factory.get(next_url) if next_url else None
+        self.assertEqual(len(set(names)), 25)
+
+    def test_activation_refreshes_the_summary(self):
+        active_time = (datetime.now(INDONESIA_TIMEZONE) +
+                       timedelta(minutes=10)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.post(self.view, self.product_data(
+            'Product 1', prices=(10.0,), is_active=False, active_time=active_time))
+        variants = json.loads(ProductSummary.objects.get().variants)
+        self.assertFalse(variants[0]['is_active'])
+
+        activate_due_variants(timezone.now() + timedelta(minutes=11))
+        variants = json.loads(ProductSummary.objects.get().variants)
+        self.assertTrue(variants[0]['is_active'])
+
+    def test_admin_delete_refreshes_the_summary(self):
+        self.post(self.view, self.product_data('Product 1'))
+        VariantAdmin(Variant, admin.site).delete_model(
+            None, Variant.objects.get(name='Variant 0'))
+        self.assertEqual(ProductSummary.objects.get().variant_count, 2)
+
+    def test_check_and_rebuild(self):
+        self.post(self.view, self.product_data('Product 1'))
+        Product.objects.create(name='Product 2', description='Description')
+        Variant.objects.filter(name='Variant 0').update(stock=1)
+        self.assertEqual(check_product_summaries(), [
+            (Product.objects.get(name='Product 1').id, 'stale variants, total_stock'),
+            (Product.objects.get(name='Product 2').id, 'missing'),
+        ])
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_product_summaries', stdout=out)
+        call_command('check_product_summaries', fix=True, stdout=out)
+        self.assertEqual(check_product_summaries(), [])
+
+        ProductSummary.objects.all().delete()
+        self.assertEqual(rebuild_product_summaries(), 2)
+        call_command('rebuild_product_summaries', stdout=out)
+        self.assertIn('2 product summaries rebuilt', out.getvalue())
+
+
+class ImportProductsCommandTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        Product.objects.create(name='Existing Product', description='Description')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def import_products(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_products', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def ndjson(self, products):
+        return ''.join(json.dumps(product) + '\n' for product in products)
+
+    def product(self, name, variant_names=('Variant 1', 'Variant 2'),
+                active_time='2023-08-16T12:00:00Z'):
+        return {
+            'name': name,
+            'description': f'Description of {name}',
+            'variants': [{
+                'name': variant_name,
+                'height': 10.5,
+                'stock': 100,
+                'price': 15000.99,
+                'weight': 0.75,
+                'active_time': active_time,
+            } for variant_name in variant_names],
+        }
+
+    def test_import_ndjson(self):
+        future = (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        path = self.write('products.ndjson', self.ndjson([
+            self.product('Product 1'),
+            self.product('Existing Product'),
+            self.product('Product 2', variant_names=('Variant 1', 'Variant 1')),
+            self.product('Product 1'),
+            dict(self.product('Product 3'), variants=[{'name': 'Variant 1', 'price': 'x'}]),
+            self.product('Future Product', variant_names=('Variant 1',), active_time=future),
+        ]) + 'not json\n')
+
+        out, err = self.import_products(path, batch_size=2)
+
+        self.assertIn('2 products with 3 variants imported, '
+                      '1 variants scheduled for activation, 5 products rejected', out)
+        self.assertIn("line 2, product 'Existing Product' rejected", err)
+        self.assertIn("line 7, product None rejected", err)
+        self.assertEqual(Variant.objects.filter(product__name='Product 1').count(), 2)
+        self.assertEqual(PendingActivation.objects.get().variant.product.name,
+                         'Future Product')
+        self.assertFalse(Product.objects.filter(name='Product 2').exists())
+
+    def test_import_csv(self):
+        path = self.write('products.csv', (
+            'name,description,variant_name,height,stock,price,weight,active_time\n'
+            'Product 1,"Multi\nline",Variant 1,10.5,100,15000.99,0.75,2023-08-16T12:00:00Z\n'
+            'Product 1,"Multi\nline",Variant 2,10.5,100,15000.99,0.75,\n'
+            'Product 2,Description,,,,,,\n'
+            'Product 3,Description,Variant 1,10.5,-1,15000.99,0.75,\n'
+        ))
+        out, err = self.import_products(path)
+
+        self.assertIn('2 products with 2 variants imported', out)
+        self.assertIn("line 7, product 'Product 3' rejected", err)
+        self.assertEqual(Product.objects.get(name='Product 1').description, 'Multi\nline')
+        self.assertEqual(Variant.objects.filter(product__name='Product 1').count(), 2)
+        self.assertEqual(Variant.objects.filter(product__name='Product 2').count(), 0)
+
+    def test_resume_from_checkpoint(self):
+        content = self.ndjson([self.product(f'Product {i}') for i in range(3)])
+        path = self.write('products.ndjson', content)
+        checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+        first_line = content.index('\n') + 1
+        with open(checkpoint, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'offset': first_line, 'line': 1,
+                       'products': 1, 'variants': 2, 'rejected': 0, 'done': False}, f)
+
+        out, err = self.import_products(path, checkpoint=checkpoint)
+        self.assertIn('resuming', err)
+        self.assertIn('2 products with 4 variants imported', out)
+        self.assertFalse(Product.objects.filter(name='Product 0').exists())
+
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        self.assertEqual((saved['products'], saved['line'], saved['done']), (3, 3, True))
+
+        out, err = self.import_products(path, checkpoint=checkpoint)
+        self.assertIn('already imported', err)
+
+
+@override_settings(ADMIN_INLINE_VARIANTS=2)
+class CatalogAdminTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.products = [Product.objects.create(name=f'Product {i}', description='Description')
+                         for i in range(3)]
+        for product in self.products:
+            for j in range(3):
+                Variant.objects.create(
+                    product=product, name=f'Variant {j}', height=10.0, stock=100,
+                    price=10.0, weight=0.5, is_active=False, active_time=timezone.now())
+
+    def test_variant_changelist_queries_do_not_grow_with_the_rows(self):
+        # session, user, count, page with the products joined
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/product_service/variant/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 9)
+        self.assertFalse(response.context['cl'].show_full_result_count)
+
+    def test_variant_changelist_keyset_pages(self):
+        ids = list(Variant.objects.order_by('-id').values_list('id', flat=True))
+        with patch.object(VariantAdmin, 'list_per_page', 4):
+            first = self.client.get('/admin/product_service/variant/')
+            cl = first.context['cl']
+            self.assertEqual([variant.id for variant in cl.result_list], ids[:4])
+            self.assertEqual(cl.next_page_url(), f'?after={ids[3]}')
+
+            response = self.client.get(f'/admin/product_service/variant/?after={ids[3]}')
+            self.assertEqual([variant.id for variant in response.context['cl'].result_list],
+                             ids[4:8])
+            self.assertContains(response, 'First')
+
+            # a sorted changelist is paged by number
+            response = self.client.get('/admin/product_service/variant/?o=2&p=1')
+            self.assertFalse(response.context['cl'].keyset)
+            self.assertEqual(len(response.context['cl'].result_list), 4)
+
+    def test_activate_and_deactivate_actions(self):
+        variant = Variant.objects.filter(product=self.products[0]).first()
+        variant.active_time = timezone.now() + timedelta(days=1)
+        schedule_activations([variant])
+        selected = list(Variant.objects.filter(
+            product__in=self.products[:2]).values_list('id', flat=True))
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post('/admin/product_service/variant/?is_active__exact=0', {
+                'action': 'activate_variants', '_selected_action': selected})
+        self.assertEqual(response.status_code, 302)
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE "product_service_variant"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Variant.objects.filter(is_active=True).count(), 6)
+        self.assertFalse(PendingActivation.objects.exists())
+        self.assertGreater(Variant.objects.get(id=variant.id).updated_at, variant.updated_at)
+
+        self.client.post('/admin/product_service/variant/', {
+            'action': 'deactivate_variants', 'select_across': 1,
+            '_selected_action': selected[:1]})
+        self.assertFalse(Variant.objects.filter(is_active=True).exists())
+
+    def test_product_page_pages_its_variants(self):
+        url = f'/admin/product_service/product/{self.products[0].id}/change/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance.name for form in formset], ['Variant 0', 'Variant 1'])
+        self.assertContains(response, 'Variants 1-2 of 3')
+
+        response = self.client.get(f'{url}?variants_page=2')
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance.name for form in formset], ['Variant 2'])
+        self.assertContains(response, 'Previous')
+
+    def test_variant_page_uses_a_raw_id_widget(self):
+        variant = Variant.objects.first()
+        response = self.client.get(f'/admin/product_service/variant/{variant.id}/change/')
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+        self.assertNotContains(response, f'<option value="{self.products[1].id}"')
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.utils import timezone
+
+# Asia/Jakarta (WIB) is UTC+7 all year, a fixed offset is exact and cheaper
+# than a pytz zone. It is built once here instead of on every conversion.
+INDONESIA_TIMEZONE = timezone.get_fixed_timezone(7 * 60)
+
+_astimezone = datetime.astimezone
+
+
+def now():
+    return timezone.now().astimezone(INDONESIA_TIMEZONE)
+
+
+def to_indonesia_timezone(value):
+    """aware datetime to the same instant in Indonesia time"""
+    return _astimezone(value, INDONESIA_TIMEZONE)
+
+
+def to_indonesia_timezone_many(rows, field='created_at'):
+    """convert `field` of every row (dicts) in place, for a whole page of
+    .values() rows at once"""
+    tz = INDONESIA_TIMEZONE
+    for row in rows:
+        row[field] = _astimezone(row[field], tz)
+    return rows
+
+
+def as_indonesia_time(value):
+    """read the wall clock time of value as Indonesia time, whatever
+    timezone value is in"""
+    return value.replace(tzinfo=INDONESIA_TIMEZONE)
+
+
+def parse_date(value, time='00:00:00'):
+    """dd-mm-YYYY date at `time`, read in the server local time like
+    before, as an Indonesia time. Raises ValueError when it's invalid"""
+    naive = datetime.strptime(f'{value}T{time}', '%d-%m-%YT%H:%M:%S')
+    return _astimezone(naive, INDONESIA_TIMEZONE)
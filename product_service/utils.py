@@ -1,9 +1,14 @@
-from datetime import datetime
-from django.utils import timezone
+from .timezones import parse_date
 
 
-def to_indonesia_timezone(utc_time, datetime_format="%Y-%m-%dT%H:%M:%S.%f%z"):
-    indonesia_timezone = timezone.get_fixed_timezone(7 * 60)
-    utc_time = datetime.strptime(utc_time, datetime_format)
-    indonesia_time = utc_time.astimezone(indonesia_timezone)
-    return indonesia_time
+def filter_created_at(queryset, created_at_gte=None, created_at_lte=None):
+    # dates are in dd-mm-YYYY format, raises ValueError when a date is invalid
+    if created_at_gte:
+        queryset = queryset.filter(
+            created_at__gte=parse_date(created_at_gte, '00:00:00'))
+
+    if created_at_lte:
+        queryset = queryset.filter(
+            created_at__lte=parse_date(created_at_lte, '23:59:59'))
+
+    return queryset
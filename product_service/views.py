@@ -1,19 +1,139 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .utils import to_indonesia_timezone
-from .models import Product
+from .bulk_updates import InvalidRows, update_variants
+from .cache import cache_stats, get_cached_list, set_cached_list
+from .catalog import bump_catalog_version
+from .conditional import conditional, detail_validators, list_validators
+from .db.pool import pool_stats
+from .exports import export_products, export_queryset
+from .fast_serializers import PRODUCT_VALUES, serialize_products
+from .filters import VariantFilterSet
+from .fieldsets import (
+    parse_fieldset,
+    product_columns,
+    pruned_serializer,
+    variant_columns)
+from .metrics import registry, timed
+from .summaries import (
+    SUMMARY_VALUES,
+    refresh_product_summaries,
+    serialize_summaries,
+    summary_values)
+from .utils import filter_created_at
+from .models import Product, ProductSummary, StockReservation, Variant
 from .serializers import (
     ProductSerializer,
+    STATUS_FAILED,
+    ProductBulkCreateSerializer,
     STATUS_SUCCESS,
-    ProductLimitVariantsSerializer)
-from .paginations import CustomPagination
+    ProductLimitVariantsSerializer,
+    StockReservationSerializer,
+    VariantUpdateSerializer)
+from .paginations import CustomPagination, ProductSummaryPagination, SearchPagination
+from .renderers import product_renderer_classes
+from .routers import ReplicaReadMixin
+from .search import search_products, search_terms
+from .stock import OutOfStock, ReservationConflict, release_stock, reserve_stock
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.prefetch_related('variants').all()
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
+    renderer_classes = product_renderer_classes()
+    # fields asked for with `fields=`/`expand=`, None renders everything
+    fieldset = None
+
+    def get_queryset(self):
+        fieldset = self.fieldset
+        if self.action == 'list' and settings.PRODUCT_LIST_SUMMARY:
+            # one row per product, variants included, see summaries.py
+            return ProductSummary.objects.values(
+                *(SUMMARY_VALUES if fieldset is None else summary_values(fieldset)))
+        if self.action == 'list' and settings.PRODUCT_LIST_FAST_SERIALIZER:
+            # variants are fetched by serialize_products
+            return Product.objects.values(
+                *(PRODUCT_VALUES if fieldset is None else product_columns(fieldset)))
+        if self.action == 'list':
+            # the list only renders the first VARIANT_LIMIT_PER_PRODUCT
+            # variants, so don't fetch the rest from the database
+            return self.prefetch_variants(Variant.objects.limit_per_product(
+                settings.VARIANT_LIMIT_PER_PRODUCT))
+        if fieldset is not None:
+            return self.prefetch_variants(Variant.objects.all())
+        return super().get_queryset()
+
+    def prefetch_variants(self, variants):
+        fieldset = self.fieldset
+        if fieldset is None:
+            return Product.objects.prefetch_related(
+                Prefetch('variants', queryset=variants))
+        products = Product.objects.only(*product_columns(fieldset))
+        if fieldset.variant_fields is None:
+            return products
+        return products.prefetch_related(Prefetch(
+            'variants', queryset=variants.only(*variant_columns(fieldset))))
+
+    def get_serializer_class(self):
+        serializer_class = super().get_serializer_class()
+        if self.fieldset is None:
+            return serializer_class
+        return pruned_serializer(serializer_class, self.fieldset)
+
+    def parse_fieldset(self, request):
+        """set self.fieldset, returns the error response of invalid fields"""
+        try:
+            self.fieldset = parse_fieldset(request.GET)
+        except ValueError as e:
+            return Response({"status": STATUS_FAILED, "message": str(e)}, status=400)
+
+    def serialize_list(self, products):
+        if settings.PRODUCT_LIST_SUMMARY:
+            return serialize_summaries(
+                products, settings.VARIANT_LIMIT_PER_PRODUCT, self.fieldset)
+        if settings.PRODUCT_LIST_FAST_SERIALIZER:
+            return serialize_products(
+                products, settings.VARIANT_LIMIT_PER_PRODUCT, self.fieldset)
+        return list(self.get_serializer(products, many=True).data)
+
+    def product_key(self):
+        # the product id column of the list queryset
+        return 'product_id' if settings.PRODUCT_LIST_SUMMARY else 'id'
+
+    def products_in_order(self, product_ids):
+        key = self.product_key()
+        products = {
+            product[key] if isinstance(product, dict) else product.id: product
+            for product in self.get_queryset().filter(**{f'{key}__in': product_ids})
+        }
+        # a product deleted since it was ranked is left out
+        return [products[product_id] for product_id in product_ids
+                if product_id in products]
+
+    def search(self, request, page_size):
+        filters = ('created_at_gte', 'created_at_lte') + VariantFilterSet.params
+        if any(request.GET.get(param) for param in filters):
+            message = "search can not be combined with the created_at or variant filters"
+            return Response({"status": STATUS_FAILED, "message": message}, status=400)
+
+        paginator = SearchPagination()
+        product_ids = paginator.paginate_search(
+            partial(search_products, request.GET['search']), request, self)
+        with timed(request, 'serialize'):
+            data = self.serialize_list(self.products_in_order(product_ids))
+        response = paginator.get_paginated_response(data)
+        set_cached_list(request, page_size, response.data)
+        return response
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -27,11 +147,80 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         return Response({"status": STATUS_SUCCESS, "message": message}, status=201)
 
+    @conditional(detail_validators)
+    def retrieve(self, request, *args, **kwargs):
+        error = self.parse_fieldset(request)
+        if error is not None:
+            return error
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        # the summary is deleted with the product
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            bump_catalog_version()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+            refresh_product_summaries([serializer.instance.id])
+            bump_catalog_version()
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        serializer = ProductBulkCreateSerializer(
+            data=request.data, many=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        products = serializer.save()
+
+        n_product = len(products)
+        n_variant = sum(len(product_data['variants'])
+                        for product_data in request.data)
+        products_message = f"{n_product} products"
+        if n_product <= 1:
+            products_message = f"{n_product} product"
+        variants_message = f"{n_variant} variants"
+        if n_variant <= 1:
+            variants_message = f"{n_variant} variant"
+        message = f"success create {products_message} with {variants_message}"
+
+        return Response({"status": STATUS_SUCCESS, "message": message}, status=201)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request, *args, **kwargs):
+        started_at = timezone.now()
+        try:
+            queryset = export_queryset(
+                request.GET.get('created_at_gte', None),
+                request.GET.get('created_at_lte', None),
+                request.GET.get('changed_since', None))
+        except ValueError as e:
+            return Response({"status": STATUS_FAILED, "message": str(e)}, status=400)
+
+        response = StreamingHttpResponse(
+            export_products(queryset), content_type='application/x-ndjson')
+        # pass it as changed_since on the next export to only get the
+        # products changed since this one started
+        response['X-Export-Started-At'] = started_at.isoformat()
+        return response
+
+    @conditional(list_validators)
     def list(self, request, *args, **kwargs):
+        error = self.parse_fieldset(request)
+        if error is not None:
+            return error
+        if settings.PRODUCT_LIST_SUMMARY:
+            self.pagination_class = ProductSummaryPagination
+        page_size = self.paginator.get_page_size(request)
+        cached = get_cached_list(request, page_size)
+        if cached is not None:
+            return Response(cached)
+        if search_terms(request.GET.get('search', '')):
+            return self.search(request, page_size)
+
         queryset = self.filter_queryset(self.get_queryset())
         self.serializer_class = ProductLimitVariantsSerializer
 
-        datetime_format = "%d-%m-%YT%H:%M:%S"
         created_at_gte = request.GET.get('created_at_gte', None)
         created_at_lte = request.GET.get('created_at_lte', None)
 
@@ -40,26 +229,92 @@ class ProductViewSet(viewsets.ModelViewSet):
             "previous": None,
             "results": []
         }
-        if created_at_gte:
-            try:
-                created_at_gte = to_indonesia_timezone(
-                    f'{created_at_gte}T00:00:00', datetime_format)
-                queryset = queryset.filter(created_at__gte=created_at_gte)
-            except ValueError:
-                return Response(empty_result)
-
-        if created_at_lte:
-            try:
-                created_at_lte = to_indonesia_timezone(
-                    f'{created_at_lte}T23:59:59', datetime_format)
-                queryset = queryset.filter(created_at__lte=created_at_lte)
-            except ValueError:
-                return Response(empty_result)
+        try:
+            queryset = filter_created_at(
+                queryset, created_at_gte, created_at_lte)
+        except ValueError:
+            return Response(empty_result)
+        try:
+            variant_filters = VariantFilterSet(request.GET)
+        except ValueError as e:
+            return Response({"status": STATUS_FAILED, "message": str(e)}, status=400)
+        queryset = variant_filters.filter_products(queryset, self.product_key())
 
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            with timed(request, 'serialize'):
+                data = self.serialize_list(page)
+            response = self.get_paginated_response(data)
+            set_cached_list(request, page_size, response.data)
+            return response
+
+        with timed(request, 'serialize'):
+            data = self.serialize_list(queryset)
+        return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    return Response({
+        "views": registry.snapshot(),
+        "product_list_cache": cache_stats(),
+        "db_pools": pool_stats(),
+    })
+
+
+@api_view(['PATCH'])
+def bulk_update_variants(request):
+    serializer = VariantUpdateSerializer(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response({"status": STATUS_FAILED, "message": serializer.errors}, status=400)
+    try:
+        n_updated = update_variants(serializer.validated_data)
+    except InvalidRows as e:
+        return Response({"status": STATUS_FAILED, "message": e.errors}, status=400)
+    variants = f"{n_updated} variants" if n_updated != 1 else f"{n_updated} variant"
+    return Response({"status": STATUS_SUCCESS, "message": f"success update {variants}"})
+
+
+def items_message(action, n_item, n_variant):
+    items = f"{n_item} items" if n_item > 1 else f"{n_item} item"
+    variants = f"{n_variant} variants" if n_variant > 1 else f"{n_variant} variant"
+    return f"success {action} {items} of {variants}"
+
+
+@api_view(['POST'])
+def reserve(request):
+    serializer = StockReservationSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"status": STATUS_FAILED, "message": serializer.errors}, status=400)
+
+    items = [(item['product'], item['variant'], item['quantity'])
+             for item in serializer.validated_data['items']]
+    try:
+        n_item, n_variant, created = reserve_stock(
+            serializer.validated_data['idempotency_key'], items)
+    except ValueError as e:
+        return Response({"status": STATUS_FAILED, "message": str(e)}, status=400)
+    except (OutOfStock, ReservationConflict) as e:
+        return Response({"status": STATUS_FAILED, "message": str(e)}, status=409)
+
+    # a retried request gets the first answer with 200
+    return Response({"status": STATUS_SUCCESS,
+                     "message": items_message('reserve', n_item, n_variant)},
+                    status=201 if created else 200)
+
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+@api_view(['POST'])
+def release(request):
+    key = request.data.get('idempotency_key') if isinstance(request.data, dict) else None
+    if not key:
+        return Response({"status": STATUS_FAILED,
+                         "message": {"idempotency_key": ["This field is required."]}},
+                        status=400)
+    try:
+        n_item, n_variant = release_stock(key)
+    except StockReservation.DoesNotExist:
+        return Response({"status": STATUS_FAILED,
+                         "message": f"reservation '{key}' does not exist"}, status=404)
+    return Response({"status": STATUS_SUCCESS,
+                     "message": items_message('release', n_item, n_variant)})